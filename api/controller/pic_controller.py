@@ -1,11 +1,13 @@
 from flask import Blueprint, request
 
 from api.decorators.api_required import token_required
-from services.pic.pic_service import PicService
+from decorators.upload_decorators import upload_admission_required
+from services.pic.pic_service import PicService, parse_date, parse_date_end
 from services.pic.upload_service import UploadService
 from utils import ResponseFactory
 from utils.basic.logging_utils import get_logger
 from utils.file_utils import check_file
+from utils.ingest_utils import iter_request_files
 
 api_upload_bp = Blueprint('api_upload', __name__, url_prefix='/api/x')
 
@@ -18,6 +20,7 @@ logger = get_logger(__name__)
 # 图片上传
 @api_upload_bp.route('/upload', methods=['POST'])
 @token_required
+@upload_admission_required('single')
 def upload():
 
     # 检查文件是否符合类型
@@ -37,6 +40,58 @@ def upload():
     else:
         return ResponseFactory.error(data=False).to_response()
 
+# 批量上传图片（multipart 的 files 字段，或 tar 请求体）
+@api_upload_bp.route('/uploadBatch', methods=['POST'])
+@token_required
+@upload_admission_required('batch')
+def upload_batch():
+    album_id = request.values.get("albumId", default=None, type=int)
+    result = upload_service.handle_batch_upload(iter_request_files(request), album_id)
+
+    if result.data.get('results', None) is not None:
+        return result.to_response()
+    else:
+        return ResponseFactory.error(data=False).to_response()
+
+# 断点续传: 创建上传会话
+@api_upload_bp.route('/uploadSession', methods=['POST'])
+@token_required
+def create_upload_session():
+    data = request.get_json(silent=True) or {}
+    album_id = data.get("albumId")
+    size = data.get("size")
+    result = upload_service.create_upload_session(data.get("filename", ""),
+                                                  size if isinstance(size, int) else None,
+                                                  album_id if isinstance(album_id, int) else None)
+    return result.to_response()
+
+# 断点续传: 查询已接收的字节数
+@api_upload_bp.route('/uploadSession/<session_id>', methods=['GET'])
+@token_required
+def get_upload_session(session_id):
+    return upload_service.get_upload_session(session_id).to_response()
+
+# 断点续传: 从 Upload-Offset 位置上传一块数据（请求体为原始数据）
+@api_upload_bp.route('/uploadSession/<session_id>', methods=['PUT'])
+@token_required
+@upload_admission_required('chunk')
+def append_upload_session(session_id):
+    offset = request.headers.get("Upload-Offset", default=None, type=int)
+    return upload_service.append_upload_session(session_id, offset, request.stream).to_response()
+
+# 断点续传: 数据接收完成，保存图片
+@api_upload_bp.route('/uploadSession/<session_id>/finalize', methods=['POST'])
+@token_required
+@upload_admission_required('finalize')
+def finalize_upload_session(session_id):
+    return upload_service.finalize_upload_session(session_id).to_response()
+
+# 断点续传: 取消上传
+@api_upload_bp.route('/uploadSession/<session_id>', methods=['DELETE'])
+@token_required
+def cancel_upload_session(session_id):
+    return upload_service.cancel_upload_session(session_id).to_response()
+
 # 获取图片列表
 @api_upload_bp.route('/getPicList', methods=['GET'])
 @token_required
@@ -46,8 +101,15 @@ def get_pic_list():
     album_id = request.args.get("albumId", default=1, type=int)
     order = request.args.get("order", default="newest", type=str)
     keyword = request.args.get("keyword", default="", type=str)
-
-    return pic_service.get_pic_list(page, per_page, album_id, order, keyword).to_response()
+    atlas = request.args.get("atlas", default=0, type=int) == 1
+    taken_from = request.args.get("takenFrom", default=None, type=parse_date)
+    taken_to = request.args.get("takenTo", default=None, type=parse_date_end)
+    min_width = request.args.get("minWidth", default=None, type=int)
+    min_height = request.args.get("minHeight", default=None, type=int)
+    orientation = request.args.get("orientation", default=None, type=str)
+
+    return pic_service.get_pic_list(page, per_page, album_id, order, keyword, atlas,
+                                    taken_from, taken_to, min_width, min_height, orientation).to_response()
 
 
 # 删除图片
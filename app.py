@@ -2,11 +2,25 @@ import os
 import traceback
 from datetime import timedelta
 
-from manager.db_manager import init_database
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from manager.db_manager import init_database, upgrade_database
+from manager.image_worker_manager import init_image_worker
+from manager.phash_index_manager import init_phash_index
+from manager.storage_manager import init_storage
+from manager.thumbnail_cache_manager import init_thumbnail_cache
+from manager.upload_admission_manager import init_upload_admission
+from manager.upload_session_manager import init_upload_sessions
+from manager.variant_cache_manager import init_variant_cache
+from manager.web_asset_manager import init_web_assets
 from utils import app, load_config, ResponseFactory
 from utils.basic.blueprint_utils import init_blueprint
 from utils.basic.jwt_utils import init_jwt_config
 from utils.basic.logging_utils import get_logger
+from utils.http_utils import init_file_offload
+from utils.ingest_utils import init_ingest_limits
+from utils.sign_utils import init_signed_url
+from utils.thumbnail_utils import init_thumbnail_pyramid
 
 logger = get_logger(__name__)
 
@@ -16,24 +30,57 @@ def handle_all_exceptions(error):
     print("\033[91m" + "Error occurred:\n" + error_traceback + "\033[0m")
     return ResponseFactory.error(data=404).to_response()
 
+@app.errorhandler(RequestEntityTooLarge)
+def handle_request_too_large(error):
+    return ResponseFactory.error(data={
+        'message': 'upload.message.fileTooLarge',
+        'messageType': 'error'
+    }, status=413).to_response()
+
 @app.route('/')
 def hello_ying_cang():
     logger.info("访问首页")
     return 'Hello Ying-Cang!'
 
-if __name__ == '__main__':
+def create_app(config: dict = None):
+    """
+    初始化配置、数据库和后台任务，返回 Flask 应用
+    开发时由 python3 app.py 调用，生产环境由 wsgi.py 在每个 gunicorn 进程中调用
+    """
+    if config is None:
+        config = load_config()
+
     init_jwt_config()
     init_blueprint()
 
-    config = load_config()
+    init_file_offload(config["server"])
+    init_signed_url(config["server"])
+    init_variant_cache(config["server"])
+    init_thumbnail_pyramid(config["server"])
+    init_web_assets()
+    init_upload_sessions(config["server"])
+    init_upload_admission(config["server"])
+    init_ingest_limits(config["server"])
+    init_storage(config.get("storage"))
 
     # 如果数据库已配置直接连接
     if config["sql"]["host"] != 'none':
         init_database(config["sql"], 'postgresql')
+        upgrade_database()
+        init_thumbnail_cache(config["server"])
+        init_image_worker(config["server"])
+        init_phash_index(config["server"])
 
     app.config["JWT_SECRET_KEY"] = config["server"]["key"]
     app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(days=config["server"]["tokenTime"])  # 设置为7天后过期
+    return app
+
+if __name__ == '__main__':
+    config = load_config()
+    create_app(config)
 
+    # 开发服务器不提供 wsgi.file_wrapper，图片不经过 sendfile 发送
+    logger.warning("使用开发服务器启动，生产环境请使用: gunicorn -c gunicorn.conf.py wsgi:app")
     app.run(host=config["server"]["host"],
             port=config["server"]["port"],
             debug=config["server"]["debug"])
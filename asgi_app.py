@@ -0,0 +1,493 @@
+"""
+影仓图片分发 ASGI 入口（只读）
+
+只提供 /i、/thumbnail、/atlas、/web 路由，管理接口仍由 app.py 提供
+文件读取和数据库查询在独立的小线程池中执行，事件循环只负责连接，可以同时保持大量下载连接
+
+用法:
+    uvicorn asgi_app:app --host 0.0.0.0 --port 20522
+"""
+import asyncio
+import mimetypes
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import parse_qsl
+
+from werkzeug.datastructures import MultiDict, MIMEAccept
+from werkzeug.http import parse_etags, parse_date, parse_range_header, parse_if_range_header, parse_accept_header, \
+    http_date
+
+from manager.db_manager import init_database
+from manager.atlas_manager import atlas_manager
+from manager.image_worker_manager import has_pending_job, THUMBNAIL_PLACEHOLDER, THUMBNAIL_PLACEHOLDER_HEADERS
+from manager.pic_cache_manager import pic_path_cache
+from manager.storage_manager import storage_manager, init_storage
+from manager.thumbnail_cache_manager import thumbnail_cache, init_thumbnail_cache
+from manager.variant_cache_manager import variant_cache, init_variant_cache, has_variant_args, parse_variant_args
+from manager.web_asset_manager import web_asset_manager
+from utils import load_config
+from utils.basic.logging_utils import get_logger
+from utils.file_utils import get_images_dir, get_web_conf_dir, find_thumbnail_path
+from utils.http_utils import init_file_offload, offload_headers, is_file_offloaded, make_etag, match_etag, is_uuid_etag, resolve_range, \
+    get_accepted_suffixes, negotiate_sibling, IMMUTABLE_CACHE_CONTROL, FILE_CHUNK_SIZE
+from utils.ingest_utils import init_ingest_limits
+from utils.sign_utils import init_signed_url, verify_signature, SIGNED_URL
+from utils.thumbnail_utils import find_pyramid_file, init_thumbnail_pyramid
+
+logger = get_logger(__name__)
+
+IMAGES_DIR = get_images_dir()
+
+# 数据库查询线程池（同时最多占用 4 个数据库连接）和文件读取线程池
+DB_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix='delivery-db')
+FILE_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix='delivery-file')
+
+# 需要校验签名的路由前缀
+SIGNED_PREFIXES = ('/i/', '/thumbnail/', '/atlas/')
+
+# 是否已读取配置；服务器不发送 lifespan 事件时（如 --lifespan off）在第一个请求时初始化
+DELIVERY_STATE = {
+    'ready': False,
+    'lock': None
+}
+
+
+def strip_root_path(path: str, root_path: str) -> str:
+    """ASGI 规范中 scope['path'] 包含 root_path（uvicorn 0.26 起如此），旧服务器不包含，两种情况都只去掉一次"""
+    if root_path and (path == root_path or path.startswith(root_path + '/')):
+        return path[len(root_path):] or '/'
+    return path
+
+
+# 请求类
+class DeliveryRequest:
+    """
+    从 ASGI scope 中解析需要的请求信息
+    path 为去掉 root_path 后的路径，用于路由；root_path + path 为客户端请求的完整路径，用于校验签名
+    """
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.method = scope['method']
+        self.root_path = scope.get('root_path', '').rstrip('/')
+        self.path = strip_root_path(scope['path'], self.root_path)
+        self.args = MultiDict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+        self.headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+
+    def header(self, name: str):
+        return self.headers.get(name)
+
+    @property
+    def accepted_suffixes(self):
+        return get_accepted_suffixes(parse_accept_header(self.header('accept'), MIMEAccept))
+
+
+async def run_in_pool(pool, func, *args):
+    return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+
+
+async def send_response(send, status: int, headers: dict = None, body: bytes = b'', request=None):
+    """发送完整响应"""
+    headers = dict(headers or {})
+    headers.setdefault('Content-Length', str(len(body)))
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(key.encode('latin-1'), str(value).encode('latin-1')) for key, value in headers.items()]
+    })
+    if request is not None and request.method == 'HEAD':
+        body = b''
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_error(send, status: int):
+    await send_response(send, status, {'Content-Type': 'text/plain; charset=utf-8'}, str(status).encode('ascii'))
+
+
+async def send_not_modified(send, request, etag: str, cache_control: str):
+    headers = {'Cache-Control': cache_control, 'Vary': 'Accept'}
+    if etag and etag != '*':
+        headers['ETag'] = f'"{etag}"'
+    await send_response(send, 304, headers, request=request)
+
+
+def get_cache_control(request, default: str):
+    """签名 url 只允许客户端私有缓存到过期时间"""
+    if SIGNED_URL['enabled'] and request.path.startswith(SIGNED_PREFIXES):
+        expires = request.args.get('exp', default=0, type=int)
+        return f"private, max-age={max(expires - int(datetime.now().timestamp()), 0)}"
+    return default
+
+
+async def send_file(send, request, full_path: str, etag_key: str, cache_control: str, extra_headers: dict = None):
+    """
+    异步发送文件，支持单区间 Range
+    服务器支持 http.response.zerocopysend 扩展时使用 sendfile 发送
+    """
+    extra_headers = dict(extra_headers or {})
+
+    # 交给前端代理发送
+    headers = offload_headers(full_path)
+    if headers is not None:
+        headers.update(extra_headers)
+        headers['Cache-Control'] = cache_control
+        await send_response(send, 200, headers, request=request)
+        return
+
+    try:
+        file = await run_in_pool(FILE_POOL, open, full_path, 'rb')
+    except OSError:
+        await send_error(send, 404)
+        return
+
+    try:
+        stat_result = os.fstat(file.fileno())
+        etag = make_etag(etag_key, stat_result)
+        status, start, end = resolve_range(etag, stat_result,
+                                           parse_range_header(request.header('range')),
+                                           parse_if_range_header(request.header('if-range')))
+        if status == 416:
+            await send_response(send, 416, {'Content-Range': f"bytes */{stat_result.st_size}"})
+            return
+
+        length = end - start
+        headers = {
+            'Content-Type': mimetypes.guess_type(full_path)[0] or 'application/octet-stream',
+            'Content-Length': str(length),
+            'Accept-Ranges': 'bytes',
+            'ETag': f'"{etag}"',
+            'Last-Modified': http_date(datetime.fromtimestamp(int(stat_result.st_mtime), tz=timezone.utc)),
+            'Cache-Control': cache_control
+        }
+        if status == 206:
+            headers['Content-Range'] = f"bytes {start}-{end - 1}/{stat_result.st_size}"
+        headers.update(extra_headers)
+
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(key.encode('latin-1'), value.encode('latin-1')) for key, value in headers.items()]
+        })
+
+        if request.method == 'HEAD' or length == 0:
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        if 'http.response.zerocopysend' in request.scope.get('extensions', {}):
+            await send({'type': 'http.response.zerocopysend', 'file': file, 'offset': start, 'count': length})
+            return
+
+        await run_in_pool(FILE_POOL, file.seek, start)
+        remaining = length
+        while remaining > 0:
+            data = await run_in_pool(FILE_POOL, file.read, min(FILE_CHUNK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            await send({'type': 'http.response.body', 'body': data, 'more_body': remaining > 0})
+        if remaining > 0:
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        file.close()
+
+
+async def resolve_pic(file_uuid: str):
+    """先查内存缓存，未命中时在数据库线程池中查询"""
+    hit, entry = pic_path_cache.get_cached(file_uuid)
+    if hit:
+        return entry
+    return await run_in_pool(DB_POOL, pic_path_cache.load, file_uuid)
+
+
+async def serve_file(send, request, filename: str):
+    file_uuid, suffix = os.path.splitext(filename)
+    cache_control = get_cache_control(request, IMMUTABLE_CACHE_CONTROL)
+
+    etag = match_etag(file_uuid, parse_etags(request.header('if-none-match')),
+                      parse_date(request.header('if-modified-since')))
+    if is_uuid_etag(etag):
+        await send_not_modified(send, request, etag, cache_control)
+        return
+
+    entry = await resolve_pic(file_uuid)
+    if entry is None:
+        await send_error(send, 404)
+        return
+    if etag is not None:
+        await send_not_modified(send, request, etag, cache_control)
+        return
+
+    relative_path, pic_suffix = entry
+    target_folder = os.path.join(IMAGES_DIR, relative_path)
+
+    # 本地没有原图（使用远程存储）: 跳转到存储的签名链接，需要变换或不能跳转时先取回本地
+    original_name = file_uuid + pic_suffix
+    if not await run_in_pool(FILE_POOL, os.path.exists, os.path.join(target_folder, original_name)):
+        redirect_url = None if has_variant_args(request.args) else \
+            storage_manager.presign_original(relative_path, original_name)
+        if redirect_url is not None:
+            await send_response(send, 302, {'Location': redirect_url, 'Cache-Control': 'no-store'}, request=request)
+            return
+        if await run_in_pool(FILE_POOL, storage_manager.fetch_original, relative_path, original_name) is None:
+            await send_error(send, 404)
+            return
+
+    # 带有 w/h/fit/fmt/q 参数时返回变换后的图片
+    if has_variant_args(request.args):
+        try:
+            params = parse_variant_args(request.args)
+        except ValueError:
+            await send_error(send, 400)
+            return
+
+        source_path = os.path.join(target_folder, file_uuid + pic_suffix)
+        variant_path = await run_in_pool(FILE_POOL, variant_cache.get_or_create, file_uuid, source_path, params)
+        if variant_path is not None:
+            await send_file(send, request, variant_path, file_uuid, cache_control)
+            return
+
+    send_name, vary_accept = await run_in_pool(FILE_POOL, negotiate_sibling, target_folder,
+                                               file_uuid + pic_suffix, request.accepted_suffixes)
+    await send_file(send, request, os.path.join(target_folder, send_name), file_uuid, cache_control,
+                    {'Vary': 'Accept'} if vary_accept else None)
+
+
+async def serve_thumbnail(send, request, filename: str):
+    file_uuid, suffix = os.path.splitext(filename)
+    cache_control = get_cache_control(request, IMMUTABLE_CACHE_CONTROL)
+
+    etag = match_etag(file_uuid, parse_etags(request.header('if-none-match')),
+                      parse_date(request.header('if-modified-since')))
+    if is_uuid_etag(etag):
+        await send_not_modified(send, request, etag, cache_control)
+        return
+
+    # 文件交给前端代理发送，不经过内存缓存
+    if is_file_offloaded():
+        await send_offloaded_thumbnail(send, request, file_uuid, etag, cache_control)
+        return
+
+    # 优先从内存返回，需要检查文件时在线程池中检查
+    thumbnail = thumbnail_cache.get_fresh(file_uuid)
+    if thumbnail is None:
+        thumbnail = await run_in_pool(FILE_POOL, thumbnail_cache.get, file_uuid)
+    if thumbnail is None:
+        entry = await resolve_pic(file_uuid)
+        if entry is None:
+            await send_error(send, 404)
+            return
+
+        relative_path, pic_suffix = entry
+        thumbnail = await run_in_pool(FILE_POOL, thumbnail_cache.admit, file_uuid,
+                                      find_thumbnail_path(file_uuid + pic_suffix))
+        if thumbnail is None:
+            # 缩略图还在后台生成，返回占位图（分发服务没有进程池，从数据库查询任务）
+            if await run_in_pool(DB_POOL, has_pending_job, file_uuid):
+                await send_response(send, 503, THUMBNAIL_PLACEHOLDER_HEADERS, THUMBNAIL_PLACEHOLDER, request)
+                return
+            await send_error(send, 404)
+            return
+    if etag is not None:
+        await send_not_modified(send, request, etag, cache_control)
+        return
+
+    body, headers = thumbnail.choose(request.accepted_suffixes)
+    headers = dict(headers, **{'Cache-Control': cache_control})
+    await send_response(send, 200, headers, body, request)
+
+
+async def send_offloaded_thumbnail(send, request, file_uuid: str, etag, cache_control: str):
+    """由前端代理发送缩略图文件"""
+    entry = await resolve_pic(file_uuid)
+    if entry is None:
+        await send_error(send, 404)
+        return
+
+    relative_path, pic_suffix = entry
+    thumbnail_path = await run_in_pool(FILE_POOL, find_thumbnail_path, file_uuid + pic_suffix)
+    if thumbnail_path is None:
+        if await run_in_pool(DB_POOL, has_pending_job, file_uuid):
+            await send_response(send, 503, THUMBNAIL_PLACEHOLDER_HEADERS, THUMBNAIL_PLACEHOLDER, request)
+            return
+        await send_error(send, 404)
+        return
+    if etag is not None:
+        await send_not_modified(send, request, etag, cache_control)
+        return
+
+    directory, thumbnail_name = os.path.split(thumbnail_path)
+    send_name, vary_accept = await run_in_pool(FILE_POOL, negotiate_sibling, directory, thumbnail_name,
+                                               request.accepted_suffixes)
+    await send_file(send, request, os.path.join(directory, send_name), file_uuid, cache_control,
+                    {'Vary': 'Accept'} if vary_accept else None)
+
+
+async def serve_thumbnail_size(send, request, size: int, filename: str):
+    file_uuid, suffix = os.path.splitext(filename)
+    cache_control = get_cache_control(request, IMMUTABLE_CACHE_CONTROL)
+
+    etag = match_etag(file_uuid, parse_etags(request.header('if-none-match')),
+                      parse_date(request.header('if-modified-since')))
+    if is_uuid_etag(etag):
+        await send_not_modified(send, request, etag, cache_control)
+        return
+
+    found = await run_in_pool(FILE_POOL, find_pyramid_file, size, filename)
+    if found is None:
+        if await run_in_pool(DB_POOL, has_pending_job, file_uuid):
+            await send_response(send, 503, THUMBNAIL_PLACEHOLDER_HEADERS, THUMBNAIL_PLACEHOLDER, request)
+            return
+        await send_error(send, 404)
+        return
+    if etag is not None:
+        await send_not_modified(send, request, etag, cache_control)
+        return
+
+    await send_file(send, request, os.path.join(*found), file_uuid, cache_control)
+
+
+async def serve_atlas(send, request, filename: str):
+    atlas_name, suffix = os.path.splitext(filename)
+    cache_control = get_cache_control(request, IMMUTABLE_CACHE_CONTROL)
+
+    full_path = os.path.join(atlas_manager.cache_dir, filename)
+    etag = match_etag(atlas_name, parse_etags(request.header('if-none-match')),
+                      parse_date(request.header('if-modified-since')))
+    if is_uuid_etag(etag) or (etag is not None and await run_in_pool(FILE_POOL, os.path.exists, full_path)):
+        await send_not_modified(send, request, etag, cache_control)
+        return
+
+    await send_file(send, request, full_path, atlas_name, cache_control)
+
+
+async def serve_web_file(send, request, filename: str):
+    # 带有当前内容指纹的 url 可以长期缓存，其他 url 每次重新验证
+    filename, immutable = await run_in_pool(FILE_POOL, web_asset_manager.parse, filename)
+    cache_control = IMMUTABLE_CACHE_CONTROL if immutable else 'no-cache'
+
+    full_path = os.path.join(get_web_conf_dir(), filename)
+    extra_headers = {'Vary': 'Accept-Encoding'}
+    accept_encoding = request.header('accept-encoding') or ''
+    if 'gzip' in accept_encoding and await run_in_pool(FILE_POOL, os.path.exists, full_path + '.gz'):
+        extra_headers['Content-Encoding'] = 'gzip'
+        extra_headers['Content-Type'] = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        full_path += '.gz'
+
+    await send_file(send, request, full_path, filename, cache_control, extra_headers)
+
+
+# 路由前缀 -> 处理函数
+ROUTES = {
+    '/i/': serve_file,
+    '/thumbnail/': serve_thumbnail,
+    '/atlas/': serve_atlas,
+    '/web/': serve_web_file
+}
+
+
+def init_delivery():
+    """读取配置并初始化数据库和缓存"""
+    config = load_config()
+    init_file_offload(config["server"])
+    init_signed_url(config["server"])
+    init_variant_cache(config["server"])
+    init_thumbnail_pyramid(config["server"])
+    init_ingest_limits(config["server"])
+    init_storage(config.get("storage"))
+
+    if config["sql"]["host"] != 'none':
+        init_database(config["sql"], 'postgresql')
+        init_thumbnail_cache(config["server"])
+    DELIVERY_STATE['ready'] = True
+    logger.info("图片分发服务启动")
+
+
+async def ensure_delivery() -> bool:
+    """
+    确保已读取配置（包括签名配置）后再处理请求
+    Returns:
+        初始化失败时返回 False，请求直接返回 503，不会在未校验签名的情况下发送图片
+    """
+    if DELIVERY_STATE['ready']:
+        return True
+    if DELIVERY_STATE['lock'] is None:
+        DELIVERY_STATE['lock'] = asyncio.Lock()
+    async with DELIVERY_STATE['lock']:
+        if not DELIVERY_STATE['ready']:
+            try:
+                await run_in_pool(DB_POOL, init_delivery)
+            except Exception as e:
+                logger.error(f"图片分发服务初始化失败: {e}")
+                return False
+    return True
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                init_delivery()
+            except Exception as e:
+                logger.error(f"图片分发服务启动失败: {e}")
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            DB_POOL.shutdown(wait=False)
+            FILE_POOL.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    if not await ensure_delivery():
+        await send_error(send, 503)
+        return
+
+    request = DeliveryRequest(scope)
+    if request.method not in ('GET', 'HEAD'):
+        await send_error(send, 405)
+        return
+
+    for prefix, handler in ROUTES.items():
+        if request.path.startswith(prefix):
+            # scope['path'] 已经解码，不再 unquote
+            filename = request.path[len(prefix):]
+
+            # 多尺寸缩略图: /thumbnail/<尺寸>/<文件名>
+            size = None
+            if prefix == '/thumbnail/' and filename.count('/') == 1:
+                size, filename = filename.split('/')
+                if not size.isdigit():
+                    break
+
+            if not filename or '/' in filename or filename.startswith('.'):
+                break
+
+            # 校验图片 url 签名，不查询数据库
+            if SIGNED_URL['enabled'] and prefix in SIGNED_PREFIXES:
+                if not verify_signature(request.root_path + request.path,
+                                        request.args.get('exp', default=0, type=int),
+                                        request.args.get('sig', default='', type=str)):
+                    await send_error(send, 403)
+                    return
+
+            try:
+                if size is not None:
+                    await serve_thumbnail_size(send, request, int(size), filename)
+                else:
+                    await handler(send, request, filename)
+            except Exception as e:
+                logger.error(f"图片分发失败 {request.path}: {e}")
+                await send_error(send, 500)
+            return
+
+    await send_error(send, 404)
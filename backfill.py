@@ -0,0 +1,478 @@
+"""
+影仓数据回填命令
+
+用法:
+    python3 backfill.py variants [--workers 4] [--batch-size 500]
+    python3 backfill.py dedup [--workers 4] [--batch-size 500]
+    python3 backfill.py pyramid [--workers 4] [--batch-size 500] [--after-pid 0]
+    python3 backfill.py phash [--workers 4] [--batch-size 500]
+    python3 backfill.py exif [--workers 4] [--batch-size 500] [--after-pid 0]
+    python3 backfill.py placeholder [--workers 4] [--batch-size 500]
+    python3 backfill.py dimensions [--workers 4] [--batch-size 2000]
+    python3 backfill.py shard
+    python3 backfill.py storage --to s3 [--from local] [--workers 8] [--batch-size 500] [--evict-local]
+"""
+import argparse
+import hashlib
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from sqlalchemy import func
+
+from manager.db_manager import init_database, upgrade_database, get_session
+from manager.storage_manager import create_storage, get_pic_key, init_storage, StorageError
+from models.pic.pic import Pic
+from utils import load_config
+from utils.basic.logging_utils import get_logger
+from utils.exif_utils import read_exif_from_file
+from utils.file_utils import get_images_dir, generate_modern_siblings, link_file_with_siblings, \
+    find_thumbnail_path, get_thumbnail_root, get_sharded_path
+from utils.ingest_utils import get_dimension_values, parse_pic_size, read_image_size, init_ingest_limits
+from utils.phash_utils import compute_dhash_from_file, to_signed
+from utils.placeholder_utils import compute_placeholder_from_file
+from utils.thumbnail_utils import init_thumbnail_pyramid, get_pyramid_options, generate_pyramid_from_file, \
+    PYRAMID_SIZES
+
+logger = get_logger(__name__)
+
+
+def iter_pic_batches(columns, batch_size: int, after_pid: int = 0):
+    """按 pid 顺序分批读取图片记录"""
+    while True:
+        with get_session() as db:
+            rows = (
+                db.query(Pic.pid, *columns)
+                .filter(Pic.pid > after_pid)
+                .order_by(Pic.pid)
+                .limit(batch_size)
+                .all()
+            )
+        if not rows:
+            return
+        yield rows
+        after_pid = rows[-1].pid
+
+
+def make_siblings(paths: list):
+    """为原图和缩略图生成 avif / webp 副本（子进程中执行）"""
+    generated = 0
+    for path in paths:
+        try:
+            if os.path.exists(path):
+                generated += len(generate_modern_siblings(path))
+        except Exception as e:
+            logger.error(f"生成副本失败 {path}: {e}")
+    return generated
+
+
+# 生成 avif / webp 副本
+def backfill_variants(args):
+    images_dir = get_images_dir()
+    total = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for rows in iter_pic_batches((Pic.uuid, Pic.pic_suffix, Pic.relative_path), args.batch_size):
+            jobs = []
+            for row in rows:
+                filename = row.uuid + row.pic_suffix
+                jobs.append([
+                    os.path.join(images_dir, row.relative_path, filename),
+                    find_thumbnail_path(filename)
+                ])
+            total += sum(executor.map(make_siblings, jobs))
+            logger.info(f"已处理到 pid {rows[-1].pid}，共生成副本 {total} 个")
+
+
+def hash_file(path: str):
+    """计算文件 SHA-256（子进程中执行），文件不存在返回 None"""
+    try:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    except OSError:
+        return None
+
+
+# 合并内容相同的图片文件
+def backfill_dedup(args):
+    images_dir = get_images_dir()
+
+    # 计算缺少的内容哈希，中断后重新执行会跳过已计算的图片
+    hashed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for rows in iter_pic_batches((Pic.uuid, Pic.pic_suffix, Pic.relative_path, Pic.content_hash),
+                                     args.batch_size):
+            rows = [row for row in rows if row.content_hash is None]
+            paths = [os.path.join(images_dir, row.relative_path, row.uuid + row.pic_suffix) for row in rows]
+            digests = list(executor.map(hash_file, paths))
+            with get_session() as db:
+                for row, digest in zip(rows, digests):
+                    if digest is not None:
+                        db.query(Pic).filter(Pic.pid == row.pid).update({Pic.content_hash: digest})
+                        hashed += 1
+            if rows:
+                logger.info(f"已计算到 pid {rows[-1].pid}，共 {hashed} 张")
+
+    # 同一哈希的图片都链接到最早上传的文件
+    with get_session() as db:
+        duplicates = [
+            row.content_hash for row in
+            db.query(Pic.content_hash)
+            .filter(Pic.content_hash.isnot(None))
+            .group_by(Pic.content_hash)
+            .having(func.count(Pic.pid) > 1)
+            .all()
+        ]
+
+    linked = 0
+    saved = 0
+    for content_hash in duplicates:
+        with get_session() as db:
+            rows = (
+                db.query(Pic.uuid, Pic.pic_suffix, Pic.relative_path)
+                .filter(Pic.content_hash == content_hash)
+                .order_by(Pic.pid)
+                .all()
+            )
+
+        canonical = None
+        for row in rows:
+            filename = row.uuid + row.pic_suffix
+            file_path = os.path.join(images_dir, row.relative_path, filename)
+            thumbnail_path = find_thumbnail_path(filename)
+            if not os.path.exists(file_path):
+                continue
+            if canonical is None:
+                canonical = (file_path, thumbnail_path)
+                continue
+
+            try:
+                if not os.path.samefile(canonical[0], file_path):
+                    saved += os.path.getsize(file_path)
+                    link_file_with_siblings(canonical[0], file_path)
+                    linked += 1
+                if os.path.exists(canonical[1]) and not (
+                        os.path.exists(thumbnail_path) and os.path.samefile(canonical[1], thumbnail_path)):
+                    os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+                    link_file_with_siblings(canonical[1], thumbnail_path)
+            except OSError as e:
+                logger.error(f"合并文件失败 {file_path}: {e}")
+
+    logger.info(f"合并重复图片 {linked} 张，节省 {saved / 1024 / 1024:.2f} MB")
+
+
+def make_pyramid(job: tuple):
+    """生成多尺寸缩略图（子进程中执行）"""
+    path, file_uuid, options = job
+    try:
+        if os.path.exists(path):
+            return len(generate_pyramid_from_file(path, file_uuid, options))
+    except Exception as e:
+        logger.error(f"生成多尺寸缩略图失败 {path}: {e}")
+    return 0
+
+
+# 生成多尺寸缩略图
+def backfill_pyramid(args):
+    images_dir = get_images_dir()
+    options = get_pyramid_options()
+    total = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for rows in iter_pic_batches((Pic.uuid, Pic.pic_suffix, Pic.relative_path), args.batch_size,
+                                     args.after_pid):
+            jobs = [(os.path.join(images_dir, row.relative_path, row.uuid + row.pic_suffix), row.uuid, options)
+                    for row in rows]
+            total += sum(executor.map(make_pyramid, jobs))
+            logger.info(f"已处理到 pid {rows[-1].pid}，共生成缩略图 {total} 张")
+
+
+def hash_image(path: str):
+    """计算 dHash（子进程中执行），失败返回 None"""
+    try:
+        if os.path.exists(path):
+            return to_signed(compute_dhash_from_file(path))
+    except Exception as e:
+        logger.error(f"计算感知哈希失败 {path}: {e}")
+    return None
+
+
+# 计算感知哈希
+def backfill_phash(args):
+    images_dir = get_images_dir()
+    total = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for rows in iter_pic_batches((Pic.uuid, Pic.pic_suffix, Pic.relative_path, Pic.dhash), args.batch_size):
+            rows = [row for row in rows if row.dhash is None]
+            paths = [os.path.join(images_dir, row.relative_path, row.uuid + row.pic_suffix) for row in rows]
+            hashes = list(executor.map(hash_image, paths, chunksize=16))
+            with get_session() as db:
+                for row, value in zip(rows, hashes):
+                    if value is not None:
+                        db.query(Pic).filter(Pic.pid == row.pid).update({Pic.dhash: value})
+                        total += 1
+            if rows:
+                logger.info(f"已计算到 pid {rows[-1].pid}，共 {total} 张")
+    logger.info("感知哈希计算完成，重启服务后生效")
+
+
+# 读取拍摄时间、方向、相机型号（只解析文件头，不解码像素）
+def backfill_exif(args):
+    images_dir = get_images_dir()
+    total = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for rows in iter_pic_batches((Pic.uuid, Pic.pic_suffix, Pic.relative_path, Pic.upload_time, Pic.taken_time),
+                                     args.batch_size, args.after_pid):
+            rows = [row for row in rows if row.taken_time is None]
+            paths = [os.path.join(images_dir, row.relative_path, row.uuid + row.pic_suffix) for row in rows]
+            results = list(executor.map(read_exif_from_file, paths, chunksize=32))
+            with get_session() as db:
+                for row, exif in zip(rows, results):
+                    # 没有拍摄时间的图片使用上传时间，与新上传的图片一致
+                    exif['taken_time'] = exif['taken_time'] or row.upload_time
+                    db.query(Pic).filter(Pic.pid == row.pid).update(
+                        {getattr(Pic, key): value for key, value in exif.items()})
+                    total += 1
+            if rows:
+                logger.info(f"已处理到 pid {rows[-1].pid}，共 {total} 张")
+
+
+def make_placeholder(path: str):
+    """计算 BlurHash 和平均颜色（子进程中执行），失败返回 None"""
+    try:
+        if os.path.exists(path):
+            return compute_placeholder_from_file(path)
+    except Exception as e:
+        logger.error(f"计算占位图失败 {path}: {e}")
+    return None
+
+
+# 计算 BlurHash 占位图，优先使用缩略图
+def backfill_placeholder(args):
+    images_dir = get_images_dir()
+    total = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for rows in iter_pic_batches((Pic.uuid, Pic.pic_suffix, Pic.relative_path, Pic.blurhash), args.batch_size):
+            rows = [row for row in rows if row.blurhash is None]
+            paths = []
+            for row in rows:
+                filename = row.uuid + row.pic_suffix
+                thumbnail_path = find_thumbnail_path(filename)
+                paths.append(thumbnail_path if os.path.exists(thumbnail_path)
+                             else os.path.join(images_dir, row.relative_path, filename))
+            results = list(executor.map(make_placeholder, paths, chunksize=32))
+            with get_session() as db:
+                for row, result in zip(rows, results):
+                    if result is not None:
+                        db.query(Pic).filter(Pic.pid == row.pid).update(
+                            {getattr(Pic, key): value for key, value in result.items()})
+                        total += 1
+            if rows:
+                logger.info(f"已计算到 pid {rows[-1].pid}，共 {total} 张")
+
+
+def read_size(path: str):
+    """只解析文件头读取尺寸（子进程中执行），失败返回 (None, None)"""
+    try:
+        if os.path.exists(path):
+            return read_image_size(path)
+    except Exception as e:
+        logger.error(f"读取图片尺寸失败 {path}: {e}")
+    return None, None
+
+
+# 填充整数宽高列，优先解析 pic_size，无法解析时读取文件头；按 EXIF 方向换算，需要先执行 exif
+def backfill_dimensions(args):
+    images_dir = get_images_dir()
+    total = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for rows in iter_pic_batches((Pic.uuid, Pic.pic_suffix, Pic.relative_path, Pic.pic_size, Pic.width,
+                                      Pic.height, Pic.orientation), args.batch_size):
+            sizes = {row.pid: parse_pic_size(row.pic_size) for row in rows}
+
+            unknown = [row for row in rows if sizes[row.pid][0] is None and row.width is None]
+            paths = [os.path.join(images_dir, row.relative_path, row.uuid + row.pic_suffix) for row in unknown]
+            for row, size in zip(unknown, executor.map(read_size, paths)):
+                sizes[row.pid] = size
+
+            with get_session() as db:
+                for row in rows:
+                    width, height = sizes[row.pid]
+                    if width is None:
+                        continue
+                    # 只更新缺少或与方向不一致（旋转前的尺寸）的记录
+                    values = get_dimension_values(width, height, row.orientation)
+                    if (row.width, row.height) != (values['width'], values['height']):
+                        db.query(Pic).filter(Pic.pid == row.pid).update(
+                            {getattr(Pic, key): value for key, value in values.items()})
+                        total += 1
+            if rows:
+                logger.info(f"已处理到 pid {rows[-1].pid}，共 {total} 张")
+
+
+def shard_directory(root: str):
+    """
+    把平铺目录中的文件移动到分片目录（同一文件系统内重命名，不复制内容）
+    服务查找缩略图时同时查找两种位置，迁移过程中不需要停止服务
+    """
+    if not os.path.isdir(root):
+        return 0
+
+    moved = 0
+    with os.scandir(root) as entries:
+        for entry in entries:
+            # 跳过子目录和正在写入的临时文件
+            if not entry.is_file(follow_symlinks=False) or entry.name.endswith(('.tmp', '.link', '.part')):
+                continue
+            target_path = get_sharded_path(root, entry.name)
+            try:
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                if os.path.exists(target_path):
+                    # 分片目录中已有新生成的文件，旧文件直接删除
+                    os.remove(entry.path)
+                else:
+                    os.replace(entry.path, target_path)
+                moved += 1
+            except OSError as e:
+                logger.error(f"移动缩略图失败 {entry.path}: {e}")
+            if moved and moved % 10000 == 0:
+                logger.info(f"{root}: 已移动 {moved} 个文件")
+    return moved
+
+
+# 缩略图目录迁移到分片目录
+def backfill_shard(args):
+    thumbnail_root = get_thumbnail_root()
+    total = shard_directory(thumbnail_root)
+    for size in PYRAMID_SIZES:
+        total += shard_directory(os.path.join(thumbnail_root, str(size)))
+    logger.info(f"缩略图分片迁移完成，共移动 {total} 个文件")
+
+
+# 原图迁移到另一个存储
+def backfill_storage(args):
+    storage_config = dict(load_config().get("storage") or {})
+    try:
+        source = create_storage(dict(storage_config, type=args.source))
+        target = create_storage(dict(storage_config, type=args.target))
+    except StorageError as e:
+        logger.error(e)
+        return
+    if source.name == target.name:
+        logger.error("源存储和目标存储相同")
+        return
+    if args.evict_local and source.remote:
+        logger.error("--evict-local 只能在从本地存储迁移时使用")
+        return
+
+    def copy_original(row):
+        """复制一张原图，目标中已有相同大小的对象时跳过"""
+        key = get_pic_key(row.relative_path, row.uuid + row.pic_suffix)
+        try:
+            source_stat = source.stat(key)
+            if source_stat is None:
+                return 'missing'
+            target_stat = target.stat(key)
+            status = 'skipped'
+            if target_stat is None or target_stat['size'] != source_stat['size']:
+                local_path = source.local_path(key)
+                if local_path is not None:
+                    target.put_file(key, local_path, row.pic_type)
+                else:
+                    with source.open(key) as stream:
+                        target.put_stream(key, stream, row.pic_type)
+                target_stat = target.stat(key)
+                if target_stat is None or target_stat['size'] != source_stat['size']:
+                    logger.error(f"复制后大小不一致 {key}")
+                    return 'failed'
+                status = 'copied'
+            # 确认目标存储中已有完整的原图后才删除本地文件，avif / webp 副本仍由本地发送，保留
+            if args.evict_local:
+                source.delete(key)
+            return status
+        except Exception as e:
+            logger.error(f"复制原图失败 {key}: {e}")
+            return 'failed'
+
+    counts = Counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for rows in iter_pic_batches((Pic.uuid, Pic.pic_suffix, Pic.relative_path, Pic.pic_type), args.batch_size):
+            counts.update(executor.map(copy_original, rows))
+            logger.info(f"已处理到 pid {rows[-1].pid}: {dict(counts)}")
+
+    logger.info(f"原图从 {source.name} 迁移到 {target.name} 完成: 复制 {counts['copied']}，已存在 {counts['skipped']}，"
+                f"源中不存在 {counts['missing']}，失败 {counts['failed']}")
+    if counts['failed'] == 0:
+        logger.info(f"修改 config.yaml 中 storage.type 为 {target.name} 后重启服务")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='影仓数据回填命令')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    variants_parser = subparsers.add_parser('variants', help='为已有图片生成 avif / webp 副本')
+    variants_parser.add_argument('--workers', type=int, default=os.cpu_count())
+    variants_parser.add_argument('--batch-size', type=int, default=500)
+    variants_parser.set_defaults(func=backfill_variants)
+
+    dedup_parser = subparsers.add_parser('dedup', help='计算图片内容哈希并合并重复文件')
+    dedup_parser.add_argument('--workers', type=int, default=os.cpu_count())
+    dedup_parser.add_argument('--batch-size', type=int, default=500)
+    dedup_parser.set_defaults(func=backfill_dedup)
+
+    pyramid_parser = subparsers.add_parser('pyramid', help='为已有图片生成多尺寸缩略图')
+    pyramid_parser.add_argument('--workers', type=int, default=os.cpu_count())
+    pyramid_parser.add_argument('--batch-size', type=int, default=500)
+    pyramid_parser.add_argument('--after-pid', type=int, default=0, help='从该 pid 之后继续')
+    pyramid_parser.set_defaults(func=backfill_pyramid)
+
+    phash_parser = subparsers.add_parser('phash', help='计算已有图片的感知哈希，用于查找近似图片')
+    phash_parser.add_argument('--workers', type=int, default=os.cpu_count())
+    phash_parser.add_argument('--batch-size', type=int, default=500)
+    phash_parser.set_defaults(func=backfill_phash)
+
+    exif_parser = subparsers.add_parser('exif', help='读取已有图片的拍摄时间和相机信息')
+    exif_parser.add_argument('--workers', type=int, default=os.cpu_count())
+    exif_parser.add_argument('--batch-size', type=int, default=500)
+    exif_parser.add_argument('--after-pid', type=int, default=0, help='从该 pid 之后继续')
+    exif_parser.set_defaults(func=backfill_exif)
+
+    placeholder_parser = subparsers.add_parser('placeholder', help='计算已有图片的 BlurHash 占位图和平均颜色')
+    placeholder_parser.add_argument('--workers', type=int, default=os.cpu_count())
+    placeholder_parser.add_argument('--batch-size', type=int, default=500)
+    placeholder_parser.set_defaults(func=backfill_placeholder)
+
+    dimensions_parser = subparsers.add_parser('dimensions', help='填充图片宽高、像素数量和宽高比列，并按 EXIF 方向修正旋转的图片')
+    dimensions_parser.add_argument('--workers', type=int, default=os.cpu_count())
+    dimensions_parser.add_argument('--batch-size', type=int, default=2000)
+    dimensions_parser.set_defaults(func=backfill_dimensions)
+
+    shard_parser = subparsers.add_parser('shard', help='把缩略图从平铺目录迁移到分片目录（可在服务运行时执行）')
+    shard_parser.set_defaults(func=backfill_shard)
+
+    storage_parser = subparsers.add_parser('storage', help='把原图复制到另一个存储，可重复执行，已复制的跳过')
+    storage_parser.add_argument('--from', dest='source', default='local', help='源存储类型: local 或 s3')
+    storage_parser.add_argument('--to', dest='target', required=True, help='目标存储类型: local 或 s3')
+    storage_parser.add_argument('--workers', type=int, default=8, help='并行复制的线程数')
+    storage_parser.add_argument('--batch-size', type=int, default=500)
+    storage_parser.add_argument('--evict-local', action='store_true', help='复制并校验后删除本地原图（保留 avif / webp 副本）')
+    storage_parser.set_defaults(func=backfill_storage)
+
+    args = parser.parse_args()
+
+    config = load_config()
+    if config["sql"]["host"] == 'none':
+        logger.error("数据库未配置，请先完成安装")
+        return
+
+    init_thumbnail_pyramid(config["server"])
+    init_ingest_limits(config["server"])
+    init_storage(config.get("storage"))
+    init_database(config["sql"], 'postgresql')
+    upgrade_database()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+# 让 tests 下的测试可以导入项目模块
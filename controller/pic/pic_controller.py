@@ -4,7 +4,7 @@ from flask import Blueprint, request
 from flask_jwt_extended import jwt_required
 
 from decorators.browser_decorators import browser_only
-from services.pic.pic_service import PicService
+from services.pic.pic_service import PicService, parse_date, parse_date_end
 from utils import ResponseFactory
 from utils.basic.logging_utils import get_logger
 
@@ -30,10 +30,34 @@ def get_pic_list():
     album_id = request.args.get("albumId", default=1, type=int)
     order = request.args.get("order", default="newest", type=str)
     keyword = request.args.get("keyword", default="", type=str)
+    atlas = request.args.get("atlas", default=0, type=int) == 1
+    taken_from = request.args.get("takenFrom", default=None, type=parse_date)
+    taken_to = request.args.get("takenTo", default=None, type=parse_date_end)
+    min_width = request.args.get("minWidth", default=None, type=int)
+    min_height = request.args.get("minHeight", default=None, type=int)
+    orientation = request.args.get("orientation", default=None, type=str)
 
     # 获取响应标头
     logger.warning(f"前端传过来的指是 {page} - {per_page} - {album_id}")
-    return pic_service.get_pic_list(page, per_page, album_id, order, keyword).to_response()
+    return pic_service.get_pic_list(page, per_page, album_id, order, keyword, atlas,
+                                    taken_from, taken_to, min_width, min_height, orientation).to_response()
+
+# 查询近似图片
+@pic_bp.route("/pic/<int:pid>/similar", methods=['GET'])
+@jwt_required()
+@browser_only
+def get_similar_pics(pid):
+    distance = request.args.get("distance", default=None, type=int)
+    return pic_service.get_similar_pics(pid, distance).to_response()
+
+# 近似重复图片分组
+@pic_bp.route("/pic/duplicates", methods=['GET'])
+@jwt_required()
+@browser_only
+def get_duplicate_clusters():
+    page = request.args.get("page", default=1, type=int)
+    per_page = request.args.get("perPage", default=20, type=int)
+    return pic_service.get_duplicate_clusters(max(page, 1), min(max(per_page, 1), 100)).to_response()
 
 # 修改图片信息
 @pic_bp.route('/pic', methods=['PUT'])
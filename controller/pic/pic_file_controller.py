@@ -1,36 +1,100 @@
 
 
-from flask import Blueprint, abort, send_from_directory
+from flask import Blueprint, Response, abort, request, send_from_directory, redirect
+from werkzeug.security import safe_join
+import mimetypes
 import os
-from models.pic.pic import Pic
-from manager.db_manager import get_session
+from manager.atlas_manager import atlas_manager
+from manager.image_worker_manager import image_worker, has_pending_job, THUMBNAIL_PLACEHOLDER, THUMBNAIL_PLACEHOLDER_HEADERS
+from manager.pic_cache_manager import pic_path_cache
+from manager.storage_manager import storage_manager
+from manager.thumbnail_cache_manager import thumbnail_cache
+from manager.variant_cache_manager import variant_cache, has_variant_args, parse_variant_args
+from manager.web_asset_manager import web_asset_manager
+from utils import ResponseFactory
 from utils.basic.logging_utils import get_logger
-from utils.file_utils import get_images_dir, get_app_dir
+from utils.file_utils import get_images_dir, get_app_dir, find_thumbnail_path
+from utils.http_utils import get_matched_etag, is_uuid_etag, not_modified_response, send_immutable_file, offload_response, negotiate_sibling, \
+    is_file_offloaded, get_accepted_suffixes, IMMUTABLE_CACHE_CONTROL, IMMUTABLE_MAX_AGE
+from utils.sign_utils import verify_signed_request, apply_signed_cache_control
+from utils.thumbnail_utils import find_pyramid_file
 
 pic_file_bp = Blueprint('i', __name__)
 
 logger = get_logger(__name__)
 
+IMAGES_DIR = get_images_dir()
+
+# 开启签名后需要校验签名的路由
+SIGNED_ENDPOINTS = {'i.serve_file', 'i.serve_thumbnail', 'i.serve_thumbnail_size', 'i.serve_atlas'}
+
+def is_thumbnail_pending(file_uuid: str) -> bool:
+    """缩略图是否还在等待生成；本进程没有记录时查询数据库，任务可能由其他服务进程登记"""
+    return image_worker.is_pending(file_uuid) or has_pending_job(file_uuid)
+
+# 校验图片 url 签名，不查询数据库
+@pic_file_bp.before_request
+def check_signature():
+    if request.endpoint in SIGNED_ENDPOINTS and not verify_signed_request():
+        logger.error(f"图片 url 签名无效: {request.path}")
+        return ResponseFactory.error(data=403, status=403).to_response()
+
+@pic_file_bp.after_request
+def signed_cache_control(response):
+    if request.endpoint in SIGNED_ENDPOINTS:
+        apply_signed_cache_control(response)
+    return response
+
 # 获取图片 url
 @pic_file_bp.route("/i/<filename>")
 def serve_file(filename):
     # filename 形式: <uuid>.jpg
     file_uuid, suffix = os.path.splitext(filename)
-    with get_session() as db:
-        pic = db.query(Pic).filter(Pic.uuid == file_uuid).first()
-        if not pic:
-            abort(404)
 
-        # 确认路径
-        image_folder = get_images_dir()
-        target_folder = os.path.join(image_folder, pic.relative_path)
-        full_path = os.path.join(str(target_folder), pic.uuid + pic.pic_suffix)
+    # 客户端缓存有效时直接返回 304
+    etag = get_matched_etag(file_uuid)
+    if is_uuid_etag(etag):
+        return not_modified_response(etag)
+
+    entry = pic_path_cache.resolve(file_uuid)
+    if entry is None:
+        abort(404)
+    if etag is not None:
+        return not_modified_response(etag)
+
+    # 确认路径
+    relative_path, pic_suffix = entry
+    target_folder = os.path.join(IMAGES_DIR, relative_path)
 
-        if not os.path.exists(full_path):
+    # 本地没有原图（使用远程存储）: 跳转到存储的签名链接，需要变换或不能跳转时先取回本地
+    if not os.path.exists(os.path.join(target_folder, file_uuid + pic_suffix)):
+        redirect_url = None if has_variant_args(request.args) else \
+            storage_manager.presign_original(relative_path, file_uuid + pic_suffix)
+        if redirect_url is not None:
+            response = redirect(redirect_url, 302)
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+        if storage_manager.fetch_original(relative_path, file_uuid + pic_suffix) is None:
             abort(404)
 
-        logger.info(f"获取 {filename} 图片")
-        return send_from_directory(str(target_folder), pic.uuid + pic.pic_suffix)
+    # 带有 w/h/fit/fmt/q 参数时返回变换后的图片
+    if has_variant_args(request.args):
+        try:
+            params = parse_variant_args(request.args)
+        except ValueError as e:
+            logger.error(f"图片变换参数错误: {e}")
+            abort(400)
+
+        variant_path = variant_cache.get_or_create(file_uuid, os.path.join(target_folder, file_uuid + pic_suffix), params)
+        if variant_path is not None:
+            logger.info(f"获取 {filename} 变换图片")
+            return send_immutable_file(variant_cache.cache_dir, os.path.basename(variant_path), file_uuid)
+
+    # 根据 Accept 选择 avif / webp 副本
+    send_name, vary_accept = negotiate_sibling(target_folder, file_uuid + pic_suffix)
+
+    logger.info(f"获取 {filename} 图片")
+    return send_immutable_file(target_folder, send_name, file_uuid, vary_accept)
 
 # 获取图片路由
 @pic_file_bp.route('/web/<filename>')
@@ -38,25 +102,123 @@ def get_web_file(filename):
     app_folder = get_app_dir()
     target_folder = os.path.join(app_folder, 'web-conf')
     logger.info(f"获取 {filename} 路由")
-    return send_from_directory(target_folder, filename)
+
+    # 带有当前内容指纹的 url 可以长期缓存，其他 url 每次重新验证
+    filename, immutable = web_asset_manager.parse(filename)
+    cache_control = IMMUTABLE_CACHE_CONTROL if immutable else 'no-cache'
+
+    full_path = safe_join(target_folder, filename)
+    if full_path is None:
+        abort(404)
+
+    # 客户端支持 gzip 时发送预压缩文件
+    send_name = filename
+    content_encoding = None
+    if 'gzip' in request.accept_encodings and os.path.exists(full_path + '.gz'):
+        send_name = filename + '.gz'
+        content_encoding = 'gzip'
+
+    # 交给前端代理发送
+    response = offload_response(os.path.join(target_folder, send_name), cache_control)
+    if response is None:
+        response = send_from_directory(target_folder, send_name,
+                                       max_age=IMMUTABLE_MAX_AGE if immutable else None)
+        response.headers['Cache-Control'] = cache_control
+
+    if content_encoding is not None:
+        response.headers['Content-Encoding'] = content_encoding
+        response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response.vary.add('Accept-Encoding')
+    return response
 
 # 获取缩略图 url
 @pic_file_bp.route("/thumbnail/<filename>")
 def serve_thumbnail(filename):
     # filename 形式: <uuid>.jpg
     file_uuid, suffix = os.path.splitext(filename)
-    with get_session() as db:
-        pic = db.query(Pic).filter(Pic.uuid == file_uuid).first()
-        if not pic:
-            abort(404)
 
-        # 确认路径
-        images_folder = get_images_dir()
-        target_folder = os.path.join(images_folder, 'thumbnail')
-        full_path = os.path.join(str(target_folder), pic.uuid + pic.pic_suffix)
+    # 客户端缓存有效时直接返回 304
+    etag = get_matched_etag(file_uuid)
+    if is_uuid_etag(etag):
+        return not_modified_response(etag)
+
+    # 文件交给前端代理发送，不经过内存缓存
+    if is_file_offloaded():
+        return send_offloaded_thumbnail(file_uuid, etag)
+
+    # 优先从内存返回，不访问数据库和文件
+    thumbnail = thumbnail_cache.get(file_uuid)
+    if thumbnail is None:
+        entry = pic_path_cache.resolve(file_uuid)
+        if entry is None:
+            abort(404)
 
-        if not os.path.exists(full_path):
+        relative_path, pic_suffix = entry
+        thumbnail = thumbnail_cache.admit(file_uuid, find_thumbnail_path(file_uuid + pic_suffix))
+        if thumbnail is None:
+            # 缩略图还在后台生成，返回占位图
+            if is_thumbnail_pending(file_uuid):
+                return Response(THUMBNAIL_PLACEHOLDER, status=503, headers=THUMBNAIL_PLACEHOLDER_HEADERS)
             abort(404)
+    if etag is not None:
+        return not_modified_response(etag)
+
+    # 根据 Accept 选择 avif / webp 副本
+    body, headers = thumbnail.choose(get_accepted_suffixes())
+
+    logger.info(f"获取 {filename} 缩略图")
+    return Response(body, headers=headers)
+
+def send_offloaded_thumbnail(file_uuid: str, etag):
+    """由前端代理发送缩略图文件"""
+    entry = pic_path_cache.resolve(file_uuid)
+    if entry is None:
+        abort(404)
+
+    relative_path, pic_suffix = entry
+    thumbnail_path = find_thumbnail_path(file_uuid + pic_suffix)
+    if thumbnail_path is None:
+        # 缩略图还在后台生成，返回占位图
+        if is_thumbnail_pending(file_uuid):
+            return Response(THUMBNAIL_PLACEHOLDER, status=503, headers=THUMBNAIL_PLACEHOLDER_HEADERS)
+        abort(404)
+    if etag is not None:
+        return not_modified_response(etag)
+
+    directory, thumbnail_name = os.path.split(thumbnail_path)
+    send_name, vary_accept = negotiate_sibling(directory, thumbnail_name)
+    return send_immutable_file(directory, send_name, file_uuid, vary_accept)
+
+# 获取多尺寸缩略图 url
+@pic_file_bp.route("/thumbnail/<int:size>/<filename>")
+def serve_thumbnail_size(size, filename):
+    # filename 形式: <uuid>.webp，size 为最长边
+    file_uuid, suffix = os.path.splitext(filename)
+
+    etag = get_matched_etag(file_uuid)
+    if is_uuid_etag(etag):
+        return not_modified_response(etag)
+
+    found = find_pyramid_file(size, filename)
+    if found is None:
+        # 缩略图还在后台生成，返回占位图
+        if is_thumbnail_pending(file_uuid):
+            return Response(THUMBNAIL_PLACEHOLDER, status=503, headers=THUMBNAIL_PLACEHOLDER_HEADERS)
+        abort(404)
+    if etag is not None:
+        return not_modified_response(etag)
+
+    return send_immutable_file(found[0], found[1], file_uuid)
+
+# 获取缩略图拼图 url
+@pic_file_bp.route("/atlas/<filename>")
+def serve_atlas(filename):
+    # filename 形式: atlas-<hash>.jpg，内容不会改变
+    atlas_name, suffix = os.path.splitext(filename)
+
+    etag = get_matched_etag(atlas_name)
+    if is_uuid_etag(etag) or (etag is not None and os.path.exists(os.path.join(atlas_manager.cache_dir, filename))):
+        return not_modified_response(etag)
 
-        logger.info(f"获取 {filename} 缩略图")
-        return send_from_directory(str(target_folder), pic.uuid + pic.pic_suffix)
+    logger.info(f"获取 {filename} 缩略图拼图")
+    return send_immutable_file(atlas_manager.cache_dir, filename, atlas_name)
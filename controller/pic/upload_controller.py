@@ -4,9 +4,11 @@ from flask import Blueprint, request
 from flask_jwt_extended import jwt_required
 
 from decorators.browser_decorators import browser_only
+from decorators.upload_decorators import upload_admission_required
 from services.pic.upload_service import UploadService
 from utils.basic.logging_utils import get_logger
 from utils.file_utils import check_file
+from utils.ingest_utils import iter_request_files
 
 upload_bp = Blueprint('/upload', __name__, url_prefix='/api')
 
@@ -18,6 +20,7 @@ logger = get_logger(__name__)
 @upload_bp.route('/upload', methods=['POST'])
 @jwt_required()
 @browser_only
+@upload_admission_required('single')
 def upload():
     # 检查文件是否符合类型
     file_stage = check_file(request.files)
@@ -31,4 +34,60 @@ def upload():
     logger.info(f"上传图片至-相册 ID 为 {album_id} 的相册")
     result = upload_service.handle_upload(file, int(album_id))
 
-    return result.to_response()
\ No newline at end of file
+    return result.to_response()
+
+# 批量上传图片（multipart 的 files 字段，或 tar 请求体）
+@upload_bp.route('/uploadBatch', methods=['POST'])
+@jwt_required()
+@browser_only
+@upload_admission_required('batch')
+def upload_batch():
+    album_id = request.values.get("albumId", default=None, type=int)
+    logger.info(f"批量上传图片至-相册 ID 为 {album_id} 的相册")
+    result = upload_service.handle_batch_upload(iter_request_files(request), album_id)
+
+    return result.to_response()
+
+# 断点续传: 创建上传会话
+@upload_bp.route('/uploadSession', methods=['POST'])
+@jwt_required()
+@browser_only
+def create_upload_session():
+    data = request.get_json(silent=True) or {}
+    album_id = data.get("albumId")
+    size = data.get("size")
+    result = upload_service.create_upload_session(data.get("filename", ""),
+                                                  size if isinstance(size, int) else None,
+                                                  album_id if isinstance(album_id, int) else None)
+    return result.to_response()
+
+# 断点续传: 查询已接收的字节数
+@upload_bp.route('/uploadSession/<session_id>', methods=['GET'])
+@jwt_required()
+@browser_only
+def get_upload_session(session_id):
+    return upload_service.get_upload_session(session_id).to_response()
+
+# 断点续传: 从 Upload-Offset 位置上传一块数据（请求体为原始数据）
+@upload_bp.route('/uploadSession/<session_id>', methods=['PUT'])
+@jwt_required()
+@browser_only
+@upload_admission_required('chunk')
+def append_upload_session(session_id):
+    offset = request.headers.get("Upload-Offset", default=None, type=int)
+    return upload_service.append_upload_session(session_id, offset, request.stream).to_response()
+
+# 断点续传: 数据接收完成，保存图片
+@upload_bp.route('/uploadSession/<session_id>/finalize', methods=['POST'])
+@jwt_required()
+@browser_only
+@upload_admission_required('finalize')
+def finalize_upload_session(session_id):
+    return upload_service.finalize_upload_session(session_id).to_response()
+
+# 断点续传: 取消上传
+@upload_bp.route('/uploadSession/<session_id>', methods=['DELETE'])
+@jwt_required()
+@browser_only
+def cancel_upload_session(session_id):
+    return upload_service.cancel_upload_session(session_id).to_response()
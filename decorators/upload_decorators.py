@@ -0,0 +1,36 @@
+from functools import wraps
+
+from flask import request
+
+from manager.upload_admission_manager import upload_admission, AdmissionRejected
+from utils import ResponseFactory
+from utils.basic.logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+
+# 装饰器，上传准入控制: 请求体大小、剩余空间和并发数量
+def upload_admission_required(kind: str):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            try:
+                # 没有 Content-Length 的请求（分块传输）读取时超过上限返回 413
+                request.max_content_length = upload_admission.limits.get(kind)
+                upload_admission.check(kind, request.content_length)
+                upload_admission.acquire()
+            except AdmissionRejected as e:
+                logger.warning(f"拒绝上传请求 {request.path}: {e.message}")
+                body, status = ResponseFactory.error(data={
+                    'message': e.message,
+                    'messageType': 'error'
+                }, status=e.status).to_response()
+                headers = {'Retry-After': str(e.retry_after)} if e.retry_after else {}
+                return body, status, headers
+
+            try:
+                return f(*args, **kwargs)
+            finally:
+                upload_admission.release()
+        return decorated_function
+    return decorator
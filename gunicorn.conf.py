@@ -0,0 +1,21 @@
+"""
+gunicorn 配置
+监听地址使用 config.yaml 中的 server.host / server.port，进程数和线程数使用 server.webWorkers / server.webThreads
+不使用 preload_app: 每个进程各自连接数据库、启动图片处理进程池和后台线程
+"""
+from utils.config.load_config import load_config
+
+# 默认 2 个进程，每个进程 8 个线程
+DEFAULT_WEB_WORKERS = 2
+DEFAULT_WEB_THREADS = 8
+
+server_config = load_config()["server"]
+
+bind = f"{server_config['host']}:{server_config['port']}"
+workers = int(server_config.get('webWorkers', DEFAULT_WEB_WORKERS))
+threads = int(server_config.get('webThreads', DEFAULT_WEB_THREADS))
+worker_class = 'gthread'
+
+# 大文件上传和分块上传可能较慢
+timeout = 120
+graceful_timeout = 30
@@ -0,0 +1,278 @@
+"""
+影仓本地目录导入命令
+
+把服务器上的图片目录导入指定相册，文件命名和存放位置与网页上传一致（按日期存放，uuid 命名）
+
+用法:
+    python3 ingest.py /path/to/photos --album 1 [--workers 4] [--batch-size 200]
+    python3 ingest.py /path/to/inbox --album 1 --watch [--interval 10]
+
+已导入的文件记录在检查点文件中，中断后重新执行会跳过已导入的文件
+"""
+import argparse
+import datetime
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import insert
+from werkzeug.utils import secure_filename
+
+from manager.db_manager import init_database, upgrade_database, get_session
+from manager.storage_manager import storage_manager, init_storage
+from models.pic.album import Album
+from models.pic.pic import Pic
+from services.pic.upload_service import UploadService, get_relative_path, get_file_uuid
+from utils import load_config
+from utils.basic.logging_utils import get_logger
+from utils.file_utils import get_app_dir, get_images_dir, generate_uuid7, allowed_file, \
+    link_file_with_siblings, remove_file_with_siblings, get_thumbnail_path
+from utils.ingest_utils import ingest_stream, generate_derivatives, init_ingest_limits, set_max_pixels, \
+    IngestError, INGEST_LIMITS
+from utils.thumbnail_utils import init_thumbnail_pyramid, get_pyramid_options, link_pyramid
+
+logger = get_logger(__name__)
+
+# 监视模式下修改时间在该秒数内的文件视为仍在写入，下次扫描再导入
+SETTLE_SECONDS = 5
+
+
+# 导入检查点
+class Checkpoint:
+    """每行一个已导入文件（相对导入目录的路径），每批提交后追加"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                self.done = {line.rstrip('\n') for line in file if line.strip()}
+
+    def record(self, names: list):
+        if not names:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.writelines(name + '\n' for name in names)
+            file.flush()
+            os.fsync(file.fileno())
+        self.done.update(names)
+
+
+def get_checkpoint_path(source_dir: str):
+    """每个导入目录一个检查点文件"""
+    key = hashlib.sha1(os.path.abspath(source_dir).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(get_app_dir(), 'upload', 'ingest', key + '.txt')
+
+
+def scan_directory(source_dir: str, checkpoint: Checkpoint, skip: set, settle: int = 0):
+    """
+    列出未导入的图片，按路径排序
+    Returns:
+        相对导入目录的路径列表
+    """
+    settled_before = time.time() - settle
+    names = []
+    for root, dirs, files in os.walk(source_dir):
+        dirs[:] = sorted(name for name in dirs if not name.startswith('.'))
+        for filename in files:
+            if filename.startswith('.') or not allowed_file(filename):
+                continue
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, source_dir)
+            if name in checkpoint.done or name in skip:
+                continue
+            try:
+                if settle and os.path.getmtime(path) > settled_before:
+                    continue
+            except OSError:
+                continue
+            names.append(name)
+    names.sort()
+    return names
+
+
+def ingest_file(job: tuple):
+    """
+    复制并校验一个文件（子进程中执行）
+    Returns:
+        ingest_stream 的结果，失败时为 {'error': 原因}
+    """
+    source_path, target_path = job
+    try:
+        with open(source_path, 'rb') as stream:
+            return ingest_stream(stream, target_path)
+    except IngestError as e:
+        return {'error': e.message}
+    except OSError as e:
+        return {'error': str(e)}
+
+
+def make_derivatives(job: tuple):
+    """生成缩略图（子进程中执行），失败返回 None"""
+    file_path, thumbnail_path, pyramid = job
+    try:
+        return generate_derivatives(file_path, thumbnail_path, pyramid=pyramid)
+    except Exception as e:
+        logger.error(f"生成缩略图失败 {file_path}: {e}")
+        return None
+
+
+def ingest_batch(executor, source_dir: str, names: list, album_id: int, checkpoint: Checkpoint, failed: set):
+    """
+    导入一批文件: 并行复制校验 -> 合并相同内容 -> 一次插入图片记录 -> 并行生成缩略图
+    Returns:
+        成功导入的数量
+    """
+    images_dir = get_images_dir()
+    relative_path = get_relative_path()
+    target_folder = os.path.join(images_dir, relative_path)
+    os.makedirs(target_folder, exist_ok=True)
+
+    jobs = []
+    for name in names:
+        filename = secure_filename(os.path.basename(name))
+        file_uuid = generate_uuid7()
+        file_suffix = os.path.splitext(filename)[1]
+        jobs.append((name, file_uuid, file_suffix, os.path.join(target_folder, file_uuid + file_suffix)))
+
+    accepted = []
+    infos = executor.map(ingest_file, [(os.path.join(source_dir, name), file_path)
+                                       for name, _, _, file_path in jobs])
+    for (name, file_uuid, file_suffix, file_path), img_info in zip(jobs, infos):
+        if 'error' in img_info:
+            logger.error(f"导入失败 {name}: {img_info['error']}")
+            failed.add(name)
+            continue
+        accepted.append((name, file_uuid, file_suffix, file_path, img_info))
+
+    # 相同内容已存在或本批次内重复时共用文件
+    with get_session() as db:
+        blobs = UploadService.find_existing_blobs(
+            db, {img_info['sha256']: img_info['file_size'] for *_, img_info in accepted})
+
+    linked_thumbnails = {}
+    derived = {}
+    for name, file_uuid, file_suffix, file_path, img_info in accepted:
+        blob = blobs.get(img_info['sha256'])
+        try:
+            if blob is None:
+                blobs[img_info['sha256']] = (file_path, None, {})
+                continue
+            link_file_with_siblings(blob[0], file_path)
+            if blob[1] is not None:
+                linked_thumbnails[file_uuid] = (blob[1], file_uuid + file_suffix)
+                derived[file_uuid] = blob[2]
+        except OSError as e:
+            logger.error(f"共用文件失败 {file_path}: {e}")
+
+    now = datetime.datetime.now()
+    pic_rows = [
+        UploadService.make_pic_row(file_uuid, file_suffix, os.path.basename(name), img_info, album_id,
+                                   relative_path, now, derived.get(file_uuid))
+        for name, file_uuid, file_suffix, file_path, img_info in accepted
+    ]
+    try:
+        with get_session() as db:
+            if pic_rows:
+                db.execute(insert(Pic), pic_rows)
+            db.commit()
+    except Exception as e:
+        logger.error(f"批量保存图片记录失败: {e}")
+        for *_, file_path, _ in accepted:
+            remove_file_with_siblings(file_path)
+        failed.update(names)
+        return 0
+
+    storage_manager.store_originals([(relative_path, os.path.basename(file_path), file_path, img_info['mime'])
+                                     for *_, file_path, img_info in accepted])
+
+    # 记录检查点后再生成缩略图，缩略图失败不影响导入结果（可以用 backfill 补生成）
+    checkpoint.record([name for name in names if name not in failed])
+
+    for file_uuid, (thumbnail, filename) in linked_thumbnails.items():
+        try:
+            link_file_with_siblings(thumbnail, get_thumbnail_path(filename, create=True))
+            link_pyramid(get_file_uuid(thumbnail), file_uuid)
+        except OSError as e:
+            logger.error(f"共用缩略图失败 {filename}: {e}")
+
+    pyramid = get_pyramid_options()
+    derivative_jobs = [
+        (file_uuid, (file_path, get_thumbnail_path(os.path.basename(file_path), create=True), pyramid))
+        for _, file_uuid, _, file_path, _ in accepted if file_uuid not in linked_thumbnails
+    ]
+    results = executor.map(make_derivatives, [job for _, job in derivative_jobs])
+    with get_session() as db:
+        for (file_uuid, _), result in zip(derivative_jobs, results):
+            if result:
+                db.query(Pic).filter(Pic.uuid == file_uuid).update(
+                    {getattr(Pic, key): value for key, value in result.items()})
+
+    return len(accepted)
+
+
+def run(args):
+    source_dir = os.path.abspath(args.source)
+    if not os.path.isdir(source_dir):
+        logger.error(f"目录不存在: {source_dir}")
+        return
+
+    with get_session() as db:
+        if db.query(Album.aid).filter(Album.aid == (1 if args.album == 0 else args.album)).first() is None:
+            logger.error(f"相册不存在: {args.album}")
+            return
+
+    checkpoint = Checkpoint(args.checkpoint or get_checkpoint_path(source_dir))
+    logger.info(f"导入 {source_dir} 到相册 {args.album}，已导入 {len(checkpoint.done)} 个，检查点 {checkpoint.path}")
+
+    failed = set()
+    total = 0
+    started = time.monotonic()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=set_max_pixels,
+                             initargs=(INGEST_LIMITS['max_pixels'],)) as executor:
+        while True:
+            names = scan_directory(source_dir, checkpoint, failed, SETTLE_SECONDS if args.watch else 0)
+            for index in range(0, len(names), args.batch_size):
+                total += ingest_batch(executor, source_dir, names[index:index + args.batch_size], args.album,
+                                      checkpoint, failed)
+                elapsed = time.monotonic() - started
+                logger.info(f"已导入 {total} 张，失败 {len(failed)} 个，{total / max(elapsed, 0.001):.1f} 张/秒")
+
+            if not args.watch:
+                break
+            time.sleep(args.interval)
+
+    logger.info(f"导入完成: {total} 张，失败 {len(failed)} 个，重启服务后近似图片索引生效")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='影仓本地目录导入命令')
+    parser.add_argument('source', help='图片目录')
+    parser.add_argument('--album', type=int, required=True, help='相册 ID，0 为最爱')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--checkpoint', default=None, help='检查点文件，默认按目录存放在 upload/ingest 下')
+    parser.add_argument('--watch', action='store_true', help='导入后继续监视目录中的新文件')
+    parser.add_argument('--interval', type=int, default=10, help='监视模式扫描间隔（秒）')
+    args = parser.parse_args()
+
+    config = load_config()
+    if config["sql"]["host"] == 'none':
+        logger.error("数据库未配置，请先完成安装")
+        return
+
+    init_thumbnail_pyramid(config["server"])
+    init_ingest_limits(config["server"])
+    init_storage(config.get("storage"))
+    init_database(config["sql"], 'postgresql')
+    upgrade_database()
+    try:
+        run(args)
+    except KeyboardInterrupt:
+        logger.info("导入已中断，重新执行会从检查点继续")
+
+
+if __name__ == '__main__':
+    main()
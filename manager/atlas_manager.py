@@ -0,0 +1,130 @@
+import hashlib
+import json
+import math
+import os
+import threading
+
+from PIL import Image
+
+from utils.basic.logging_utils import get_logger
+from utils.file_utils import get_app_dir, find_thumbnail_path
+
+logger = get_logger(__name__)
+
+# 缩略图最大为 250 x 250，每行最多 6 张
+ATLAS_CELL_SIZE = 250
+ATLAS_COLUMNS = 6
+ATLAS_QUALITY = 80
+
+# 一张拼图最多的缩略图数量（6 x 17 行约 1500 x 4250 像素），超过时不生成拼图
+ATLAS_MAX_TILES = 100
+
+# 最多保留的拼图数量
+ATLAS_MAX_FILES = 1000
+
+
+# 缩略图拼图类
+class AtlasManager:
+    """
+    把一页缩略图拼成一张图片，并记录每张缩略图在拼图中的位置
+    拼图文件名由 (相册, 排序, 页码, 每页数量, 关键字, 版本) 计算，版本为该页所有图片 uuid 的哈希，
+    图片有变化时文件名随之改变，所以拼图内容不会改变
+    """
+
+    def __init__(self):
+        self.cache_dir = os.path.join(get_app_dir(), 'cache', 'atlas')
+        self._lock = threading.Lock()
+        self._building = {}
+
+    @staticmethod
+    def make_name(album_id: int, order: str, page: int, per_page: int, keyword: str, thumbnails: list):
+        """计算拼图文件名（不含后缀）"""
+        version = hashlib.sha1('|'.join(name for name, _ in thumbnails).encode('utf-8')).hexdigest()
+        key = f"{album_id}|{order}|{page}|{per_page}|{keyword}|{version}"
+        return 'atlas-' + hashlib.sha1(key.encode('utf-8')).hexdigest()[:24]
+
+    def get_or_create(self, name: str, thumbnails: list):
+        """
+        获取拼图，不存在时生成
+        Args:
+            name: 拼图文件名（不含后缀）
+            thumbnails: [(缩略图文件名, uuid)]
+        Returns:
+            {'filename', 'width', 'height', 'tiles': {uuid: [x, y, w, h]}}，生成失败或数量超过上限返回 None
+        """
+        if len(thumbnails) > ATLAS_MAX_TILES:
+            return None
+
+        meta_path = os.path.join(self.cache_dir, name + '.json')
+
+        # 同一张拼图同时只生成一次
+        with self._lock:
+            lock = self._building.setdefault(name, threading.Lock())
+
+        with lock:
+            try:
+                if os.path.exists(meta_path):
+                    with open(meta_path, 'r', encoding='utf-8') as file:
+                        return json.load(file)
+                return self._build(name, thumbnails)
+            except Exception as e:
+                logger.error(f"生成缩略图拼图失败 {name}: {e}")
+                return None
+            finally:
+                with self._lock:
+                    self._building.pop(name, None)
+
+    def _build(self, name: str, thumbnails: list):
+        """拼接缩略图"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        count = max(len(thumbnails), 1)
+        columns = min(count, ATLAS_COLUMNS)
+        rows = math.ceil(count / columns)
+        atlas = Image.new('RGB', (columns * ATLAS_CELL_SIZE, rows * ATLAS_CELL_SIZE), (255, 255, 255))
+
+        tiles = {}
+        for index, (thumbnail_name, file_uuid) in enumerate(thumbnails):
+            x = (index % columns) * ATLAS_CELL_SIZE
+            y = (index // columns) * ATLAS_CELL_SIZE
+            try:
+                with Image.open(find_thumbnail_path(thumbnail_name)) as thumbnail:
+                    thumbnail.thumbnail((ATLAS_CELL_SIZE, ATLAS_CELL_SIZE))
+                    tile = thumbnail.convert('RGBA')
+                    atlas.paste(tile, (x, y), tile)
+                    tiles[file_uuid] = [x, y, tile.width, tile.height]
+            except OSError as e:
+                logger.warning(f"拼图跳过缩略图 {thumbnail_name}: {e}")
+
+        filename = name + '.jpg'
+        temp_path = os.path.join(self.cache_dir, filename + '.tmp')
+        atlas.save(temp_path, format='JPEG', quality=ATLAS_QUALITY, optimize=True)
+        os.replace(temp_path, os.path.join(self.cache_dir, filename))
+
+        meta = {'filename': filename, 'width': atlas.width, 'height': atlas.height, 'tiles': tiles}
+        temp_path = os.path.join(self.cache_dir, name + '.json.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(meta, file)
+        os.replace(temp_path, os.path.join(self.cache_dir, name + '.json'))
+
+        logger.info(f"生成缩略图拼图 {filename}，共 {len(tiles)} 张")
+        self._prune()
+        return meta
+
+    def _prune(self):
+        """拼图数量超过上限时删除最久未修改的拼图"""
+        entries = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith('.json')]
+        if len(entries) <= ATLAS_MAX_FILES:
+            return
+
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - ATLAS_MAX_FILES]:
+            stem = entry.name[:-len('.json')]
+            for path in (entry.path, os.path.join(self.cache_dir, stem + '.jpg')):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+# 创建全局单例实例
+atlas_manager = AtlasManager()
@@ -1,9 +1,10 @@
 from contextlib import contextmanager
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import scoped_session, sessionmaker
 
 from models.config import ConfigsBase
+from models.image_job import ImageJobBase
 from models.pic.pic import PicBase
 from models.pic.album import AlbumBase
 from models.token import TokenBase
@@ -11,6 +12,9 @@ from utils.basic.logging_utils import get_logger
 
 logger = get_logger(__name__)
 
+# 所有数据表的 Base
+TABLE_BASES = (PicBase, AlbumBase, TokenBase, ConfigsBase, ImageJobBase)
+
 # 数据库管理类
 class DatabaseManager:
     def __init__(self):
@@ -66,12 +70,47 @@ class DatabaseManager:
             AlbumBase.metadata.create_all(bind=self.engine)
             TokenBase.metadata.create_all(bind=self.engine)
             ConfigsBase.metadata.create_all(bind=self.engine)
+            ImageJobBase.metadata.create_all(bind=self.engine)
             logger.info("表创建成功")
             return True
         except Exception as e:
             logger.error(f"表创建失败: {e}")
             return False
 
+    def upgrade_tables(self) -> bool:
+        """补充已存在数据表中缺少的列和索引（create_all 不会修改已存在的表）"""
+        if not self.engine:
+            raise Exception("请先连接数据库")
+
+        try:
+            for base in TABLE_BASES:
+                base.metadata.create_all(bind=self.engine)
+
+            inspector = inspect(self.engine)
+            for base in TABLE_BASES:
+                for table in base.metadata.sorted_tables:
+                    # 补充缺少的列
+                    columns = {column['name'] for column in inspector.get_columns(table.name)}
+                    with self.engine.begin() as conn:
+                        for column in table.columns:
+                            if column.name not in columns:
+                                column_type = column.type.compile(dialect=self.engine.dialect)
+                                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                                logger.info(f"表 {table.name} 新增列 {column.name}")
+
+                    # 补充缺少的索引
+                    indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+                    for index in table.indexes:
+                        if index.name not in indexes:
+                            index.create(bind=self.engine)
+                            logger.info(f"表 {table.name} 新增索引 {index.name}")
+
+            logger.info("表结构升级成功")
+            return True
+        except Exception as e:
+            logger.error(f"表结构升级失败: {e}")
+            return False
+
     def close(self):
         """关闭数据库连接"""
         if self.SessionLocal:
@@ -87,6 +126,10 @@ def init_database(sql_config, db_type: str = 'postgresql') -> bool:
     """初始化数据库连接"""
     return db_manager.connect_database(sql_config, db_type)
 
+def upgrade_database() -> bool:
+    """升级数据库表结构"""
+    return db_manager.upgrade_tables()
+
 @contextmanager
 def get_session():
     """获取数据库会话"""
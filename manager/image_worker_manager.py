@@ -0,0 +1,339 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from manager.db_manager import get_session
+from manager.phash_index_manager import phash_index
+from manager.thumbnail_cache_manager import thumbnail_cache
+from models.image_job import ImageJob, JOB_PENDING, JOB_RUNNING, JOB_FAILED
+from models.pic.pic import Pic
+from utils.basic.logging_utils import get_logger
+from utils.file_utils import get_images_dir, get_thumbnail_path
+from utils.ingest_utils import generate_derivatives, set_max_pixels, INGEST_LIMITS
+from utils.thumbnail_utils import get_pyramid_options
+
+logger = get_logger(__name__)
+
+# 默认 2 个进程，最多 32 个任务排队，其余任务留在数据库中等待调度
+DEFAULT_IMAGE_WORKERS = 2
+DEFAULT_IMAGE_QUEUE = 32
+
+# 重试策略: 最多 5 次，间隔 30 秒起每次翻倍，最长 1 小时
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_DELAY = 30
+JOB_RETRY_MAX_DELAY = 3600
+
+# 调度线程轮询数据库的间隔（秒）
+DISPATCH_INTERVAL = 5
+
+# 任务领取后的租约（秒）: 领取的进程退出后，租约到期的 running 任务由其他进程重新领取
+JOB_LEASE = 1800
+
+# 缩略图生成中时返回的占位图，并建议客户端 2 秒后重试
+THUMBNAIL_RETRY_AFTER = 2
+THUMBNAIL_PLACEHOLDER = (b'<svg xmlns="http://www.w3.org/2000/svg" width="250" height="250" viewBox="0 0 250 250">'
+                         b'<rect width="250" height="250" fill="#e5e7eb"/></svg>')
+THUMBNAIL_PLACEHOLDER_HEADERS = {
+    'Content-Type': 'image/svg+xml',
+    'Cache-Control': 'no-store',
+    'Retry-After': str(THUMBNAIL_RETRY_AFTER)
+}
+
+
+def get_retry_delay(attempts: int) -> int:
+    """第 attempts 次失败后的等待时间"""
+    return min(JOB_RETRY_DELAY * 2 ** (attempts - 1), JOB_RETRY_MAX_DELAY)
+
+
+def save_derivative_results(pic_uuid: str, results: dict, db=None):
+    """
+    把图片处理得到的信息（感知哈希等）写入图片记录，并加入感知哈希索引
+    Args:
+        db: 调用方已有的数据库会话，为 None 时新建会话
+    """
+    if not results:
+        return
+
+    if db is None:
+        with get_session() as db:
+            save_derivative_results(pic_uuid, results, db)
+        return
+
+    pic = db.query(Pic).filter(Pic.uuid == pic_uuid).first()
+    if pic is None:
+        return
+    for key, value in results.items():
+        setattr(pic, key, value)
+    db.commit()
+    phash_index.add(pic.pid, pic.dhash)
+
+
+def has_pending_job(pic_uuid: str) -> bool:
+    """从数据库查询缩略图是否还在等待生成（其他进程使用）"""
+    with get_session() as db:
+        return db.query(ImageJob.jid).filter(
+            ImageJob.pic_uuid == pic_uuid,
+            ImageJob.status.in_((JOB_PENDING, JOB_RUNNING))
+        ).first() is not None
+
+
+# 图片处理进程池类
+class ImageWorker:
+    """
+    缩略图和 avif / webp 副本在独立进程中生成，上传请求只登记任务
+    任务保存在 image_jobs 表中，重启后继续执行；进程池前只允许 workers + queue_size 个任务，
+    超出的任务留在数据库中，由调度线程在有空位时取出
+    多个服务进程共用任务表，每个任务通过条件 UPDATE 领取，只有一个进程执行
+    子进程异常退出（如内存不足被杀）后进程池不可用，提交或取结果时发现后重建进程池，失败的任务按重试策略重新排队
+    """
+
+    def __init__(self):
+        self.workers = DEFAULT_IMAGE_WORKERS
+        self.queue_size = DEFAULT_IMAGE_QUEUE
+        self.images_dir = get_images_dir()
+
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending = set()
+        self._in_flight = set()
+
+        # 统计数据
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+
+    @property
+    def started(self) -> bool:
+        return self._executor is not None
+
+    def start(self, workers: int, queue_size: int):
+        """启动进程池和调度线程"""
+        if self.started:
+            return
+
+        self.workers = max(workers, 1)
+        self.queue_size = max(queue_size, 0)
+
+        # 上次退出时正在执行的任务在租约到期后重新领取，其他进程正在执行的任务不受影响
+        with get_session() as db:
+            pending = db.query(ImageJob.pic_uuid).filter(ImageJob.status.in_((JOB_PENDING, JOB_RUNNING))).all()
+        with self._lock:
+            self._pending.update(row.pic_uuid for row in pending)
+
+        self._executor = self._create_executor()
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        threading.Thread(target=self._dispatch_loop, name='image-worker-dispatch', daemon=True).start()
+        logger.info(f"图片处理进程池启动: {self.workers} 个进程，队列 {self.queue_size}，待处理 {len(pending)} 个任务")
+
+    def _create_executor(self):
+        # 服务进程中有多个线程，使用 spawn 避免 fork 时复制锁
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=set_max_pixels, initargs=(INGEST_LIMITS['max_pixels'],))
+
+    def _rebuild_executor(self, broken):
+        """替换已损坏的进程池，同一个进程池只重建一次"""
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = self._create_executor()
+        broken.shutdown(wait=False, cancel_futures=True)
+        logger.warning("图片处理进程池已损坏，重新创建")
+
+    def enqueue(self, db, pic_uuid: str, relative_path: str, pic_name: str) -> bool:
+        """
+        在上传的数据库会话中登记任务，与图片记录一起提交
+        Returns:
+            进程池未启动时返回 False，由调用方同步生成
+        """
+        if not self.started:
+            return False
+
+        db.add(ImageJob(pic_uuid=pic_uuid, relative_path=relative_path, pic_name=pic_name,
+                        status=JOB_PENDING, attempts=0, next_run_at=datetime.now()))
+        return True
+
+    def enqueue_many(self, db, jobs: list) -> bool:
+        """
+        批量登记任务（一条 INSERT）
+        Args:
+            jobs: [(uuid, 相对路径, 文件名)]
+        """
+        if not self.started:
+            return False
+
+        if jobs:
+            now = datetime.now()
+            db.execute(insert(ImageJob), [
+                {'pic_uuid': pic_uuid, 'relative_path': relative_path, 'pic_name': pic_name,
+                 'status': JOB_PENDING, 'attempts': 0, 'next_run_at': now}
+                for pic_uuid, relative_path, pic_name in jobs
+            ])
+        return True
+
+    def notify(self, *pic_uuids: str):
+        """任务提交后唤醒调度线程"""
+        with self._lock:
+            self._pending.update(pic_uuids)
+        self._wakeup.set()
+
+    def is_pending(self, pic_uuid: str) -> bool:
+        """缩略图是否还在等待生成"""
+        with self._lock:
+            return pic_uuid in self._pending
+
+    def clear(self):
+        """清空待处理记录（导入数据库后调用）"""
+        with self._lock:
+            self._pending.clear()
+
+    def _dispatch_loop(self):
+        while True:
+            self._wakeup.wait(DISPATCH_INTERVAL)
+            self._wakeup.clear()
+            try:
+                self._dispatch()
+            except Exception as e:
+                logger.error(f"图片处理任务调度失败: {e}")
+
+    def _dispatch(self):
+        """取出到期的任务（等待中，或租约已到期的执行中任务）提交到进程池，直到队列占满"""
+        while True:
+            with self._lock:
+                in_flight = list(self._in_flight)
+
+            with get_session() as db:
+                query = db.query(ImageJob.jid, ImageJob.pic_uuid, ImageJob.relative_path, ImageJob.pic_name,
+                                 ImageJob.status).filter(
+                    ImageJob.status.in_((JOB_PENDING, JOB_RUNNING)),
+                    ImageJob.next_run_at <= datetime.now()
+                )
+                if in_flight:
+                    query = query.filter(ImageJob.jid.notin_(in_flight))
+                jobs = query.order_by(ImageJob.next_run_at, ImageJob.jid).limit(self.workers + self.queue_size).all()
+            if not jobs:
+                return
+
+            for job in jobs:
+                if not self._slots.acquire(blocking=False):
+                    return
+                if not self._claim(job.jid, job.status):
+                    # 已被其他进程领取
+                    self._slots.release()
+                    continue
+                self._submit(job.jid, job.pic_uuid, job.relative_path, job.pic_name)
+
+    @staticmethod
+    def _claim(jid: int, status: str) -> bool:
+        """
+        领取任务: 只有状态未变且已到期时才更新为执行中，并把下次执行时间设为租约到期时间
+        多个进程同时领取同一个任务时只有一个更新成功
+        """
+        now = datetime.now()
+        with get_session() as db:
+            claimed = db.query(ImageJob).filter(
+                ImageJob.jid == jid,
+                ImageJob.status == status,
+                ImageJob.next_run_at <= now
+            ).update({ImageJob.status: JOB_RUNNING, ImageJob.next_run_at: now + timedelta(seconds=JOB_LEASE)},
+                     synchronize_session=False)
+            db.commit()
+        return claimed == 1
+
+    def _submit(self, jid: int, pic_uuid: str, relative_path: str, pic_name: str):
+        with self._lock:
+            self._in_flight.add(jid)
+
+        source_path = os.path.join(self.images_dir, relative_path, pic_name)
+        thumbnail_path = get_thumbnail_path(pic_name, create=True)
+        pyramid = get_pyramid_options()
+        executor = self._executor
+        try:
+            future = executor.submit(generate_derivatives, source_path, thumbnail_path, pyramid=pyramid)
+        except BrokenProcessPool:
+            self._rebuild_executor(executor)
+            executor = self._executor
+            try:
+                future = executor.submit(generate_derivatives, source_path, thumbnail_path, pyramid=pyramid)
+            except Exception as e:
+                # 新进程池也无法提交，按失败处理并重新排队
+                future = Future()
+                future.set_exception(e)
+        future.add_done_callback(lambda done: self._finish(jid, pic_uuid, done, executor))
+
+    def _finish(self, jid: int, pic_uuid: str, future, executor=None):
+        """记录任务结果，失败时按重试策略重新排队；进程池损坏时重建"""
+        try:
+            error = future.exception()
+            if isinstance(error, BrokenProcessPool) and executor is not None:
+                self._rebuild_executor(executor)
+            with get_session() as db:
+                job = db.query(ImageJob).filter(ImageJob.jid == jid).first()
+                if job is None:
+                    pass
+                elif error is None or isinstance(error, FileNotFoundError):
+                    # 完成，或者图片已被删除
+                    db.delete(job)
+                elif job.attempts + 1 >= JOB_MAX_ATTEMPTS:
+                    job.attempts += 1
+                    job.status = JOB_FAILED
+                    job.last_error = str(error)[:500]
+                else:
+                    job.attempts += 1
+                    job.status = JOB_PENDING
+                    job.last_error = str(error)[:500]
+                    job.next_run_at = datetime.now() + timedelta(seconds=get_retry_delay(job.attempts))
+
+                done = job is None or job.status != JOB_PENDING
+
+            with self._lock:
+                if done:
+                    self._pending.discard(pic_uuid)
+                if error is None:
+                    self.completed += 1
+                elif done:
+                    self.failed += 1
+                else:
+                    self.retried += 1
+
+            if error is None:
+                thumbnail_cache.invalidate(pic_uuid)
+                save_derivative_results(pic_uuid, future.result())
+            else:
+                logger.error(f"图片处理任务失败 {pic_uuid}: {error}")
+        except Exception as e:
+            logger.error(f"记录图片处理任务结果失败 {pic_uuid}: {e}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(jid)
+            self._slots.release()
+            self._wakeup.set()
+
+    def stats(self):
+        """获取任务统计"""
+        with self._lock:
+            return {
+                'started': self.started,
+                'workers': self.workers,
+                'queueSize': self.queue_size,
+                'pending': len(self._pending),
+                'inFlight': len(self._in_flight),
+                'completed': self.completed,
+                'retried': self.retried,
+                'failed': self.failed
+            }
+
+# 创建全局单例实例
+image_worker = ImageWorker()
+
+
+def init_image_worker(server_config: dict):
+    """读取进程池配置并启动"""
+    image_worker.start(int(server_config.get('imageWorkers', DEFAULT_IMAGE_WORKERS)),
+                       int(server_config.get('imageWorkerQueue', DEFAULT_IMAGE_QUEUE)))
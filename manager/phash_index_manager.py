@@ -0,0 +1,250 @@
+import threading
+import time
+
+from manager.db_manager import get_session
+from models.pic.pic import Pic
+from utils.basic.logging_utils import get_logger
+from utils.phash_utils import to_unsigned, hamming_distance
+
+logger = get_logger(__name__)
+
+# 默认汉明距离不超过 4 视为近似重复
+DEFAULT_NEAR_DUPLICATE_DISTANCE = 4
+MAX_NEAR_DUPLICATE_DISTANCE = 10
+
+
+def split_chunks(bits: int, count: int):
+    """把 bits 位分成 count 段，返回每段的 (偏移, 位数)"""
+    chunks = []
+    offset = 0
+    for index in range(count):
+        width = bits // count + (1 if index < bits % count else 0)
+        chunks.append((offset, width))
+        offset += width
+    return chunks
+
+
+def find_root(parent: dict, pid: int):
+    """并查集查找根节点，同时压缩路径"""
+    root = pid
+    while parent[root] != root:
+        root = parent[root]
+    while parent[pid] != root:
+        parent[pid], pid = root, parent[pid]
+    return root
+
+
+def union_roots(parent: dict, a: int, b: int):
+    """合并两个簇，较小的 pid 作为根"""
+    root_a, root_b = find_root(parent, a), find_root(parent, b)
+    if root_a != root_b:
+        parent[max(root_a, root_b)] = min(root_a, root_b)
+
+
+# 感知哈希索引类
+class PerceptualHashIndex:
+    """
+    dHash 多段索引（Multi-Index Hashing）
+    64 位哈希分成 distance + 1 段，距离不超过 distance 的两个哈希至少有一段完全相同，
+    查询时只比较在任意一段上相同的候选，不需要全表两两比较
+    新增图片时顺便与近似图片合并到同一个簇（并查集），重复簇报告只需分组
+    删除图片后并查集需要重建，重建和分组在锁外对快照进行，不阻塞新增图片
+    """
+
+    def __init__(self, distance: int = DEFAULT_NEAR_DUPLICATE_DISTANCE):
+        self._lock = threading.RLock()
+        self.ready = False
+        # 每次新增、删除递增，用于判断锁外计算期间索引是否变化
+        self._version = 0
+        self._removed_version = 0
+        self._configure(distance)
+
+    def _configure(self, distance: int):
+        self.distance = distance
+        self.chunks = split_chunks(64, distance + 1)
+        self._hashes = {}
+        self._tables = [{} for _ in self.chunks]
+        self._parent = {}
+        self._dirty = False
+        self._report = None
+        self._version += 1
+        self._removed_version = self._version
+
+    def _keys(self, value: int):
+        return [(value >> offset) & ((1 << width) - 1) for offset, width in self.chunks]
+
+    def _candidates(self, value: int):
+        candidates = set()
+        for table, key in zip(self._tables, self._keys(value)):
+            bucket = table.get(key)
+            if bucket:
+                candidates.update(bucket)
+        return candidates
+
+    def add(self, pid: int, value: int):
+        """加入图片（value 为数据库中的有符号值）"""
+        if value is None:
+            return
+        value = to_unsigned(value)
+        with self._lock:
+            if pid in self._hashes:
+                self.remove(pid)
+
+            self._parent[pid] = pid
+            self._union_near(self._parent, pid, value)
+
+            self._hashes[pid] = value
+            for table, key in zip(self._tables, self._keys(value)):
+                table.setdefault(key, set()).add(pid)
+            self._version += 1
+            self._report = None
+
+    def _union_near(self, parent: dict, pid: int, value: int):
+        """把图片与索引中的近似图片合并，需持有锁"""
+        for other in self._candidates(value):
+            if other != pid and hamming_distance(value, self._hashes[other]) <= self.distance:
+                union_roots(parent, pid, other)
+
+    def remove(self, pid: int):
+        """删除图片，簇需要重新计算"""
+        with self._lock:
+            value = self._hashes.pop(pid, None)
+            if value is None:
+                return
+            for table, key in zip(self._tables, self._keys(value)):
+                bucket = table.get(key)
+                if bucket is not None:
+                    bucket.discard(pid)
+                    if not bucket:
+                        del table[key]
+            self._version += 1
+            self._removed_version = self._version
+            self._dirty = True
+            self._report = None
+
+    def query(self, pid: int, distance: int = None):
+        """
+        查询近似图片
+        Returns:
+            [(pid, 距离)]，按距离排序；图片不在索引中返回 None
+        """
+        distance = self.distance if distance is None else min(distance, self.distance)
+        with self._lock:
+            value = self._hashes.get(pid)
+            if value is None:
+                return None
+            result = []
+            for other in self._candidates(value):
+                if other != pid:
+                    other_distance = hamming_distance(value, self._hashes[other])
+                    if other_distance <= distance:
+                        result.append((other, other_distance))
+        result.sort(key=lambda item: (item[1], item[0]))
+        return result
+
+    def clusters(self):
+        """
+        近似重复簇（至少 2 张），按大小降序
+        在锁内只复制快照，有图片删除后在锁外按快照重建并查集，再换回索引
+        """
+        with self._lock:
+            if self._report is not None:
+                return self._report
+            version = self._version
+            dirty = self._dirty
+            hashes = dict(self._hashes)
+            parent = None if dirty else dict(self._parent)
+            chunks, distance = self.chunks, self.distance
+
+        if dirty:
+            parent = build_unions(hashes, chunks, distance)
+
+        groups = {}
+        for pid in hashes:
+            groups.setdefault(find_root(parent, pid), []).append(pid)
+        report = sorted((sorted(group) for group in groups.values() if len(group) > 1),
+                        key=lambda group: (-len(group), group[0]))
+
+        with self._lock:
+            # 快照之后没有删除时换回重建结果，期间新增的图片再合并一次
+            if dirty and self._dirty and self._removed_version <= version:
+                added = [pid for pid in self._hashes if pid not in parent]
+                for pid in added:
+                    parent[pid] = pid
+                for pid in added:
+                    self._union_near(parent, pid, self._hashes[pid])
+                self._parent = parent
+                self._dirty = False
+            if self._version == version:
+                self._report = report
+        return report
+
+    def load(self, distance: int = None):
+        """从数据库加载所有图片的 dHash"""
+        started = time.monotonic()
+        with self._lock:
+            with get_session() as db:
+                rows = db.query(Pic.pid, Pic.dhash).filter(Pic.dhash.isnot(None)).order_by(Pic.pid).all()
+
+            self._configure(self.distance if distance is None else distance)
+            for row in rows:
+                self.add(row.pid, row.dhash)
+            self.ready = True
+        logger.info(f"感知哈希索引加载完成: {len(rows)} 张，用时 {time.monotonic() - started:.2f} 秒")
+
+    def add_by_uuids(self, uuids: list):
+        """按 uuid 从数据库读取并加入索引"""
+        if not uuids:
+            return
+        with get_session() as db:
+            rows = db.query(Pic.pid, Pic.dhash).filter(Pic.uuid.in_(uuids), Pic.dhash.isnot(None)).all()
+        for row in rows:
+            self.add(row.pid, row.dhash)
+
+    def clear(self):
+        with self._lock:
+            self._configure(self.distance)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ready': self.ready,
+                'size': len(self._hashes),
+                'distance': self.distance
+            }
+
+def build_unions(hashes: dict, chunks: list, distance: int):
+    """按快照重建并查集，不访问索引，可以在锁外调用"""
+    tables = [{} for _ in chunks]
+    parent = {}
+    for pid in sorted(hashes):
+        value = hashes[pid]
+        keys = [(value >> offset) & ((1 << width) - 1) for offset, width in chunks]
+        parent[pid] = pid
+        candidates = set()
+        for table, key in zip(tables, keys):
+            bucket = table.get(key)
+            if bucket:
+                candidates.update(bucket)
+            table.setdefault(key, []).append(pid)
+        for other in candidates:
+            if hamming_distance(value, hashes[other]) <= distance:
+                union_roots(parent, pid, other)
+    return parent
+
+# 创建全局单例实例
+phash_index = PerceptualHashIndex()
+
+
+def init_phash_index(server_config: dict):
+    """读取近似距离并在后台加载索引"""
+    distance = int(server_config.get('nearDuplicateDistance', DEFAULT_NEAR_DUPLICATE_DISTANCE))
+    distance = min(max(distance, 0), MAX_NEAR_DUPLICATE_DISTANCE)
+
+    def load():
+        try:
+            phash_index.load(distance)
+        except Exception as e:
+            logger.error(f"感知哈希索引加载失败: {e}")
+
+    threading.Thread(target=load, name='phash-index-load', daemon=True).start()
@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import OrderedDict
+
+from manager.db_manager import get_session
+from models.pic.pic import Pic
+from utils.basic.logging_utils import get_logger
+
+logger = get_logger(__name__)
+
+# 图片路径缓存类
+class PicPathCache:
+    """
+    uuid -> (relative_path, pic_suffix) 的 LRU 缓存
+    查询不到的 uuid 会在 negative_ttl 秒内被记住（负缓存），避免扫描请求反复查询数据库
+    """
+
+    def __init__(self, max_size: int = 20000, negative_size: int = 20000, negative_ttl: int = 30):
+        self.max_size = max_size
+        self.negative_size = negative_size
+        self.negative_ttl = negative_ttl
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._missing = OrderedDict()
+
+        # 统计数据
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+
+    def get_cached(self, file_uuid: str):
+        """
+        只查询缓存，不访问数据库
+        Returns:
+            (是否命中, 图片路径)，命中负缓存时图片路径为 None
+        """
+        with self._lock:
+            entry = self._entries.get(file_uuid)
+            if entry is not None:
+                self._entries.move_to_end(file_uuid)
+                self.hits += 1
+                return True, entry
+
+            expires_at = self._missing.get(file_uuid)
+            if expires_at is not None:
+                if expires_at > time.monotonic():
+                    self.negative_hits += 1
+                    return True, None
+                del self._missing[file_uuid]
+
+            self.misses += 1
+            return False, None
+
+    def resolve(self, file_uuid: str):
+        """获取图片路径，缓存未命中时查询数据库，不存在返回 None"""
+        hit, entry = self.get_cached(file_uuid)
+        if hit:
+            return entry
+        return self.load(file_uuid)
+
+    def load(self, file_uuid: str):
+        """查询数据库并写入缓存，不存在返回 None"""
+        # uuid 长度超过数据库字段长度，不可能存在
+        if len(file_uuid) > 200:
+            self.put_missing(file_uuid)
+            return None
+
+        with get_session() as db:
+            row = db.query(Pic.relative_path, Pic.pic_suffix).filter(Pic.uuid == file_uuid).first()
+
+        if row is None:
+            self.put_missing(file_uuid)
+            return None
+
+        entry = (row.relative_path, row.pic_suffix)
+        self.put(file_uuid, entry)
+        return entry
+
+    def put(self, file_uuid: str, entry: tuple):
+        """写入缓存"""
+        with self._lock:
+            self._missing.pop(file_uuid, None)
+            self._entries[file_uuid] = entry
+            self._entries.move_to_end(file_uuid)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def put_missing(self, file_uuid: str):
+        """记录不存在的 uuid"""
+        with self._lock:
+            self._missing[file_uuid] = time.monotonic() + self.negative_ttl
+            self._missing.move_to_end(file_uuid)
+            while len(self._missing) > self.negative_size:
+                self._missing.popitem(last=False)
+
+    def invalidate(self, file_uuid: str):
+        """删除单个缓存"""
+        with self._lock:
+            self._entries.pop(file_uuid, None)
+            self._missing.pop(file_uuid, None)
+
+    def clear(self):
+        """清空缓存（导入图片或数据库后调用）"""
+        with self._lock:
+            self._entries.clear()
+            self._missing.clear()
+        logger.info("清空图片路径缓存")
+
+    def stats(self):
+        """获取缓存统计"""
+        with self._lock:
+            lookups = self.hits + self.misses + self.negative_hits
+            return {
+                'size': len(self._entries),
+                'negativeSize': len(self._missing),
+                'hits': self.hits,
+                'misses': self.misses,
+                'negativeHits': self.negative_hits,
+                'evictions': self.evictions,
+                'hitRate': round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0
+            }
+
+# 创建全局单例实例
+pic_path_cache = PicPathCache()
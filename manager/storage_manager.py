@@ -0,0 +1,335 @@
+import os
+import posixpath
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.basic.logging_utils import get_logger
+from utils.file_utils import get_images_dir, remove_file_with_siblings
+
+logger = get_logger(__name__)
+
+# 读取对象时每块的大小
+STORAGE_CHUNK_SIZE = 1024 * 1024
+
+# 批量上传原图到远程存储的线程数
+STORE_THREADS = 8
+
+# S3 默认: 超过 16 MB 分块上传，每块 16 MB，4 个线程；签名链接 1 小时有效
+DEFAULT_MULTIPART_THRESHOLD = 16 * 1024 * 1024
+DEFAULT_MULTIPART_CHUNK_SIZE = 16 * 1024 * 1024
+DEFAULT_MULTIPART_CONCURRENCY = 4
+DEFAULT_PRESIGN_TTL = 3600
+
+
+# 存储错误
+class StorageError(Exception):
+    pass
+
+
+def get_pic_key(relative_path: str, filename: str):
+    """图片原图在存储中的 key: <年/月/日>/<uuid><后缀>，与本地 images 下的相对路径相同"""
+    return posixpath.join(relative_path.replace(os.sep, '/'), filename)
+
+
+# 本地文件系统存储
+class LocalStorage:
+    """key 为 images 目录下的相对路径"""
+
+    name = 'local'
+    remote = False
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def local_path(self, key: str):
+        path = os.path.normpath(os.path.join(self.root, key))
+        if os.path.commonpath([path, self.root]) != os.path.normpath(self.root):
+            raise StorageError(f"非法的 key: {key}")
+        return path
+
+    def put_file(self, key: str, source_path: str, content_type: str = None):
+        target_path = self.local_path(key)
+        if os.path.exists(target_path) and os.path.samefile(source_path, target_path):
+            return
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        temp_path = target_path + '.tmp'
+        shutil.copyfile(source_path, temp_path)
+        os.replace(temp_path, target_path)
+
+    def put_stream(self, key: str, stream, content_type: str = None):
+        target_path = self.local_path(key)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        temp_path = target_path + '.tmp'
+        try:
+            with open(temp_path, 'wb') as file:
+                shutil.copyfileobj(stream, file, STORAGE_CHUNK_SIZE)
+            os.replace(temp_path, target_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def open(self, key: str):
+        return open(self.local_path(key), 'rb')
+
+    def stream(self, key: str, start: int = 0, end: int = None):
+        """按块读取 [start, end) 区间"""
+        with self.open(key) as file:
+            file.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                chunk = file.read(STORAGE_CHUNK_SIZE if remaining is None else min(STORAGE_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, key: str):
+        path = self.local_path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def stat(self, key: str):
+        """Returns: {'size', 'mtime'}，不存在返回 None"""
+        try:
+            stat_result = os.stat(self.local_path(key))
+        except OSError:
+            return None
+        return {'size': stat_result.st_size, 'mtime': stat_result.st_mtime}
+
+    def list(self, prefix: str = ''):
+        """列出 prefix 下的所有 key"""
+        base = self.local_path(prefix) if prefix else self.root
+        for root, dirs, files in os.walk(base):
+            dirs.sort()
+            for filename in sorted(files):
+                yield os.path.relpath(os.path.join(root, filename), self.root).replace(os.sep, '/')
+
+    def presign_get(self, key: str, filename: str = None):
+        """本地存储不提供签名链接"""
+        return None
+
+
+# S3 兼容存储（AWS S3、MinIO 等）
+class S3Storage:
+    """
+    需要安装 boto3
+    大文件按 multipartThreshold 分块并行上传，下载可以返回签名链接让客户端直接从 S3 获取
+    """
+
+    name = 's3'
+    remote = True
+
+    def __init__(self, config: dict):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+        except ImportError:
+            raise StorageError("使用 S3 存储需要安装 boto3: pip install boto3")
+
+        self.bucket = config.get('bucket')
+        if not self.bucket:
+            raise StorageError("S3 存储未配置 bucket")
+        self.prefix = str(config.get('prefix') or '').strip('/')
+        self.presign_ttl = int(config.get('presignTtl', DEFAULT_PRESIGN_TTL))
+        self.redirect = bool(config.get('redirect', True))
+
+        mb = 1024 * 1024
+        self.transfer_config = TransferConfig(
+            multipart_threshold=int(config.get('multipartThreshold', DEFAULT_MULTIPART_THRESHOLD // mb)) * mb,
+            multipart_chunksize=int(config.get('multipartChunkSize', DEFAULT_MULTIPART_CHUNK_SIZE // mb)) * mb,
+            max_concurrency=int(config.get('multipartConcurrency', DEFAULT_MULTIPART_CONCURRENCY))
+        )
+        self.client = boto3.client(
+            's3',
+            endpoint_url=config.get('endpoint') or None,
+            region_name=config.get('region') or None,
+            aws_access_key_id=config.get('accessKey') or None,
+            aws_secret_access_key=config.get('secretKey') or None,
+            # MinIO 等自建服务通常使用路径形式的地址
+            config=Config(s3={'addressing_style': config.get('addressingStyle', 'path')},
+                          retries={'max_attempts': 5, 'mode': 'standard'})
+        )
+
+    def _key(self, key: str):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _strip(self, object_key: str):
+        return object_key[len(self.prefix) + 1:] if self.prefix else object_key
+
+    def local_path(self, key: str):
+        return None
+
+    def put_file(self, key: str, source_path: str, content_type: str = None):
+        extra_args = {'ContentType': content_type} if content_type else None
+        self.client.upload_file(source_path, self.bucket, self._key(key),
+                                ExtraArgs=extra_args, Config=self.transfer_config)
+
+    def put_stream(self, key: str, stream, content_type: str = None):
+        extra_args = {'ContentType': content_type} if content_type else None
+        self.client.upload_fileobj(stream, self.bucket, self._key(key),
+                                   ExtraArgs=extra_args, Config=self.transfer_config)
+
+    def open(self, key: str):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body']
+        except self.client.exceptions.NoSuchKey:
+            raise FileNotFoundError(key)
+
+    def stream(self, key: str, start: int = 0, end: int = None):
+        params = {'Bucket': self.bucket, 'Key': self._key(key)}
+        if start or end is not None:
+            params['Range'] = f"bytes={start}-{'' if end is None else end - 1}"
+        try:
+            body = self.client.get_object(**params)['Body']
+        except self.client.exceptions.NoSuchKey:
+            raise FileNotFoundError(key)
+        try:
+            yield from body.iter_chunks(STORAGE_CHUNK_SIZE)
+        finally:
+            body.close()
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def stat(self, key: str):
+        from botocore.exceptions import ClientError
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return {'size': head['ContentLength'], 'mtime': head['LastModified'].timestamp()}
+
+    def list(self, prefix: str = ''):
+        paginator = self.client.get_paginator('list_objects_v2')
+        root = self._key(prefix) if prefix else (self.prefix + '/' if self.prefix else '')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=root):
+            for item in page.get('Contents', []):
+                yield self._strip(item['Key'])
+
+    def presign_get(self, key: str, filename: str = None):
+        """签名下载链接，redirect 关闭时返回 None（由服务端转发）"""
+        if not self.redirect:
+            return None
+        params = {'Bucket': self.bucket, 'Key': self._key(key)}
+        if filename:
+            params['ResponseContentDisposition'] = f'inline; filename="{filename}"'
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=self.presign_ttl)
+
+
+def create_storage(storage_config: dict):
+    """根据配置创建存储，type 为 local（默认）或 s3"""
+    storage_type = str((storage_config or {}).get('type', 'local')).lower()
+    if storage_type == 'local':
+        return LocalStorage(get_images_dir())
+    if storage_type == 's3':
+        return S3Storage(storage_config)
+    raise StorageError(f"不支持的存储类型: {storage_type}")
+
+
+# 存储管理类
+class StorageManager:
+    """
+    原图存储
+    上传时原图先写入本地 images 目录（缩略图等都从本地文件生成），使用远程存储时再上传一份；
+    本地原图不存在时（其他节点上传或已清理）从远程存储取回
+    """
+
+    def __init__(self):
+        self.backend = LocalStorage(get_images_dir())
+        self._fetch_lock = threading.Lock()
+        self._fetching = {}
+
+    def configure(self, storage_config: dict):
+        self.backend = create_storage(storage_config)
+        logger.info(f"原图存储: {self.backend.name}")
+
+    @property
+    def remote(self):
+        return self.backend.remote
+
+    def store_original(self, relative_path: str, filename: str, file_path: str, content_type: str = None):
+        """上传后保存原图到存储（本地存储时文件已在原位，不做处理）"""
+        if not self.backend.remote:
+            return True
+        try:
+            self.backend.put_file(get_pic_key(relative_path, filename), file_path, content_type)
+            return True
+        except Exception as e:
+            # 上传失败时本地文件保留，可以用 backfill.py storage 重新同步
+            logger.error(f"原图上传到存储失败 {filename}: {e}")
+            return False
+
+    def store_originals(self, items: list):
+        """
+        批量上传原图，多个文件并行上传
+        Args:
+            items: [(相对路径, 文件名, 本地路径, 类型)]
+        """
+        if not self.backend.remote or not items:
+            return
+        with ThreadPoolExecutor(max_workers=STORE_THREADS) as executor:
+            list(executor.map(lambda item: self.store_original(*item), items))
+
+    def remove_original(self, relative_path: str, filename: str):
+        """删除原图（本地文件及副本，以及远程存储中的对象）"""
+        remove_file_with_siblings(os.path.join(get_images_dir(), relative_path, filename))
+        if self.backend.remote:
+            try:
+                self.backend.delete(get_pic_key(relative_path, filename))
+            except Exception as e:
+                logger.error(f"从存储删除原图失败 {filename}: {e}")
+
+    def presign_original(self, relative_path: str, filename: str):
+        """本地没有原图时的签名下载链接，不支持时返回 None"""
+        if not self.backend.remote:
+            return None
+        return self.backend.presign_get(get_pic_key(relative_path, filename), filename)
+
+    def fetch_original(self, relative_path: str, filename: str):
+        """
+        确保本地有原图，没有时从远程存储下载（同一文件同时只下载一次）
+        Returns:
+            本地路径，无法取得时返回 None
+        """
+        local_path = os.path.join(get_images_dir(), relative_path, filename)
+        if os.path.exists(local_path) or not self.backend.remote:
+            return local_path if os.path.exists(local_path) else None
+
+        with self._fetch_lock:
+            lock = self._fetching.setdefault(local_path, threading.Lock())
+        try:
+            with lock:
+                if not os.path.exists(local_path):
+                    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                    temp_path = local_path + '.fetch'
+                    try:
+                        with open(temp_path, 'wb') as file:
+                            for chunk in self.backend.stream(get_pic_key(relative_path, filename)):
+                                file.write(chunk)
+                        os.replace(temp_path, local_path)
+                    except Exception as e:
+                        if os.path.exists(temp_path):
+                            os.remove(temp_path)
+                        logger.error(f"从存储取回原图失败 {filename}: {e}")
+                        return None
+        finally:
+            with self._fetch_lock:
+                self._fetching.pop(local_path, None)
+        return local_path
+
+# 创建全局单例实例
+storage_manager = StorageManager()
+
+
+def init_storage(storage_config: dict):
+    """读取原图存储配置，配置错误时使用本地存储"""
+    try:
+        storage_manager.configure(storage_config or {})
+    except StorageError as e:
+        logger.error(f"{e}，使用本地存储")
@@ -0,0 +1,319 @@
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from werkzeug.http import http_date
+
+from manager.db_manager import get_session
+from models.pic.pic import Pic
+from utils.basic.logging_utils import get_logger
+from utils.file_utils import find_thumbnail_path, MODERN_FORMATS, MODERN_SOURCE_SUFFIXES
+from utils.http_utils import make_etag, is_file_offloaded, IMMUTABLE_CACHE_CONTROL
+
+logger = get_logger(__name__)
+
+# 默认内存预算 64 MB，启动时预热最近上传的 1000 张缩略图
+DEFAULT_THUMBNAIL_CACHE_SIZE = 64 * 1024 * 1024
+DEFAULT_THUMBNAIL_CACHE_WARM = 1000
+
+# 命中后超过该秒数才重新检查缩略图文件，其他进程删除或替换的缩略图最多延迟这么久失效
+THUMBNAIL_REVALIDATE_SECONDS = 5
+
+
+# 计数减半的查表，bytearray.translate 在 C 中一次处理整行
+HALVE_TABLE = bytes(value >> 1 for value in range(256))
+
+
+# 访问频率统计类
+class FrequencySketch:
+    """
+    Count-Min Sketch 访问频率估计（TinyLFU）
+    每个计数最大 15，总访问次数达到 sample_size 后所有计数减半，使旧的热点逐渐冷却
+    不是线程安全的，由调用方加锁
+    """
+
+    def __init__(self, width: int = 1 << 16, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.sample_size = width * 10
+        self.additions = 0
+        self._rows = [bytearray(width) for _ in range(depth)]
+
+    def _indexes(self, key):
+        return [hash((row, key)) % self.width for row in range(self.depth)]
+
+    def increment(self, key):
+        for row, index in zip(self._rows, self._indexes(key)):
+            if row[index] < 15:
+                row[index] += 1
+
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self._reset()
+
+    def estimate(self, key) -> int:
+        return min(row[index] for row, index in zip(self._rows, self._indexes(key)))
+
+    def _reset(self):
+        for row in self._rows:
+            row[:] = row.translate(HALVE_TABLE)
+        self.additions //= 2
+
+
+# 内存缩略图类
+class ThumbnailEntry:
+    """
+    一张缩略图在内存中的所有格式，响应头提前计算好
+    记录缩略图文件的 inode 和修改时间，其他进程删除或重新生成缩略图后缓存失效；checked_at 为上次检查文件的时间
+    """
+
+    __slots__ = ('representations', 'vary_accept', 'size', 'path', 'generation', 'checked_at')
+
+    def __init__(self, representations: dict, vary_accept: bool, path: str = None, generation: tuple = None):
+        self.representations = representations
+        self.vary_accept = vary_accept
+        self.size = sum(len(body) for body, _ in representations.values())
+        self.path = path
+        self.generation = generation
+        self.checked_at = time.monotonic()
+
+    def is_current(self) -> bool:
+        """缩略图文件是否仍是读取时的文件"""
+        if self.path is None:
+            return True
+        try:
+            return get_file_generation(os.stat(self.path)) == self.generation
+        except OSError:
+            return False
+
+    def choose(self, accepted_suffixes: list):
+        """根据客户端接受的格式选择内容，返回 (body, headers)"""
+        for suffix in accepted_suffixes:
+            representation = self.representations.get(suffix)
+            if representation is not None:
+                return representation
+        return self.representations['']
+
+
+def get_file_generation(stat_result):
+    return stat_result.st_ino, stat_result.st_mtime_ns
+
+
+def load_thumbnail_entry(file_uuid: str, file_path: str):
+    """读取缩略图以及 avif / webp 副本，生成内存缩略图"""
+    vary_accept = os.path.splitext(file_path)[1].lower() in MODERN_SOURCE_SUFFIXES
+    candidates = [('', file_path)]
+    if vary_accept:
+        candidates += [(suffix, file_path + suffix) for _, suffix, _ in MODERN_FORMATS]
+
+    representations = {}
+    generation = None
+    for suffix, path in candidates:
+        try:
+            with open(path, 'rb') as file:
+                stat_result = os.fstat(file.fileno())
+                body = file.read()
+        except OSError:
+            continue
+        if suffix == '':
+            generation = get_file_generation(stat_result)
+
+        headers = {
+            'Content-Type': mimetypes.guess_type(path)[0] or 'application/octet-stream',
+            'ETag': f'"{make_etag(file_uuid, stat_result)}"',
+            'Last-Modified': http_date(int(stat_result.st_mtime)),
+            'Cache-Control': IMMUTABLE_CACHE_CONTROL
+        }
+        if vary_accept:
+            headers['Vary'] = 'Accept'
+        representations[suffix] = (body, headers)
+
+    if '' not in representations:
+        return None
+    return ThumbnailEntry(representations, vary_accept, file_path, generation)
+
+
+# 内存缩略图缓存类
+class ThumbnailCache:
+    """
+    热点缩略图内存缓存
+    LRU 顺序淘汰，新内容只有访问频率高于被淘汰的内容时才会进入缓存，避免一次性浏览冲掉热点
+    访问频率统计使用单独的锁，计数减半时不阻塞缓存读取
+    命中时每隔 revalidate_seconds 检查一次缩略图文件，其他进程删除的图片不再返回
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_THUMBNAIL_CACHE_SIZE):
+        self.max_bytes = max_bytes
+        self.revalidate_seconds = THUMBNAIL_REVALIDATE_SECONDS
+
+        self._lock = threading.Lock()
+        self._sketch_lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._sketch = FrequencySketch()
+        self._total_bytes = 0
+
+        # 统计数据
+        self.hits = 0
+        self.misses = 0
+        self.admissions = 0
+        self.rejections = 0
+        self.evictions = 0
+
+    def get(self, file_uuid: str):
+        """获取内存缩略图，未命中或文件已被删除、替换时返回 None"""
+        return self._get(file_uuid, True)
+
+    def get_fresh(self, file_uuid: str):
+        """
+        只返回近期检查过文件的内存缩略图，不访问文件，可以在事件循环中调用
+        返回 None 时不计入统计，由调用方在线程池中调用 get
+        """
+        return self._get(file_uuid, False)
+
+    def _get(self, file_uuid: str, check_file: bool):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(file_uuid)
+            fresh = entry is not None and now - entry.checked_at < self.revalidate_seconds
+        if not fresh and not check_file:
+            return None
+
+        with self._sketch_lock:
+            self._sketch.increment(file_uuid)
+
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # 在锁外检查文件，不阻塞其他请求
+        if not fresh:
+            if not entry.is_current():
+                with self._lock:
+                    if self._entries.get(file_uuid) is entry:
+                        self._total_bytes -= self._entries.pop(file_uuid).size
+                    self.misses += 1
+                return None
+            entry.checked_at = now
+
+        with self._lock:
+            if file_uuid in self._entries:
+                self._entries.move_to_end(file_uuid)
+            self.hits += 1
+        return entry
+
+    def admit(self, file_uuid: str, file_path: str):
+        """
+        读取缩略图并尝试放入缓存
+        Returns:
+            读取到的内存缩略图（无论是否进入缓存），文件不存在返回 None
+        """
+        entry = load_thumbnail_entry(file_uuid, file_path)
+        if entry is None or entry.size > self.max_bytes // 8:
+            return entry
+
+        with self._lock, self._sketch_lock:
+            if file_uuid in self._entries:
+                return entry
+
+            # 空间不足时比较访问频率，频率不高于淘汰对象则拒绝
+            frequency = self._sketch.estimate(file_uuid)
+            victims = []
+            freed = 0
+            for victim_uuid, victim in self._entries.items():
+                if self._total_bytes - freed + entry.size <= self.max_bytes:
+                    break
+                if self._sketch.estimate(victim_uuid) >= frequency:
+                    self.rejections += 1
+                    return entry
+                victims.append(victim_uuid)
+                freed += victim.size
+
+            for victim_uuid in victims:
+                self._total_bytes -= self._entries.pop(victim_uuid).size
+                self.evictions += 1
+
+            self._put(file_uuid, entry)
+            self.admissions += 1
+        return entry
+
+    def _put(self, file_uuid: str, entry: ThumbnailEntry):
+        """写入缓存，需持有锁"""
+        self._entries[file_uuid] = entry
+        self._total_bytes += entry.size
+
+    def warm(self, limit: int):
+        """预热最近上传的缩略图，直到数量或内存预算用完"""
+        with get_session() as db:
+            rows = (
+                db.query(Pic.uuid, Pic.pic_suffix)
+                .order_by(Pic.upload_time.desc())
+                .limit(limit)
+                .all()
+            )
+
+        loaded = 0
+        for row in rows:
+            entry = load_thumbnail_entry(row.uuid, find_thumbnail_path(row.uuid + row.pic_suffix))
+            if entry is None:
+                continue
+            with self._lock:
+                if self._total_bytes + entry.size > self.max_bytes:
+                    break
+                if row.uuid not in self._entries:
+                    # 越新的图片越靠近 LRU 尾部
+                    self._put(row.uuid, entry)
+                    self._entries.move_to_end(row.uuid, last=False)
+                    loaded += 1
+
+        logger.info(f"缩略图缓存预热完成，共 {loaded} 张")
+
+    def invalidate(self, file_uuid: str):
+        """删除单个缓存"""
+        with self._lock:
+            entry = self._entries.pop(file_uuid, None)
+            if entry is not None:
+                self._total_bytes -= entry.size
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        """获取缓存统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'bytes': self._total_bytes,
+                'maxBytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'admissions': self.admissions,
+                'rejections': self.rejections,
+                'evictions': self.evictions,
+                'hitRate': round(self.hits / lookups, 4) if lookups else 0
+            }
+
+# 创建全局单例实例
+thumbnail_cache = ThumbnailCache()
+
+
+def init_thumbnail_cache(server_config: dict):
+    """读取内存预算配置（MB），并在后台预热缓存；文件交给前端代理发送时不使用内存缓存，需在 init_file_offload 之后调用"""
+    if is_file_offloaded():
+        logger.info("文件由前端代理发送，不使用缩略图内存缓存")
+        return
+
+    cache_size = server_config.get('thumbnailCacheSize')
+    if cache_size is not None:
+        thumbnail_cache.max_bytes = int(cache_size) * 1024 * 1024
+
+    warm_count = int(server_config.get('thumbnailCacheWarm', DEFAULT_THUMBNAIL_CACHE_WARM))
+    logger.info(f"缩略图缓存大小: {thumbnail_cache.max_bytes} 字节，预热 {warm_count} 张")
+    if thumbnail_cache.max_bytes > 0 and warm_count > 0:
+        threading.Thread(target=thumbnail_cache.warm, args=(warm_count,), daemon=True).start()
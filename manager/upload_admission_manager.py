@@ -0,0 +1,174 @@
+import threading
+import time
+
+import psutil
+
+from utils.basic.logging_utils import get_logger
+from utils.file_utils import get_images_dir
+
+logger = get_logger(__name__)
+
+# 默认同时处理 4 个上传，最多 16 个排队，排队超过 30 秒拒绝
+DEFAULT_MAX_IN_FLIGHT = 4
+DEFAULT_MAX_QUEUE = 16
+DEFAULT_QUEUE_TIMEOUT = 30
+
+# images 所在磁盘剩余空间低于 1 GB 时拒绝上传
+DEFAULT_MIN_FREE_SPACE = 1024 * 1024 * 1024
+
+# 剩余空间检查结果缓存 1 秒
+DISK_CHECK_INTERVAL = 1.0
+
+# 拒绝时建议客户端等待的秒数
+RETRY_AFTER = 5
+
+# 各类上传请求体上限（字节）: 单张、批量、断点续传的一块、完成断点续传（无请求体）
+DEFAULT_UPLOAD_LIMITS = {
+    'single': 100 * 1024 * 1024,
+    'batch': 2 * 1024 * 1024 * 1024,
+    'chunk': 64 * 1024 * 1024,
+    'finalize': 64 * 1024
+}
+
+
+# 上传准入拒绝
+class AdmissionRejected(Exception):
+    """message 为前端提示的 i18n key，status 为响应状态码"""
+
+    def __init__(self, message: str, status: int = 503, retry_after: int = None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.retry_after = retry_after
+
+
+# 上传准入控制类
+class UploadAdmission:
+    """
+    上传准入控制
+    在读取请求体之前检查大小和剩余空间，并限制同时写入磁盘的上传数量，超出时排队，队列满或等待超时返回 503
+    """
+
+    def __init__(self):
+        self.max_in_flight = DEFAULT_MAX_IN_FLIGHT
+        self.max_queue = DEFAULT_MAX_QUEUE
+        self.queue_timeout = DEFAULT_QUEUE_TIMEOUT
+        self.min_free_space = DEFAULT_MIN_FREE_SPACE
+        self.limits = dict(DEFAULT_UPLOAD_LIMITS)
+
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._waiting = 0
+        self._admitted = 0
+        self._rejected = 0
+
+        self._free_space = None
+        self._free_checked_at = 0.0
+
+    def configure(self, max_in_flight: int, max_queue: int, queue_timeout: int, min_free_space: int, limits: dict):
+        with self._condition:
+            self.max_in_flight = max(max_in_flight, 1)
+            self.max_queue = max(max_queue, 0)
+            self.queue_timeout = max(queue_timeout, 0)
+            self.min_free_space = max(min_free_space, 0)
+            self.limits.update(limits)
+            self._condition.notify_all()
+
+    def get_free_space(self):
+        """images 所在磁盘的剩余空间，短时间内复用上次结果"""
+        now = time.monotonic()
+        if self._free_space is None or now - self._free_checked_at > DISK_CHECK_INTERVAL:
+            try:
+                self._free_space = psutil.disk_usage(get_images_dir()).free
+            except OSError as e:
+                logger.error(f"获取剩余空间失败: {e}")
+                self._free_space = None
+            self._free_checked_at = now
+        return self._free_space
+
+    def check(self, kind: str, content_length: int = None):
+        """
+        检查请求体大小和剩余空间
+        Raises:
+            AdmissionRejected: 请求体超过上限（413）或剩余空间不足（503）
+        """
+        limit = self.limits.get(kind)
+        if limit is not None and content_length is not None and content_length > limit:
+            raise AdmissionRejected('upload.message.fileTooLarge', 413)
+
+        free_space = self.get_free_space()
+        if free_space is not None and free_space - (content_length or 0) < self.min_free_space:
+            self._count_rejected()
+            logger.error(f"剩余空间不足，拒绝上传: 剩余 {free_space / 1024 / 1024:.0f} MB")
+            raise AdmissionRejected('upload.message.diskFull', 503, RETRY_AFTER * 12)
+
+    def acquire(self):
+        """
+        占用一个上传名额，没有空闲名额时排队等待
+        Raises:
+            AdmissionRejected: 队列已满或等待超时
+        """
+        with self._condition:
+            if self._in_flight >= self.max_in_flight:
+                if self._waiting >= self.max_queue:
+                    self._rejected += 1
+                    raise AdmissionRejected('upload.message.serverBusy', 503, RETRY_AFTER)
+
+                self._waiting += 1
+                try:
+                    deadline = time.monotonic() + self.queue_timeout
+                    while self._in_flight >= self.max_in_flight:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._rejected += 1
+                            raise AdmissionRejected('upload.message.serverBusy', 503, RETRY_AFTER)
+                        self._condition.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+            self._in_flight += 1
+            self._admitted += 1
+
+    def release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
+
+    def _count_rejected(self):
+        with self._condition:
+            self._rejected += 1
+
+    def stats(self):
+        with self._condition:
+            return {
+                'inFlight': self._in_flight,
+                'waiting': self._waiting,
+                'maxInFlight': self.max_in_flight,
+                'maxQueue': self.max_queue,
+                'admitted': self._admitted,
+                'rejected': self._rejected,
+                'freeSpace': self._free_space,
+                'minFreeSpace': self.min_free_space
+            }
+
+# 创建全局单例实例
+upload_admission = UploadAdmission()
+
+
+def init_upload_admission(server_config: dict):
+    """读取上传并发、排队和大小限制（大小以 MB 配置）"""
+    mb = 1024 * 1024
+    limits = {}
+    for kind, key in (('single', 'uploadMaxSize'), ('batch', 'uploadBatchMaxSize'), ('chunk', 'uploadChunkMaxSize')):
+        if key in server_config:
+            limits[kind] = int(server_config[key]) * mb
+
+    upload_admission.configure(
+        int(server_config.get('uploadConcurrency', DEFAULT_MAX_IN_FLIGHT)),
+        int(server_config.get('uploadQueueSize', DEFAULT_MAX_QUEUE)),
+        int(server_config.get('uploadQueueTimeout', DEFAULT_QUEUE_TIMEOUT)),
+        int(server_config.get('uploadMinFreeSpace', DEFAULT_MIN_FREE_SPACE // mb)) * mb,
+        limits
+    )
+    logger.info(f"上传准入: 并发 {upload_admission.max_in_flight}，排队 {upload_admission.max_queue}，"
+                f"最少剩余空间 {upload_admission.min_free_space // mb} MB")
@@ -0,0 +1,200 @@
+import json
+import os
+import re
+import secrets
+import threading
+import time
+
+from utils.basic.logging_utils import get_logger
+from utils.file_utils import get_app_dir
+
+logger = get_logger(__name__)
+
+# 未完成的上传默认保留 24 小时，每 10 分钟清理一次
+DEFAULT_UPLOAD_SESSION_TTL = 24 * 60 * 60
+SWEEP_INTERVAL = 10 * 60
+
+# 单个文件最大 4 GB，建议客户端每块 8 MB
+MAX_UPLOAD_SIZE = 4 * 1024 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# 每次从请求体读取的大小
+READ_CHUNK_SIZE = 256 * 1024
+
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+
+# 上传会话错误
+class UploadSessionError(Exception):
+    """message 为前端提示的 i18n key，status 为响应状态码"""
+
+    def __init__(self, message: str, status: int = 400, offset: int = None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.offset = offset
+
+
+# 分块上传会话类
+class UploadSessionManager:
+    """
+    断点续传上传会话
+    每个会话在 upload/sessions 下有 <id>.part（已接收的数据）和 <id>.json（文件名、大小、相册）两个文件，
+    已接收的字节数以 .part 文件大小为准，服务重启后可以继续上传
+    """
+
+    def __init__(self):
+        self.session_dir = os.path.join(get_app_dir(), 'upload', 'sessions')
+        self.ttl = DEFAULT_UPLOAD_SESSION_TTL
+        self._lock = threading.Lock()
+        self._session_locks = {}
+        self._sweeper = None
+
+    def _paths(self, session_id: str):
+        if not SESSION_ID_PATTERN.match(session_id or ''):
+            raise UploadSessionError('upload.message.sessionNotFound', 404)
+        base = os.path.join(self.session_dir, session_id)
+        return base + '.part', base + '.json'
+
+    def session_lock(self, session_id: str):
+        """同一会话的分块写入和完成操作串行执行"""
+        with self._lock:
+            return self._session_locks.setdefault(session_id, threading.Lock())
+
+    def create(self, filename: str, size: int, album_id: int):
+        """创建上传会话"""
+        if not filename:
+            raise UploadSessionError('upload.message.fileNameIsEmpty')
+        if size is None or size <= 0 or size > MAX_UPLOAD_SIZE:
+            raise UploadSessionError('upload.message.fileTooLarge', 413)
+
+        os.makedirs(self.session_dir, exist_ok=True)
+        session_id = secrets.token_urlsafe(24)
+        part_path, meta_path = self._paths(session_id)
+
+        meta = {'filename': filename, 'size': size, 'albumId': album_id, 'createdAt': int(time.time())}
+        open(part_path, 'wb').close()
+        with open(meta_path, 'w', encoding='utf-8') as file:
+            json.dump(meta, file)
+
+        logger.info(f"创建上传会话 {session_id}: {filename}，{size} 字节")
+        return self.status(session_id)
+
+    def load(self, session_id: str):
+        """读取会话信息"""
+        part_path, meta_path = self._paths(session_id)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as file:
+                meta = json.load(file)
+            meta['offset'] = os.path.getsize(part_path)
+        except (OSError, ValueError):
+            raise UploadSessionError('upload.message.sessionNotFound', 404)
+        return meta
+
+    def status(self, session_id: str):
+        """查询已接收的字节数"""
+        meta = self.load(session_id)
+        return {
+            'sessionId': session_id,
+            'offset': meta['offset'],
+            'size': meta['size'],
+            'chunkSize': UPLOAD_CHUNK_SIZE,
+            'expiresAt': int(os.path.getmtime(self._paths(session_id)[0])) + self.ttl
+        }
+
+    def append(self, session_id: str, offset: int, stream):
+        """
+        把请求体追加到暂存文件
+        offset 必须等于已接收的字节数，不一致时返回当前偏移量，客户端从该位置继续
+        """
+        part_path, _ = self._paths(session_id)
+        with self.session_lock(session_id):
+            meta = self.load(session_id)
+            if offset != meta['offset']:
+                raise UploadSessionError('upload.message.offsetMismatch', 409, meta['offset'])
+
+            remaining = meta['size'] - offset
+            with open(part_path, 'r+b') as file:
+                file.seek(offset)
+                try:
+                    while True:
+                        chunk = stream.read(READ_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        if len(chunk) > remaining:
+                            raise UploadSessionError('upload.message.fileTooLarge', 413)
+                        file.write(chunk)
+                        remaining -= len(chunk)
+                except BaseException:
+                    # 只保留写入完整的部分，连接中断时客户端从当前位置续传
+                    file.flush()
+                    file.truncate(file.tell())
+                    raise
+
+            return self.status(session_id)
+
+    def open_completed(self, session_id: str):
+        """
+        数据接收完成后打开暂存文件
+        Returns:
+            (会话信息, 文件对象)
+        """
+        meta = self.load(session_id)
+        if meta['offset'] != meta['size']:
+            raise UploadSessionError('upload.message.uploadIncomplete', 409, meta['offset'])
+        return meta, open(self._paths(session_id)[0], 'rb')
+
+    def remove(self, session_id: str):
+        """删除会话和暂存文件"""
+        for path in self._paths(session_id):
+            if os.path.exists(path):
+                os.remove(path)
+        with self._lock:
+            self._session_locks.pop(session_id, None)
+
+    def sweep(self):
+        """删除超过 ttl 没有新数据的会话"""
+        if not os.path.isdir(self.session_dir):
+            return 0
+
+        expire_before = time.time() - self.ttl
+        removed = 0
+        for entry in os.scandir(self.session_dir):
+            if not entry.name.endswith('.part'):
+                continue
+            session_id = entry.name[:-len('.part')]
+            try:
+                if entry.stat().st_mtime < expire_before:
+                    self.remove(session_id)
+                    removed += 1
+            except (OSError, UploadSessionError) as e:
+                logger.error(f"清理上传会话失败 {entry.name}: {e}")
+
+        if removed:
+            logger.info(f"清理过期上传会话 {removed} 个")
+        return removed
+
+    def start_sweeper(self):
+        """启动定时清理线程"""
+        if self._sweeper is not None:
+            return
+
+        def loop():
+            while True:
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.error(f"清理上传会话失败: {e}")
+                time.sleep(SWEEP_INTERVAL)
+
+        self._sweeper = threading.Thread(target=loop, name='upload-session-sweeper', daemon=True)
+        self._sweeper.start()
+
+# 创建全局单例实例
+upload_session_manager = UploadSessionManager()
+
+
+def init_upload_sessions(server_config: dict):
+    """读取上传会话保留时间并启动清理线程"""
+    upload_session_manager.ttl = max(int(server_config.get('uploadSessionTtl', DEFAULT_UPLOAD_SESSION_TTL)), 60)
+    upload_session_manager.start_sweeper()
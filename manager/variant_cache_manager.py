@@ -0,0 +1,326 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image, ImageOps
+
+from utils.basic.logging_utils import get_logger
+from utils.file_utils import get_app_dir
+
+logger = get_logger(__name__)
+
+# 允许的变换参数（白名单），防止任意尺寸请求打满磁盘和 CPU
+VARIANT_SIZES = (160, 320, 480, 640, 800, 1024, 1280, 1600, 1920)
+VARIANT_FITS = ('contain', 'cover')
+VARIANT_QUALITIES = (60, 75, 85, 95)
+VARIANT_FORMATS = {
+    'jpeg': ('JPEG', '.jpg'),
+    'webp': ('WEBP', '.webp'),
+    'png': ('PNG', '.png')
+}
+VARIANT_ARGS = ('w', 'h', 'fit', 'fmt', 'q')
+
+# 默认缓存大小 1 GB
+DEFAULT_VARIANT_CACHE_SIZE = 1024 * 1024 * 1024
+
+# 超过该秒数的临时文件视为生成中断留下的文件
+STALE_TEMP_SECONDS = 3600
+
+# 每隔该秒数在后台重新扫描一次缓存目录，计入其他进程生成和删除的文件
+RECONCILE_SECONDS = 300
+
+
+def has_variant_args(args) -> bool:
+    """判断请求是否需要变换图片"""
+    return any(name in args for name in VARIANT_ARGS)
+
+
+def parse_variant_args(args) -> dict:
+    """
+    解析并校验变换参数
+    Raises:
+        ValueError: 参数不在白名单中
+    """
+    width = args.get('w', default=None, type=int)
+    height = args.get('h', default=None, type=int)
+    fit = args.get('fit', default='contain', type=str)
+    fmt = args.get('fmt', default='jpeg', type=str).lower()
+    quality = args.get('q', default=85, type=int)
+
+    if width is None and height is None:
+        raise ValueError("缺少宽度或高度")
+    if width is not None and width not in VARIANT_SIZES:
+        raise ValueError(f"不支持的宽度 {width}")
+    if height is not None and height not in VARIANT_SIZES:
+        raise ValueError(f"不支持的高度 {height}")
+    if fit not in VARIANT_FITS:
+        raise ValueError(f"不支持的缩放方式 {fit}")
+    if fmt == 'jpg':
+        fmt = 'jpeg'
+    if fmt not in VARIANT_FORMATS:
+        raise ValueError(f"不支持的格式 {fmt}")
+    if quality not in VARIANT_QUALITIES:
+        raise ValueError(f"不支持的质量 {quality}")
+
+    return {'w': width, 'h': height, 'fit': fit, 'fmt': fmt, 'q': quality}
+
+
+def variant_filename(file_uuid: str, params: dict) -> str:
+    """变换图片的缓存文件名，以 uuid 开头方便删除"""
+    suffix = VARIANT_FORMATS[params['fmt']][1]
+    return f"{file_uuid}_{params['w'] or 0}x{params['h'] or 0}_{params['fit']}_q{params['q']}{suffix}"
+
+
+def render_variant(source_path: str, output_path: str, params: dict):
+    """解码原图并生成变换后的图片"""
+    width = params['w'] or VARIANT_SIZES[-1] * 4
+    height = params['h'] or VARIANT_SIZES[-1] * 4
+    pil_format = VARIANT_FORMATS[params['fmt']][0]
+
+    with Image.open(source_path) as image:
+        # JPEG 直接按目标尺寸缩小解码，避免完整解码大图
+        image.draft('RGB', (width, height))
+        image = ImageOps.exif_transpose(image)
+
+        if params['fit'] == 'cover' and params['w'] and params['h']:
+            image = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+        else:
+            image.thumbnail((width, height), Image.Resampling.LANCZOS)
+
+        if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        # 先写入临时文件再原子替换，避免其他请求读到写了一半的文件
+        temp_path = f"{output_path}.{threading.get_ident()}.tmp"
+        image.save(temp_path, format=pil_format, quality=params['q'], optimize=True)
+        os.replace(temp_path, output_path)
+
+
+# 变换图片缓存类
+class VariantCache:
+    """
+    变换图片的磁盘缓存
+    按访问顺序 LRU 淘汰，总大小超过 max_bytes 时删除最久未访问的文件
+    同一个变换同时只会生成一次，其他请求等待结果
+    缓存目录由多个进程共用: 命中时更新文件修改时间作为访问时间，按内存中的索引淘汰，
+    每隔 RECONCILE_SECONDS 在后台扫描目录，按实际文件重新计算大小和顺序
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_VARIANT_CACHE_SIZE):
+        self.max_bytes = max_bytes
+        self.cache_dir = os.path.join(get_app_dir(), 'cache', 'variants')
+
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._total_bytes = 0
+        self._loaded = False
+        self._reconciled_at = 0
+        self._reconciling = False
+
+        # 统计数据
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.failures = 0
+
+    def _scan(self):
+        """
+        扫描缓存目录（包括其他进程生成的文件）
+        Returns:
+            按修改时间（最后访问时间）从旧到新排序的 [(文件名, 大小)]
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        files = []
+        now = time.time()
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_file():
+                continue
+            try:
+                stat_result = entry.stat()
+                # 临时文件可能是其他进程正在写入的，只删除很久以前留下的
+                if entry.name.endswith('.tmp'):
+                    if now - stat_result.st_mtime > STALE_TEMP_SECONDS:
+                        os.remove(entry.path)
+                    continue
+            except OSError:
+                continue
+            files.append((stat_result.st_mtime, entry.name, stat_result.st_size))
+        return [(name, size) for _, name, size in sorted(files)]
+
+    def _reset_entries(self, files: list):
+        """
+        用扫描结果重建索引，需持有锁
+        扫描后本进程新生成的文件不在扫描结果中，保留在 LRU 尾部
+        """
+        entries = OrderedDict(files)
+        for name, size in self._entries.items():
+            entries.setdefault(name, size)
+        self._entries = entries
+        self._total_bytes = sum(entries.values())
+        self._reconciled_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        """启动后第一次使用时扫描缓存目录，按访问时间恢复 LRU 顺序；扫描时不持有缓存锁"""
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            files = self._scan()
+            with self._lock:
+                self._reset_entries(files)
+                self._loaded = True
+                logger.info(f"加载变换图片缓存 {len(self._entries)} 个")
+
+    def get_or_create(self, file_uuid: str, source_path: str, params: dict):
+        """
+        获取变换后的图片路径，不存在时生成
+        Returns:
+            缓存文件路径，生成失败返回 None
+        """
+        name = variant_filename(file_uuid, params)
+        path = os.path.join(self.cache_dir, name)
+
+        self._ensure_loaded()
+        with self._lock:
+            if name in self._entries:
+                # 更新修改时间记录访问，同时确认文件没有被其他进程淘汰或删除
+                try:
+                    os.utime(path)
+                    self._entries.move_to_end(name)
+                    self.hits += 1
+                    return path
+                except OSError:
+                    self._total_bytes -= self._entries.pop(name)
+
+            event = self._inflight.get(name)
+            if event is None:
+                event = threading.Event()
+                self._inflight[name] = event
+                owner = True
+                self.misses += 1
+            else:
+                owner = False
+                self.coalesced += 1
+
+        # 其他请求正在生成同一个变换，等待结果
+        if not owner:
+            event.wait()
+            with self._lock:
+                return path if name in self._entries else None
+
+        try:
+            if os.path.exists(path):
+                # 其他进程已经生成
+                os.utime(path)
+            else:
+                render_variant(source_path, path, params)
+            size = os.path.getsize(path)
+            with self._lock:
+                self._entries[name] = size
+                self._total_bytes += size
+            self._evict()
+            logger.info(f"生成变换图片 {name}")
+            return path
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+            logger.error(f"生成变换图片失败 {name}: {e}")
+            return None
+        finally:
+            with self._lock:
+                self._inflight.pop(name, None)
+            event.set()
+
+    def _evict(self):
+        """
+        按内存中的 LRU 顺序淘汰最久未访问的文件，在锁外删除文件
+        距离上次扫描超过 RECONCILE_SECONDS 时在后台重新扫描目录
+        """
+        with self._lock:
+            victims = []
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                name, size = self._entries.popitem(last=False)
+                self._total_bytes -= size
+                victims.append(name)
+            self.evictions += len(victims)
+
+            reconcile = not self._reconciling and time.monotonic() - self._reconciled_at > RECONCILE_SECONDS
+            if reconcile:
+                self._reconciling = True
+
+        for name in victims:
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+        if reconcile:
+            threading.Thread(target=self._reconcile, daemon=True).start()
+
+    def _reconcile(self):
+        """重新扫描缓存目录，计入其他进程生成、删除的文件后再淘汰"""
+        try:
+            with self._lock:
+                known = set(self._entries)
+            files = self._scan()
+            with self._lock:
+                # 扫描前已在索引中、扫描时不存在的文件已被其他进程删除
+                for name in known.difference(name for name, _ in files):
+                    self._entries.pop(name, None)
+                self._reset_entries(files)
+            self._evict()
+        except Exception as e:
+            logger.error(f"扫描变换图片缓存失败: {e}")
+        finally:
+            with self._lock:
+                self._reconciling = False
+
+    def invalidate(self, file_uuid: str):
+        """删除某张图片的所有变换缓存（包括其他进程生成、本进程索引中没有的文件）"""
+        prefix = file_uuid + '_'
+        self._ensure_loaded()
+        with self._lock:
+            for name in [name for name in self._entries if name.startswith(prefix)]:
+                self._total_bytes -= self._entries.pop(name)
+
+        try:
+            names = [entry.name for entry in os.scandir(self.cache_dir) if entry.name.startswith(prefix)]
+        except OSError:
+            return
+        for name in names:
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    def stats(self):
+        """获取缓存统计"""
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'size': len(self._entries),
+                'bytes': self._total_bytes,
+                'maxBytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'failures': self.failures,
+                'hitRate': round(self.hits / lookups, 4) if lookups else 0
+            }
+
+# 创建全局单例实例
+variant_cache = VariantCache()
+
+
+def init_variant_cache(server_config: dict):
+    """读取缓存大小配置（MB）"""
+    cache_size = server_config.get('variantCacheSize')
+    if cache_size is not None:
+        variant_cache.max_bytes = int(cache_size) * 1024 * 1024
+    logger.info(f"变换图片缓存大小: {variant_cache.max_bytes} 字节")
@@ -0,0 +1,119 @@
+import gzip
+import hashlib
+import os
+import re
+import threading
+
+from flask import url_for
+
+from utils.basic.logging_utils import get_logger
+from utils.file_utils import get_web_conf_dir, convert_to_ico, FAVICON_PNG_SIZES
+
+logger = get_logger(__name__)
+
+# 指纹文件名形式: <名称>.<12 位哈希><后缀>，如 logo.1a2b3c4d5e6f.png
+FINGERPRINT_LENGTH = 12
+FINGERPRINT_PATTERN = re.compile(r'^(?P<stem>.+)\.(?P<hash>[0-9a-f]{%d})(?P<ext>\.[^.]+)$' % FINGERPRINT_LENGTH)
+
+# 需要预压缩的文本类资源
+PRECOMPRESS_SUFFIXES = ('.svg',)
+
+
+# 网页资源管理类
+class WebAssetManager:
+    """
+    web-conf 资源的内容指纹
+    指纹按 (修改时间, 大小) 缓存，文件被替换后自动重新计算
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fingerprints = {}
+
+    def get_fingerprint(self, filename: str):
+        """获取资源内容指纹，文件不存在返回 None"""
+        path = os.path.join(get_web_conf_dir(), filename)
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            return None
+
+        key = (stat_result.st_mtime_ns, stat_result.st_size)
+        with self._lock:
+            cached = self._fingerprints.get(filename)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(chunk)
+        fingerprint = digest.hexdigest()[:FINGERPRINT_LENGTH]
+
+        with self._lock:
+            self._fingerprints[filename] = (key, fingerprint)
+        return fingerprint
+
+    def refresh(self, filename: str):
+        """资源更新后重新计算指纹，并生成预压缩文件"""
+        with self._lock:
+            self._fingerprints.pop(filename, None)
+
+        path = os.path.join(get_web_conf_dir(), filename)
+        if filename.endswith(PRECOMPRESS_SUFFIXES) and os.path.exists(path):
+            precompress(path)
+
+        fingerprint = self.get_fingerprint(filename)
+        logger.info(f"更新资源指纹 {filename}: {fingerprint}")
+        return fingerprint
+
+    def url_for(self, filename: str):
+        """生成带指纹的资源 url，文件不存在时返回空字符串"""
+        fingerprint = self.get_fingerprint(filename)
+        if fingerprint is None:
+            return ''
+        stem, ext = os.path.splitext(filename)
+        return url_for('i.get_web_file', filename=f"{stem}.{fingerprint}{ext}")
+
+    def parse(self, filename: str):
+        """
+        解析请求的文件名
+        Returns:
+            (真实文件名, 指纹是否与当前内容一致)
+        """
+        match = FINGERPRINT_PATTERN.match(filename)
+        if match is None:
+            return filename, False
+
+        real_name = match.group('stem') + match.group('ext')
+        return real_name, match.group('hash') == self.get_fingerprint(real_name)
+
+
+def precompress(path: str):
+    """生成 gzip 预压缩文件 <文件名>.gz"""
+    with open(path, 'rb') as source:
+        data = source.read()
+    temp_path = path + '.gz.tmp'
+    with open(temp_path, 'wb') as target:
+        target.write(gzip.compress(data, compresslevel=9, mtime=0))
+    os.replace(temp_path, path + '.gz')
+
+# 创建全局单例实例
+web_asset_manager = WebAssetManager()
+
+
+def init_web_assets():
+    """启动时补全预压缩文件和网页图标，请求时不再处理图片"""
+    web_conf_dir = get_web_conf_dir()
+
+    for name in os.listdir(web_conf_dir):
+        path = os.path.join(web_conf_dir, name)
+        if name.endswith(PRECOMPRESS_SUFFIXES) and (
+                not os.path.exists(path + '.gz') or os.path.getmtime(path + '.gz') < os.path.getmtime(path)):
+            precompress(path)
+            logger.info(f"生成预压缩文件 {name}.gz")
+
+    logo_path = os.path.join(web_conf_dir, 'logo.png')
+    if os.path.exists(logo_path) and not all(
+            os.path.exists(os.path.join(web_conf_dir, name)) for name in FAVICON_PNG_SIZES):
+        convert_to_ico(logo_path, os.path.join(web_conf_dir, 'favicon.ico'))
@@ -0,0 +1,40 @@
+from sqlalchemy import Column, Integer, String, func
+from sqlalchemy.dialects.postgresql import TIMESTAMP
+from sqlalchemy.orm import declarative_base
+
+ImageJobBase = declarative_base()
+
+# 任务状态
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_FAILED = 'failed'
+
+
+class ImageJob(ImageJobBase):
+
+    __tablename__ = 'image_jobs'
+
+    jid = Column(Integer, primary_key=True)
+    pic_uuid = Column(String(200), index=True, nullable=False)  # 图片 uuid
+    relative_path = Column(String(200), nullable=False)         # 图片相对路径
+    pic_name = Column(String(200), nullable=False)              # 图片文件名
+    status = Column(String(20), index=True, nullable=False, default=JOB_PENDING)
+    attempts = Column(Integer, nullable=False, default=0)       # 已尝试次数
+    next_run_at = Column(TIMESTAMP(timezone=False, precision=0),  # 下次执行时间
+                         server_default=func.now(), index=True)
+    last_error = Column(String(500))                            # 最后一次失败原因
+    created_at = Column(TIMESTAMP(timezone=False, precision=0),
+                        server_default=func.now())
+
+    def to_dict(self):
+        return {
+            'jid': self.jid,
+            'picUuid': self.pic_uuid,
+            'relativePath': self.relative_path,
+            'picName': self.pic_name,
+            'status': self.status,
+            'attempts': self.attempts,
+            'nextRunAt': str(self.next_run_at),
+            'lastError': self.last_error,
+            'createdAt': str(self.created_at)
+        }
@@ -1,15 +1,18 @@
-from sqlalchemy import Column, Integer, String, BigInteger, text
+from sqlalchemy import Column, Integer, String, BigInteger, Float, Index, text
 from sqlalchemy.dialects.postgresql import TIMESTAMP
 from sqlalchemy.orm import declarative_base
 
 PicBase = declarative_base()
 
+# 由图片内容计算得到的列，内容相同的图片直接复制
+DERIVED_COLUMNS = ('dhash', 'blurhash', 'dominant_color')
+
 
 class Pic(PicBase):
     __tablename__ = 'pics'
 
     pid = Column(Integer, primary_key=True)         # 图片 id
-    uuid = Column(String(200))                      # 图片 uuid
+    uuid = Column(String(200), index=True)          # 图片 uuid
     pic_name = Column(String(200))                  # 图片名称
     pic_original_name = Column(String(200))         # 图片原始名称
     pic_file_size = Column(BigInteger)              # 图片大小
@@ -22,6 +25,26 @@ class Pic(PicBase):
     album_id = Column(Integer)                      # 图片相册id
     pic_love = Column(Integer)                      # 图片是否最爱
     relative_path = Column(String(200))             # 图片相对路径
+    content_hash = Column(String(64), index=True)   # 图片内容 SHA-256
+    dhash = Column(BigInteger, index=True)          # 图片感知哈希 dHash（有符号 64 位）
+    taken_time = Column(TIMESTAMP(timezone=False, precision=0))                   # 拍摄时间（EXIF）
+    orientation = Column(Integer)                   # 图片方向（EXIF 1-8）
+    camera_model = Column(String(100), index=True)  # 相机型号（EXIF）
+    has_gps = Column(Integer)                       # 是否有 GPS 信息
+    blurhash = Column(String(40))                   # 缩略图加载前显示的 BlurHash 占位
+    dominant_color = Column(String(7))              # 图片平均颜色 #rrggbb
+    width = Column(Integer, index=True)             # 图片宽度（像素）
+    height = Column(Integer, index=True)            # 图片高度（像素）
+    pixels = Column(BigInteger)                     # 像素数量 width * height，按分辨率排序
+    aspect_ratio = Column(Float, index=True)        # 宽高比 width / height，按横竖筛选
+
+    # 按相册 / 最爱浏览时按拍摄时间、分辨率排序和筛选
+    __table_args__ = (
+        Index('ix_pics_album_id_taken_time', 'album_id', 'taken_time'),
+        Index('ix_pics_pic_love_taken_time', 'pic_love', 'taken_time'),
+        Index('ix_pics_album_id_pixels', 'album_id', 'pixels'),
+        Index('ix_pics_pic_love_pixels', 'pic_love', 'pixels'),
+    )
 
     def to_dict(self):
         return {
@@ -37,5 +60,15 @@ class Pic(PicBase):
             'picDesc': self.pic_desc,
             'albumId': self.album_id,
             'picLove': self.pic_love,
-            'relativePath': self.relative_path
+            'relativePath': self.relative_path,
+            'contentHash': self.content_hash,
+            'dhash': self.dhash,
+            'takenTime': str(self.taken_time) if self.taken_time else None,
+            'orientation': self.orientation,
+            'cameraModel': self.camera_model,
+            'hasGps': self.has_gps,
+            'blurhash': self.blurhash,
+            'dominantColor': self.dominant_color,
+            'width': self.width,
+            'height': self.height
         }
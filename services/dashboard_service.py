@@ -9,6 +9,12 @@ from datetime import datetime, date, time, timedelta
 from sqlalchemy import func
 
 from manager.db_manager import get_session
+from manager.image_worker_manager import image_worker
+from manager.phash_index_manager import phash_index
+from manager.pic_cache_manager import pic_path_cache
+from manager.thumbnail_cache_manager import thumbnail_cache
+from manager.upload_admission_manager import upload_admission
+from manager.variant_cache_manager import variant_cache
 from models.pic.album import Album
 from models.pic.pic import Pic
 from utils import ResponseFactory
@@ -75,6 +81,14 @@ class DashBoardService:
                     },
                     'imgPieData': chart_data,
                     'uploadTrend': upload_trend_data,
+                    'cache': {
+                        'picPath': pic_path_cache.stats(),
+                        'variant': variant_cache.stats(),
+                        'thumbnail': thumbnail_cache.stats()
+                    },
+                    'imageWorker': image_worker.stats(),
+                    'phashIndex': phash_index.stats(),
+                    'uploadAdmission': upload_admission.stats(),
                     'messageType': 'success'
                 })
             except Exception as e:
@@ -4,11 +4,17 @@ from datetime import datetime
 from sqlalchemy import func
 
 from manager.db_manager import get_session
+from manager.phash_index_manager import phash_index
+from manager.pic_cache_manager import pic_path_cache
+from manager.storage_manager import storage_manager
+from manager.thumbnail_cache_manager import thumbnail_cache
+from manager.variant_cache_manager import variant_cache
 from models.pic.pic import Pic
 from models.pic.album import Album
 from utils import ResponseFactory
 from utils.basic.logging_utils import get_logger
-from utils.file_utils import get_images_dir
+from utils.file_utils import get_images_dir, remove_thumbnail
+from utils.thumbnail_utils import remove_pyramid
 
 logger = get_logger(__name__)
 
@@ -139,11 +145,16 @@ class AlbumService:
                     if pic_list is not None:
                         for pic in pic_list:
                             db.delete(pic)
+                            pic_path_cache.invalidate(pic.uuid)
+                            variant_cache.invalidate(pic.uuid)
+                            thumbnail_cache.invalidate(pic.uuid)
 
-                            pic_folder = os.path.join(str(get_images_dir()), pic.relative_path)
-                            pic_file = os.path.join(pic_folder, pic.uuid + pic.pic_suffix)
-                            if os.path.exists(pic_file):
-                                os.remove(pic_file)
+                            # 相同内容的图片共用硬链接，最后一个引用删除时文件内容才释放
+                            storage_manager.remove_original(pic.relative_path, pic.uuid + pic.pic_suffix)
+
+                            remove_thumbnail(pic.uuid + pic.pic_suffix)
+                            remove_pyramid(pic.uuid)
+                            phash_index.remove(pic.pid)
 
                     db.commit()
 
@@ -1,16 +1,46 @@
 import os
+from datetime import datetime, timedelta
 
 from flask import url_for
 
+from manager.atlas_manager import atlas_manager, ATLAS_MAX_TILES
 from manager.db_manager import get_session
+from manager.image_worker_manager import image_worker
+from manager.phash_index_manager import phash_index
+from manager.pic_cache_manager import pic_path_cache
+from manager.storage_manager import storage_manager
+from manager.thumbnail_cache_manager import thumbnail_cache
+from manager.variant_cache_manager import variant_cache
 from models.pic.pic import Pic
 from models.pic.album import Album
 from utils import ResponseFactory
 from utils.basic.logging_utils import get_logger
-from utils.file_utils import get_images_dir, get_app_dir
+from utils.file_utils import get_images_dir, remove_thumbnail
+from utils.sign_utils import sign_url
+from utils.thumbnail_utils import get_srcset, remove_pyramid
 
 logger = get_logger(__name__)
 
+
+# 宽高比在 1 ± SQUARE_TOLERANCE 之间视为方图
+SQUARE_TOLERANCE = 0.02
+
+ORIENTATION_FILTERS = {
+    'landscape': Pic.aspect_ratio > 1 + SQUARE_TOLERANCE,
+    'portrait': Pic.aspect_ratio < 1 - SQUARE_TOLERANCE,
+    'square': Pic.aspect_ratio.between(1 - SQUARE_TOLERANCE, 1 + SQUARE_TOLERANCE)
+}
+
+
+def parse_date(value: str):
+    """解析 YYYY-MM-DD 查询参数（格式错误时 request.args.get 返回默认值）"""
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def parse_date_end(value: str):
+    """结束日期包含当天"""
+    return parse_date(value) + timedelta(days=1)
+
 # 图片服务类
 class PicService:
     """
@@ -34,9 +64,14 @@ class PicService:
     """
         获取图片列表
         支持分页和相册筛选
+        atlas 为 True 时额外返回该页缩略图拼图
+        taken_from / taken_to 按拍摄时间筛选（使用相册 / 最爱与拍摄时间的组合索引）
+        min_width / min_height / orientation 按尺寸和横竖筛选
     """
     @staticmethod
-    def get_pic_list(page: int, per_page: int, album_id: int, order: str, keyword: str):
+    def get_pic_list(page: int, per_page: int, album_id: int, order: str, keyword: str, atlas: bool = False,
+                     taken_from: datetime = None, taken_to: datetime = None,
+                     min_width: int = None, min_height: int = None, orientation: str = None):
         # 查询数据表
         with get_session() as db:
             try:
@@ -58,11 +93,17 @@ class PicService:
                     'newest': Pic.upload_time.desc(),
                     'earliest': Pic.upload_time.asc(),
                     'utmost': Pic.pic_file_size.desc(),  # 假设size字段表示图片大小
-                    'least': Pic.pic_file_size.asc()
+                    'least': Pic.pic_file_size.asc(),
+                    'taken': (Pic.taken_time.desc(), Pic.pid.desc()),
+                    'takenEarliest': (Pic.taken_time.asc(), Pic.pid.asc()),
+                    'resolution': (Pic.pixels.desc(), Pic.pid.desc()),
+                    'resolutionLeast': (Pic.pixels.asc(), Pic.pid.asc())
                 }
 
                 # 获取排序参数，默认为newest
                 order_by = order_mapping.get(order, Pic.upload_time.desc())
+                if not isinstance(order_by, tuple):
+                    order_by = (order_by,)
 
                 # 构建查询
                 if album_id != 0:
@@ -74,8 +115,29 @@ class PicService:
                 if keyword:
                     query = query.filter(Pic.pic_desc.contains(keyword))
 
+                # 按拍摄时间筛选
+                if taken_from is not None:
+                    query = query.filter(Pic.taken_time >= taken_from)
+                if taken_to is not None:
+                    query = query.filter(Pic.taken_time < taken_to)
+
+                # 按尺寸和横竖筛选
+                if min_width is not None:
+                    query = query.filter(Pic.width >= min_width)
+                if min_height is not None:
+                    query = query.filter(Pic.height >= min_height)
+                if orientation in ORIENTATION_FILTERS:
+                    query = query.filter(ORIENTATION_FILTERS[orientation])
+                # 按分辨率排序时不列出尺寸未知的图片，排序可以直接使用相册与像素数量的组合索引
+                if order in ('resolution', 'resolutionLeast'):
+                    query = query.filter(Pic.pixels.isnot(None))
+
+                if any(value is not None for value in (taken_from, taken_to, min_width, min_height)) \
+                        or orientation in ORIENTATION_FILTERS or order in ('resolution', 'resolutionLeast'):
+                    total = query.count()
+
                 # 执行查询
-                images = query.order_by(order_by) \
+                images = query.order_by(*order_by) \
                     .offset((page - 1) * per_page) \
                     .limit(per_page) \
                     .all()
@@ -84,21 +146,43 @@ class PicService:
                 for img in images:
                     album_name = db.query(Album).filter(Album.aid == img.album_id).first().album_name
                     # 使用 url_for 自动生成完整 URL
-                    file_url = url_for("i.serve_file", filename=(img.uuid + img.pic_suffix))
-                    thumbnail_url = url_for("i.serve_thumbnail", filename=(img.uuid + img.pic_suffix))
+                    file_url = sign_url(url_for("i.serve_file", filename=(img.uuid + img.pic_suffix)))
+                    thumbnail_url = sign_url(url_for("i.serve_thumbnail", filename=(img.uuid + img.pic_suffix)))
                     img_object = img.to_dict()
                     img_object['url'] = file_url
                     img_object['albumName'] = album_name
                     img_object['thumbnailUrl'] = thumbnail_url
+                    # 多尺寸缩略图 {最长边: url}，客户端按显示尺寸选择
+                    img_object['srcset'] = {
+                        size: sign_url(url_for("i.serve_thumbnail_size", size=size, filename=name))
+                        for size, name in get_srcset(img.uuid, img.pic_size)
+                    }
                     image_list.append(img_object)
 
-                logger.info("获取图片列表成功")
-                return ResponseFactory.success(data={
+                result = {
                     "page": page,
                     "perPage": per_page,
                     "total": total,
                     "images": image_list
-                })
+                }
+
+                # 缩略图拼图，一次请求获取整页缩略图；每页数量超过上限时不生成，客户端逐张加载
+                if atlas and images and len(images) <= ATLAS_MAX_TILES:
+                    # 缩略图还在生成的图片不放入拼图，生成后拼图文件名随之改变
+                    thumbnails = [(img.uuid + img.pic_suffix, img.uuid) for img in images
+                                  if not image_worker.is_pending(img.uuid)]
+                    atlas_name = atlas_manager.make_name(album_id, order, page, per_page, keyword, thumbnails)
+                    atlas_meta = atlas_manager.get_or_create(atlas_name, thumbnails)
+                    if atlas_meta is not None:
+                        result['atlas'] = {
+                            'url': sign_url(url_for("i.serve_atlas", filename=atlas_meta['filename'])),
+                            'width': atlas_meta['width'],
+                            'height': atlas_meta['height'],
+                            'tiles': atlas_meta['tiles']
+                        }
+
+                logger.info("获取图片列表成功")
+                return ResponseFactory.success(data=result)
 
             except Exception as e:
                 logger.error(f"获取图片列表失败: {e}")
@@ -152,6 +236,86 @@ class PicService:
                     'messageType': 'error'
                 })
 
+    """
+        查询近似图片
+        按 dHash 汉明距离从近到远
+    """
+    @staticmethod
+    def get_similar_pics(pid: int, distance: int = None):
+        if not phash_index.ready:
+            return ResponseFactory.success(data={
+                'message': 'pic.message.similarIndexLoading',
+                'messageType': 'warning'
+            })
+
+        matches = phash_index.query(pid, distance)
+        if matches is None:
+            return ResponseFactory.success(data={
+                'message': 'pic.message.picHashMissing',
+                'messageType': 'warning'
+            })
+
+        with get_session() as db:
+            try:
+                pics = PicService._load_pic_briefs(db, [other for other, _ in matches])
+                return ResponseFactory.success(data={
+                    'pid': pid,
+                    'images': [dict(pics[other], distance=other_distance)
+                               for other, other_distance in matches if other in pics]
+                })
+            except Exception as e:
+                logger.error(f"查询近似图片失败: {e}")
+                return ResponseFactory.success(data={
+                    'message': e,
+                    'messageType': 'error'
+                })
+
+    """
+        近似重复图片分组
+        每组至少两张，按组内图片数量降序分页
+    """
+    @staticmethod
+    def get_duplicate_clusters(page: int, per_page: int):
+        if not phash_index.ready:
+            return ResponseFactory.success(data={
+                'message': 'pic.message.similarIndexLoading',
+                'messageType': 'warning'
+            })
+
+        clusters = phash_index.clusters()
+        page_clusters = clusters[(page - 1) * per_page:page * per_page]
+        with get_session() as db:
+            try:
+                pics = PicService._load_pic_briefs(db, [pid for cluster in page_clusters for pid in cluster])
+                return ResponseFactory.success(data={
+                    'page': page,
+                    'perPage': per_page,
+                    'total': len(clusters),
+                    'distance': phash_index.distance,
+                    'clusters': [[pics[pid] for pid in cluster if pid in pics] for cluster in page_clusters]
+                })
+            except Exception as e:
+                logger.error(f"获取重复图片失败: {e}")
+                return ResponseFactory.success(data={
+                    'message': e,
+                    'messageType': 'error'
+                })
+
+    @staticmethod
+    def _load_pic_briefs(db, pids: list):
+        """近似图片结果只返回缩略图需要的字段"""
+        if not pids:
+            return {}
+        rows = db.query(Pic.pid, Pic.uuid, Pic.pic_name, Pic.pic_suffix, Pic.album_id) \
+            .filter(Pic.pid.in_(pids)).all()
+        return {row.pid: {
+            'pid': row.pid,
+            'uuid': row.uuid,
+            'picName': row.pic_name,
+            'albumId': row.album_id,
+            'thumbnailUrl': sign_url(url_for("i.serve_thumbnail", filename=(row.uuid + row.pic_suffix)))
+        } for row in rows}
+
     """
         删除图片
     """
@@ -170,13 +334,18 @@ class PicService:
 
                         url = os.path.join(str(target_folder), str(img.uuid + img.pic_suffix))
 
-                        if os.path.exists(url):
+                        # 使用远程存储时本地可能没有原图
+                        if os.path.exists(url) or storage_manager.remote:
                             db.delete(img)
                             db.commit()
-                            os.remove(url)
-                            thumbnail_url = os.path.join(get_app_dir(), 'images/thumbnail', str(img.uuid + img.pic_suffix))
-                            if os.path.exists(thumbnail_url):
-                                os.remove(thumbnail_url)
+                            pic_path_cache.invalidate(img.uuid)
+                            variant_cache.invalidate(img.uuid)
+                            thumbnail_cache.invalidate(img.uuid)
+                            # 相同内容的图片共用硬链接，最后一个引用删除时文件内容才释放
+                            storage_manager.remove_original(img.relative_path, img.uuid + img.pic_suffix)
+                            remove_thumbnail(img.uuid + img.pic_suffix)
+                            remove_pyramid(img.uuid)
+                            phash_index.remove(img.pid)
 
                 logger.info("删除图片成功")
                 return ResponseFactory.success(data={
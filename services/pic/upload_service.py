@@ -1,20 +1,298 @@
 import os.path
 import datetime
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor
 
 from flask import url_for
+from sqlalchemy import insert
+from werkzeug.datastructures import FileStorage
 from werkzeug.utils import secure_filename
 
 from manager.db_manager import get_session
-from models.pic.pic import Pic
+from manager.image_worker_manager import image_worker, save_derivative_results
+from manager.phash_index_manager import phash_index
+from manager.pic_cache_manager import pic_path_cache
+from manager.storage_manager import storage_manager
+from manager.upload_session_manager import upload_session_manager, UploadSessionError
+from models.pic.pic import Pic, DERIVED_COLUMNS
 from models.pic.album import Album
 from utils import ResponseFactory
 from utils.basic.logging_utils import get_logger
-from utils.file_utils import get_images_dir, generate_uuid_high_precision, get_image_info, get_app_dir, generate_thumbnail_pil
+from utils.file_utils import get_images_dir, generate_uuid7, remove_file_with_siblings, \
+    link_file_with_siblings, allowed_file, get_thumbnail_path, find_thumbnail_path
+from utils.exif_utils import EMPTY_EXIF
+from utils.ingest_utils import ingest_stream, generate_derivatives, get_dimension_values, IngestError
+from utils.sign_utils import sign_url
+from utils.thumbnail_utils import get_pyramid_options, link_pyramid
 
 logger = get_logger(__name__)
 
+
+def get_file_uuid(path: str):
+    """从 <uuid><后缀> 形式的路径取 uuid"""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def get_derived_columns():
+    return [getattr(Pic, column) for column in DERIVED_COLUMNS]
+
+
+def get_derived_values(row):
+    return {column: getattr(row, column) for column in DERIVED_COLUMNS}
+
+
+def get_exif_values(img_info: dict, upload_time):
+    """EXIF 列的值，没有拍摄时间时使用上传时间（按拍摄时间浏览时排在上传当天）"""
+    exif = dict(img_info.get('exif') or EMPTY_EXIF)
+    exif['taken_time'] = exif['taken_time'] or upload_time
+    return exif
+
+
+def get_relative_path():
+    """上传图片按日期存放: 年/月/日"""
+    return datetime.datetime.today().strftime("%Y/%m/%d")
+
+
+# 单次批量上传最多处理的文件数
+MAX_BATCH_FILES = 1000
+
+# 进程池未启动时批量生成缩略图的线程数
+BATCH_THUMBNAIL_THREADS = 4
+
 # 图片上传服务类
 class UploadService:
+    @staticmethod
+    def find_existing_blob(db, content_hash: str, file_size: int):
+        """
+        查找内容相同且文件仍然存在的图片
+        Returns:
+            (原图路径, 缩略图路径, 可复制的列)，缩略图未生成时为 None；没有相同图片返回 None
+        """
+        images_dir = get_images_dir()
+        rows = (
+            db.query(Pic.uuid, Pic.pic_suffix, Pic.relative_path, *get_derived_columns())
+            .filter(Pic.content_hash == content_hash, Pic.pic_file_size == file_size)
+            .order_by(Pic.pid)
+            .limit(10)
+            .all()
+        )
+        for row in rows:
+            filename = row.uuid + row.pic_suffix
+            file_path = os.path.join(images_dir, row.relative_path, filename)
+            if os.path.exists(file_path):
+                thumbnail_path = find_thumbnail_path(filename)
+                return (file_path, thumbnail_path if os.path.exists(thumbnail_path) else None,
+                        get_derived_values(row))
+        return None
+
+    @staticmethod
+    def find_existing_blobs(db, sizes: dict):
+        """
+        批量查找内容相同且文件仍然存在的图片（一次查询）
+        Args:
+            sizes: {内容哈希: 文件大小}
+        Returns:
+            {内容哈希: (原图路径, 缩略图路径, 可复制的列)}
+        """
+        images_dir = get_images_dir()
+        blobs = {}
+        if not sizes:
+            return blobs
+
+        rows = (
+            db.query(Pic.content_hash, Pic.pic_file_size, Pic.uuid, Pic.pic_suffix, Pic.relative_path,
+                     *get_derived_columns())
+            .filter(Pic.content_hash.in_(list(sizes)))
+            .order_by(Pic.pid)
+            .all()
+        )
+        for row in rows:
+            if row.content_hash in blobs or row.pic_file_size != sizes[row.content_hash]:
+                continue
+            filename = row.uuid + row.pic_suffix
+            file_path = os.path.join(images_dir, row.relative_path, filename)
+            if os.path.exists(file_path):
+                thumbnail_path = find_thumbnail_path(filename)
+                blobs[row.content_hash] = (file_path, thumbnail_path if os.path.exists(thumbnail_path) else None,
+                                           get_derived_values(row))
+        return blobs
+
+    @staticmethod
+    def make_pic_row(file_uuid: str, file_suffix: str, original_name: str, img_info: dict, album_id: int,
+                     relative_path: str, upload_time, derived: dict = None):
+        """
+        批量插入用的图片记录
+        album_id 为 0 时放入默认相册并设为最爱
+        """
+        return {
+            'uuid': file_uuid,
+            'pic_name': file_uuid + file_suffix,
+            'pic_original_name': original_name,
+            'pic_file_size': img_info['file_size'],
+            'pic_type': img_info['mime'],
+            'pic_size': f"{img_info['width']}x{img_info['height']}",
+            **get_dimension_values(img_info['width'], img_info['height'], img_info['exif']['orientation']),
+            'pic_suffix': file_suffix,
+            'upload_time': upload_time,
+            'album_id': 1 if album_id == 0 else album_id,
+            'relative_path': relative_path,
+            'content_hash': img_info['sha256'],
+            'pic_desc': '',
+            'pic_love': 0 if album_id != 0 else 1,
+            **get_exif_values(img_info, upload_time),
+            **{column: None for column in DERIVED_COLUMNS},
+            **(derived or {})
+        }
+
+    @staticmethod
+    def handle_batch_upload(files, album_id):
+        """
+        批量上传
+        相册只校验一次，所有图片记录一次插入；单个文件失败不影响其他文件
+        Args:
+            files: (原始文件名, 文件流) 的可迭代对象
+        Returns:
+            每个文件的上传结果
+        """
+        aid = 1 if album_id == 0 else album_id
+        with get_session() as db:
+            if album_id is None or db.query(Album.aid).filter(Album.aid == aid).first() is None:
+                logger.error(f"相册不存在，无法上传")
+                return ResponseFactory.success(data={
+                    "message": 'upload.message.AlbumDoesNotExist',
+                    'messageType': 'error'
+                })
+
+        images_dir = get_images_dir()
+        relative_path = get_relative_path()
+        target_folder = os.path.join(images_dir, relative_path)
+        os.makedirs(target_folder, exist_ok=True)
+
+        results = []
+        accepted = []
+
+        # 逐个读取上传流写入文件（请求体只能顺序读取）
+        try:
+            for index, (origin_filename, stream) in enumerate(files):
+                result = {'originalName': origin_filename}
+                results.append(result)
+
+                filename = secure_filename(origin_filename or '')
+                if index >= MAX_BATCH_FILES:
+                    result.update(message='upload.message.tooManyFiles', messageType='error')
+                    continue
+                if not allowed_file(filename):
+                    result.update(message='upload.message.fileExtensionNotAllowed', messageType='error')
+                    continue
+
+                file_uuid = generate_uuid7()
+                file_suffix = os.path.splitext(filename)[1]
+                filename = file_uuid + file_suffix
+                file_path = os.path.join(target_folder, filename)
+                try:
+                    img_info = ingest_stream(stream, file_path)
+                except IngestError as e:
+                    result.update(message=e.message, messageType='error')
+                    continue
+
+                accepted.append((result, file_uuid, file_suffix, filename, file_path, img_info))
+        except Exception as e:
+            # tar 数据损坏或连接中断，已经接收的文件继续处理
+            logger.error(f"读取批量上传数据失败: {e}")
+            results.append({'message': 'upload.message.batchStreamBroken', 'messageType': 'error'})
+
+        # 相同内容已存在或本批次内重复时共用文件
+        linked_thumbnails = {}
+        derived = {}
+        with get_session() as db:
+            blobs = UploadService.find_existing_blobs(
+                db, {img_info['sha256']: img_info['file_size'] for *_, img_info in accepted})
+
+        for result, file_uuid, file_suffix, filename, file_path, img_info in accepted:
+            blob = blobs.get(img_info['sha256'])
+            try:
+                if blob is None:
+                    blobs[img_info['sha256']] = (file_path, None, {})
+                    continue
+                link_file_with_siblings(blob[0], file_path)
+                if blob[1] is not None:
+                    linked_thumbnails[file_uuid] = (blob[1], filename)
+                    derived[file_uuid] = blob[2]
+            except OSError as e:
+                logger.error(f"共用文件失败 {file_path}: {e}")
+
+        now = datetime.datetime.now()
+        pic_rows = [
+            UploadService.make_pic_row(file_uuid, file_suffix, result['originalName'], img_info, album_id,
+                                       relative_path, now, derived.get(file_uuid))
+            for result, file_uuid, file_suffix, filename, file_path, img_info in accepted
+        ]
+        jobs = [(file_uuid, relative_path, filename)
+                for _, file_uuid, _, filename, _, _ in accepted if file_uuid not in linked_thumbnails]
+
+        # 所有图片记录和缩略图任务一次提交
+        try:
+            with get_session() as db:
+                if pic_rows:
+                    db.execute(insert(Pic), pic_rows)
+                queued = image_worker.enqueue_many(db, jobs)
+                db.commit()
+        except Exception as e:
+            logger.error(f"批量保存图片记录失败: {e}")
+            for result, *_, file_path, _ in accepted:
+                remove_file_with_siblings(file_path)
+                result.update(message='upload.message.saveFailed', messageType='error')
+            accepted = []
+            jobs = []
+            linked_thumbnails = {}
+            queued = True
+
+        storage_manager.store_originals([(relative_path, filename, file_path, img_info['mime'])
+                                         for _, _, _, filename, file_path, img_info in accepted])
+
+        for result, file_uuid, file_suffix, filename, file_path, img_info in accepted:
+            pic_path_cache.put(file_uuid, (relative_path, file_suffix))
+            result.update(
+                filename=filename,
+                url=sign_url(url_for("i.serve_file", filename=filename)),
+                thumbnail=sign_url(url_for("i.serve_thumbnail", filename=filename)),
+                messageType='success'
+            )
+
+        # 缩略图: 共用已有缩略图，其余交给后台进程或线程池生成
+        for thumbnail, filename in linked_thumbnails.values():
+            try:
+                link_file_with_siblings(thumbnail, get_thumbnail_path(filename, create=True))
+                link_pyramid(get_file_uuid(thumbnail), get_file_uuid(filename))
+            except OSError as e:
+                logger.error(f"共用缩略图失败 {filename}: {e}")
+        phash_index.add_by_uuids(list(linked_thumbnails))
+
+        if queued:
+            if jobs:
+                image_worker.notify(*(file_uuid for file_uuid, _, _ in jobs))
+        else:
+            def make_thumbnail(job):
+                pic_uuid, _, pic_name = job
+                try:
+                    save_derivative_results(pic_uuid, generate_derivatives(
+                        os.path.join(target_folder, pic_name), get_thumbnail_path(pic_name, create=True),
+                        pyramid=get_pyramid_options()))
+                except Exception as e:
+                    logger.error(f"生成缩略图失败 {pic_name}: {e}")
+
+            with ThreadPoolExecutor(max_workers=BATCH_THUMBNAIL_THREADS) as executor:
+                list(executor.map(make_thumbnail, jobs))
+
+        succeeded = len(accepted)
+        logger.info(f"批量上传完成，成功 {succeeded} 张，失败 {len(results) - succeeded} 张")
+        return ResponseFactory.success(data={
+            'results': results,
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded,
+            'messageType': 'success' if succeeded else 'error'
+        })
+
     @staticmethod
     def handle_upload(file, album_id):
 
@@ -27,6 +305,7 @@ class UploadService:
 
         origin_file_path = None
         origin_file_id = None
+        thumbnail_path = None
         with get_session() as db:
             try:
                 target_folder = db.query(Album).filter(
@@ -46,7 +325,7 @@ class UploadService:
                 filename = secure_filename(file.filename)
 
                 # 更改文件名称
-                file_uuid = generate_uuid_high_precision(filename)
+                file_uuid = generate_uuid7()
                 file_suffix = os.path.splitext(filename)[1]
 
                 # 生成日期路径
@@ -57,51 +336,74 @@ class UploadService:
                 target_folder = os.path.join(get_images_dir(), relative_path)
                 os.makedirs(target_folder, exist_ok=True)
 
-                # 保存文件
+                # 单次读取上传流写入文件，同时识别图片头和计算校验和
                 filename = file_uuid + file_suffix
                 file_path = os.path.join(target_folder, filename)
-                file.save(file_path)
-                logger.info(f"文件保存成功，文件路径为: {file_path}")
+                img_info = ingest_stream(file.stream, file_path)
+                origin_file_path = file_path
+                logger.info(f"文件保存成功，文件路径为: {file_path}，{img_info}")
 
-                # 图片信息
-                img_info = get_image_info(file_path)
-                logger.info(img_info)
+                # 相同内容已经存在时共用已有文件和缩略图，只新增数据库记录
+                existing_thumbnail = None
+                existing_derived = {}
+                existing = UploadService.find_existing_blob(db, img_info['sha256'], img_info['file_size'])
+                if existing is not None:
+                    link_file_with_siblings(existing[0], file_path)
+                    existing_thumbnail = existing[1]
+                    existing_derived = existing[2] if existing_thumbnail is not None else {}
+                    logger.info(f"图片内容已存在，共用文件: {existing[0]}")
 
                 # 数据库操作
                 pic = Pic()
                 pic.uuid = file_uuid
                 pic.pic_name = filename
                 pic.pic_original_name = origin_filename
-                pic.pic_file_size = img_info.get('file_size')
-                pic.pic_type = file.content_type
-                pic.pic_size = img_info.get('dimensions')
+                pic.pic_file_size = img_info['file_size']
+                pic.pic_type = img_info['mime'] or file.content_type
+                pic.pic_size = f"{img_info['width']}x{img_info['height']}"
+                for column, value in get_dimension_values(img_info['width'], img_info['height'], img_info['exif']['orientation']).items():
+                    setattr(pic, column, value)
                 pic.pic_suffix = file_suffix
                 pic.upload_time = datetime.datetime.now()
                 pic.album_id = 1 if album_id == 0 else album_id
                 pic.relative_path = relative_path
+                pic.content_hash = img_info['sha256']
+                for column, value in get_exif_values(img_info, pic.upload_time).items():
+                    setattr(pic, column, value)
+                for column, value in existing_derived.items():
+                    setattr(pic, column, value)
                 pic.pic_desc = ''
                 pic.pic_love = 0 if album_id != 0 else 1
 
                 db.add(pic)
+
+                # 缩略图交给后台进程生成，任务与图片记录一起提交
+                queued = existing_thumbnail is None and image_worker.enqueue(db, file_uuid, relative_path, filename)
                 db.commit()
+                pic_path_cache.put(file_uuid, (relative_path, file_suffix))
+                # 使用远程存储时上传原图，本地文件保留用于生成缩略图
+                storage_manager.store_original(relative_path, filename, file_path, pic.pic_type)
 
-                origin_file_path = file_path
                 origin_file_id = pic.pid
 
                 # 使用 url_for 自动生成完整 URL
-                file_url = url_for("i.serve_file", filename=filename)
+                file_url = sign_url(url_for("i.serve_file", filename=filename))
 
-                # 生成缩略图
-                images_folder = get_images_dir()
-                thumbnail_folder = os.path.join(images_folder, 'thumbnail')
-                if not os.path.exists(thumbnail_folder):
-                    os.makedirs(thumbnail_folder, exist_ok=True, mode=0o777)
-
-                output_path = os.path.join(thumbnail_folder, filename)
-                generate_thumbnail_pil(file_path, output_path)
+                if existing_thumbnail is not None:
+                    thumbnail_path = get_thumbnail_path(filename, create=True)
+                    link_file_with_siblings(existing_thumbnail, thumbnail_path)
+                    link_pyramid(get_file_uuid(existing_thumbnail), file_uuid)
+                    phash_index.add(pic.pid, pic.dhash)
+                elif queued:
+                    image_worker.notify(file_uuid)
+                else:
+                    # 进程池未启动时同步生成缩略图和 avif / webp 副本（只解码一次原图）
+                    thumbnail_path = get_thumbnail_path(filename, create=True)
+                    save_derivative_results(file_uuid, generate_derivatives(file_path, thumbnail_path,
+                                                                            pyramid=get_pyramid_options()), db)
 
                 # 缩略图 url
-                thumbnail_url = url_for("i.serve_thumbnail", filename=filename)
+                thumbnail_url = sign_url(url_for("i.serve_thumbnail", filename=filename))
 
                 # 上传成功
                 logger.info(f"图片上传成功，文件路径为: {file_path}")
@@ -111,19 +413,96 @@ class UploadService:
                     'thumbnail': thumbnail_url
                 })
 
+            except IngestError as e:
+                # 不是允许的图片，文件未写入
+                logger.error(f"图片校验失败: {e.message}")
+                return ResponseFactory.success(data={
+                    "message": e.message,
+                    'messageType': 'error'
+                })
+
             except Exception as e:
                 if origin_file_path is not None:
                     # 删除图片
-                    os.remove(origin_file_path)
+                    remove_file_with_siblings(origin_file_path)
                     logger.info(f"删除文件: {origin_file_path}")
 
+                if thumbnail_path is not None:
+                    remove_file_with_siblings(thumbnail_path)
+
                 if origin_file_id is not None:
                     # 删除数据库记录
                     db.query(Pic).filter(Pic.pid == origin_file_id).delete()
                     db.commit()
+                    pic_path_cache.invalidate(file_uuid)
 
                 logger.error(f"图片上传失败: {e}")
                 return ResponseFactory.success(data={
                     "message": e,
                     'messageType': 'error'
-                })
\ No newline at end of file
+                })
+
+    """
+        断点续传: 创建会话 -> 按偏移量上传分块 -> 完成
+    """
+    @staticmethod
+    def upload_session_error(e: UploadSessionError):
+        return ResponseFactory.error(data={
+            'message': e.message,
+            'offset': e.offset,
+            'messageType': 'error'
+        }, status=e.status)
+
+    @staticmethod
+    def create_upload_session(filename: str, size: int, album_id: int):
+        if not allowed_file(secure_filename(filename or '')):
+            logger.error("文件扩展名不允许")
+            return ResponseFactory.error(data={"message": "upload.message.fileExtensionNotAllowed"})
+
+        try:
+            return ResponseFactory.success(data=upload_session_manager.create(filename, size, album_id))
+        except UploadSessionError as e:
+            return UploadService.upload_session_error(e)
+
+    @staticmethod
+    def get_upload_session(session_id: str):
+        try:
+            return ResponseFactory.success(data=upload_session_manager.status(session_id))
+        except UploadSessionError as e:
+            return UploadService.upload_session_error(e)
+
+    @staticmethod
+    def append_upload_session(session_id: str, offset: int, stream):
+        if offset is None:
+            return ResponseFactory.error(data={"message": "upload.message.offsetMismatch"})
+
+        try:
+            return ResponseFactory.success(data=upload_session_manager.append(session_id, offset, stream))
+        except UploadSessionError as e:
+            return UploadService.upload_session_error(e)
+
+    @staticmethod
+    def cancel_upload_session(session_id: str):
+        try:
+            upload_session_manager.remove(session_id)
+            return ResponseFactory.success(data={'sessionId': session_id})
+        except UploadSessionError as e:
+            return UploadService.upload_session_error(e)
+
+    @staticmethod
+    def finalize_upload_session(session_id: str):
+        """数据接收完成后按普通上传处理暂存文件，成功后删除会话"""
+        try:
+            with upload_session_manager.session_lock(session_id):
+                meta, stream = upload_session_manager.open_completed(session_id)
+                with stream:
+                    file = FileStorage(stream=stream, filename=meta['filename'],
+                                       content_type=mimetypes.guess_type(meta['filename'])[0])
+                    result = UploadService.handle_upload(file, meta['albumId'])
+
+                if result.data.get('filename') is not None:
+                    upload_session_manager.remove(session_id)
+                    logger.info(f"上传会话 {session_id} 完成")
+                return result
+        except UploadSessionError as e:
+            return UploadService.upload_session_error(e)
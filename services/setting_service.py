@@ -1,13 +1,12 @@
 import os
 
-from flask import url_for
-
 from manager.db_manager import get_session
 from manager.user_manager import UserManager
+from manager.web_asset_manager import web_asset_manager
 from models.config import Configs
 from utils import ResponseFactory
 from utils.basic.logging_utils import get_logger
-from utils.file_utils import get_app_dir, convert_to_ico, get_web_conf_dir
+from utils.file_utils import get_app_dir, convert_to_ico, get_web_conf_dir, FAVICON_PNG_SIZES
 
 logger = get_logger(__name__)
 
@@ -39,16 +38,21 @@ class SettingService:
 
                 logger.warning(f"获取网页设置信息成功: {configs}")
 
-                web_logo_url = url_for('i.get_web_file', filename='logo.png')
-                web_svg_logo_url = url_for('i.get_web_file', filename='logo.svg')
-                web_login_bg_url = url_for('i.get_web_file', filename='login-bg.jpg')
-                web_background_url = url_for('i.get_web_file', filename='background.jpg')
+                # 带内容指纹的 url，可以长期缓存
+                web_logo_url = web_asset_manager.url_for('logo.png')
+                web_svg_logo_url = web_asset_manager.url_for('logo.svg')
+                web_login_bg_url = web_asset_manager.url_for('login-bg.jpg')
+                web_background_url = web_asset_manager.url_for('background.jpg')
+                web_favicon_url = web_asset_manager.url_for('favicon.ico')
+                web_icon_urls = {name: web_asset_manager.url_for(name) for name in FAVICON_PNG_SIZES}
                 return ResponseFactory.success(data={
                     'site': configs,
                     'webLogoUrl': web_logo_url,
                     'webSVGLogoUrl': web_svg_logo_url,
                     'webLoginBgUrl': web_login_bg_url,
-                    'webBackgroundUrl': web_background_url
+                    'webBackgroundUrl': web_background_url,
+                    'webFaviconUrl': web_favicon_url,
+                    'webIconUrls': web_icon_urls
                 })
             except Exception as e:
                 logger.error(f"获取网页设置信息失败: {str(e)}")
@@ -84,7 +88,9 @@ class SettingService:
                     web_logo.filename = "logo.png"
                     file_path = os.path.join(app_folder, 'web-conf', web_logo.filename)
                     web_logo.save(file_path)
-                    convert_to_ico(file_path, os.path.join(app_folder, 'web-conf', 'favicon.ico'), [64])
+                    convert_to_ico(file_path, os.path.join(app_folder, 'web-conf', 'favicon.ico'))
+                    for name in [web_logo.filename, 'favicon.ico', *FAVICON_PNG_SIZES]:
+                        web_asset_manager.refresh(name)
                     logger.info("更换 Logo 成功")
 
                 # 更换网页 SVG Logo
@@ -92,6 +98,7 @@ class SettingService:
                     web_svg_logo.filename = "logo.svg"
                     file_path = os.path.join(app_folder, 'web-conf', web_svg_logo.filename)
                     web_svg_logo.save(file_path)
+                    web_asset_manager.refresh(web_svg_logo.filename)
                     logger.info("更换 SVG Logo 成功")
 
                 # 更新网页登录封面
@@ -99,6 +106,7 @@ class SettingService:
                     web_login_bg.filename = "login-bg.jpg"
                     file_path = os.path.join(app_folder, 'web-conf', web_login_bg.filename)
                     web_login_bg.save(file_path)
+                    web_asset_manager.refresh(web_login_bg.filename)
                     logger.info("更换登录封面成功")
 
                 # 更换网页背景图片
@@ -106,6 +114,7 @@ class SettingService:
                     web_background.filename = "background.jpg"
                     file_path = os.path.join(app_folder, 'web-conf', web_background.filename)
                     web_background.save(file_path)
+                    web_asset_manager.refresh(web_background.filename)
                     logger.info("更换背景图片成功")
 
                 return ResponseFactory.success(data={'messageType': 'success'})
@@ -129,7 +138,7 @@ class SettingService:
                 for ext in ['png', 'jpg', 'jpeg', 'gif']:
                     avatar_file = os.path.join(web_conf_folder, f'avatar.{ext}')
                     if os.path.exists(avatar_file):
-                        user_avatar_url = url_for('i.get_web_file', filename=f'avatar.{ext}')
+                        user_avatar_url = web_asset_manager.url_for(f'avatar.{ext}')
                         break
                 return ResponseFactory.success(data={
                     'username': user.get('username'),
@@ -161,6 +170,7 @@ class SettingService:
                 app_folder = get_app_dir()
                 file_path = os.path.join(app_folder, 'web-conf', avatar_img_name)
                 avatar_img.save(file_path)
+                web_asset_manager.refresh(avatar_img_name)
                 logger.info("更换头像成功")
             except Exception as e:
                 logger.error(f"更换头像失败: {str(e)}")
@@ -0,0 +1,131 @@
+import asyncio
+import os
+
+import pytest
+
+import asgi_app
+from manager.thumbnail_cache_manager import thumbnail_cache
+from utils.http_utils import FILE_OFFLOAD
+from utils.sign_utils import SIGNED_URL, make_signature
+
+FILE_UUID = '0190b2c4-7a1e-7c3d-9f00-123456789abc'
+
+
+def call(path: str, root_path: str = '', query_string: bytes = b''):
+    """不发送 lifespan 事件，直接请求（相当于 --lifespan off），返回状态码"""
+    return request(path, root_path, query_string)[0]['status']
+
+
+def request(path: str, root_path: str = '', query_string: bytes = b''):
+    """发送请求，返回全部 ASGI 消息；path 按 ASGI 规范包含 root_path"""
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'root_path': root_path, 'query_string': query_string,
+             'headers': []}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(asgi_app.app(scope, receive, send))
+    return messages
+
+
+@pytest.fixture(autouse=True)
+def reset_delivery(monkeypatch):
+    monkeypatch.setitem(asgi_app.DELIVERY_STATE, 'ready', False)
+    monkeypatch.setitem(asgi_app.DELIVERY_STATE, 'lock', None)
+    monkeypatch.setitem(SIGNED_URL, 'enabled', False)
+
+
+def test_signature_enforced_without_lifespan(monkeypatch):
+    config = asgi_app.load_config()
+    config['server'].update(signedUrl=True, key='test-key')
+    config['sql']['host'] = 'none'
+    monkeypatch.setattr(asgi_app, 'load_config', lambda: config)
+
+    assert call('/i/0190b2c4-7a1e-7c3d-9f00-123456789abc.jpg') == 403
+    assert asgi_app.DELIVERY_STATE['ready']
+
+
+def test_fails_closed_when_init_fails(monkeypatch):
+    def broken():
+        raise RuntimeError('config missing')
+    monkeypatch.setattr(asgi_app, 'init_delivery', broken)
+
+    assert call('/i/0190b2c4-7a1e-7c3d-9f00-123456789abc.jpg') == 503
+
+
+def test_path_is_not_unquoted_twice(monkeypatch):
+    monkeypatch.setitem(asgi_app.DELIVERY_STATE, 'ready', True)
+    received = []
+
+    async def record(send, request, filename):
+        received.append(filename)
+        await asgi_app.send_error(send, 404)
+    monkeypatch.setitem(asgi_app.ROUTES, '/web/', record)
+
+    # 客户端请求 /web/100%2541.css，服务器解码后 scope['path'] 为 /web/100%41.css
+    call('/web/100%41.css')
+    assert received == ['100%41.css']
+
+
+def test_thumbnail_offload_bypasses_memory_cache(monkeypatch, tmp_path):
+    monkeypatch.setitem(asgi_app.DELIVERY_STATE, 'ready', True)
+    monkeypatch.setitem(FILE_OFFLOAD, 'mode', 'apache')
+    thumbnail_path = os.path.join(tmp_path, FILE_UUID + '.gif')
+    with open(thumbnail_path, 'wb') as file:
+        file.write(b'GIF89a')
+
+    async def resolve_pic(file_uuid):
+        return '2026/10/18', '.gif'
+    monkeypatch.setattr(asgi_app, 'resolve_pic', resolve_pic)
+    monkeypatch.setattr(asgi_app, 'find_thumbnail_path', lambda filename: thumbnail_path)
+    # 内存中已有缩略图也不返回内容
+    thumbnail_cache.admit(FILE_UUID, thumbnail_path)
+
+    try:
+        start, body = request(f'/thumbnail/{FILE_UUID}.gif')
+    finally:
+        thumbnail_cache.clear()
+    headers = dict(start['headers'])
+    assert start['status'] == 200
+    assert headers[b'X-Sendfile'] == thumbnail_path.encode()
+    assert body['body'] == b''
+
+
+@pytest.mark.parametrize('path', ['/img/web/app.css', '/web/app.css'], ids=['with_root_path', 'legacy_server'])
+def test_root_path_is_stripped_once(monkeypatch, path):
+    monkeypatch.setitem(asgi_app.DELIVERY_STATE, 'ready', True)
+    received = []
+
+    async def record(send, request, filename):
+        received.append(filename)
+        await asgi_app.send_error(send, 404)
+    monkeypatch.setitem(asgi_app.ROUTES, '/web/', record)
+
+    call(path, root_path='/img')
+    assert received == ['app.css']
+
+
+def test_signature_covers_root_path(monkeypatch):
+    monkeypatch.setitem(asgi_app.DELIVERY_STATE, 'ready', True)
+    monkeypatch.setitem(SIGNED_URL, 'enabled', True)
+    monkeypatch.setitem(SIGNED_URL, 'key', b'test-key')
+    served = []
+
+    async def record(send, request, filename):
+        served.append(filename)
+        await asgi_app.send_error(send, 404)
+    monkeypatch.setitem(asgi_app.ROUTES, '/i/', record)
+
+    expires = 4102444800
+    path = f'/img/i/{FILE_UUID}.jpg'
+    signed = f'exp={expires}&sig={make_signature(path, expires)}'.encode()
+    assert call(path, '/img', signed) == 404
+    assert served == [FILE_UUID + '.jpg']
+
+    # 不含 root_path 签发的签名无效
+    unsigned = f'exp={expires}&sig={make_signature(path[len("/img"):], expires)}'.encode()
+    assert call(path, '/img', unsigned) == 403
@@ -0,0 +1,20 @@
+import pytest
+
+from utils.ingest_utils import get_dimension_values
+
+
+@pytest.mark.parametrize('orientation', [None, 1, 2, 3, 4])
+def test_unrotated_orientation_keeps_size(orientation):
+    values = get_dimension_values(4000, 3000, orientation)
+    assert (values['width'], values['height'], values['aspect_ratio']) == (4000, 3000, 1.3333)
+
+
+@pytest.mark.parametrize('orientation', [5, 6, 7, 8])
+def test_rotated_orientation_swaps_size(orientation):
+    values = get_dimension_values(4000, 3000, orientation)
+    assert (values['width'], values['height'], values['aspect_ratio']) == (3000, 4000, 0.75)
+    assert values['pixels'] == 12000000
+
+
+def test_unknown_size():
+    assert get_dimension_values(None, 3000, 6) == {'width': None, 'height': None, 'pixels': None, 'aspect_ratio': None}
@@ -0,0 +1,25 @@
+from datetime import datetime, timezone
+
+from werkzeug.http import parse_etags
+
+from utils.http_utils import match_etag, is_uuid_etag
+
+FILE_UUID = '0190b2c4-7a1e-7c3d-9f00-123456789abc'
+
+
+def test_uuid_etag_can_skip_existence_check():
+    etag = match_etag(FILE_UUID, parse_etags(f'"{FILE_UUID}-400-65f0"'), None)
+    assert etag == f'{FILE_UUID}-400-65f0'
+    assert is_uuid_etag(etag)
+
+
+def test_other_uuid_does_not_match():
+    assert match_etag(FILE_UUID, parse_etags('"other-400-65f0"'), None) is None
+
+
+def test_star_and_date_need_existence_check():
+    star = match_etag(FILE_UUID, parse_etags('*'), None)
+    since = match_etag(FILE_UUID, None, datetime(2026, 1, 1, tzinfo=timezone.utc))
+    assert star == '*' and not is_uuid_etag(star)
+    assert since == '' and not is_uuid_etag(since)
+    assert not is_uuid_etag(None)
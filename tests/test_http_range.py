@@ -0,0 +1,83 @@
+import os
+from wsgiref.util import FileWrapper
+
+import pytest
+from flask import Flask
+
+from utils.http_utils import send_immutable_file
+
+FILE_UUID = '0190b2c4-7a1e-7c3d-9f00-123456789abc'
+FILENAME = FILE_UUID + '.jpg'
+CONTENT = bytes(range(256)) * 4000  # 1 MB，大于一次读取的块大小
+
+
+@pytest.fixture
+def client(tmp_path):
+    with open(os.path.join(tmp_path, FILENAME), 'wb') as file:
+        file.write(CONTENT)
+
+    app = Flask(__name__)
+
+    @app.route('/i/<filename>')
+    def serve(filename):
+        return send_immutable_file(str(tmp_path), filename, FILE_UUID)
+
+    return app.test_client()
+
+
+# 不带 file_wrapper 和带 wsgiref 的 file_wrapper（不按 Content-Length 截断）各测一次
+@pytest.fixture(params=[None, FileWrapper], ids=['iterator', 'file_wrapper'])
+def environ(request):
+    return {} if request.param is None else {'wsgi.file_wrapper': request.param}
+
+
+def get(client, environ, headers=None):
+    return client.get('/i/' + FILENAME, headers=headers or {}, environ_base=environ)
+
+
+def test_full_file(client, environ):
+    response = get(client, environ)
+    assert response.status_code == 200
+    assert response.data == CONTENT
+    assert response.headers['Accept-Ranges'] == 'bytes'
+
+
+@pytest.mark.parametrize('start, end', [(0, 0), (0, 99), (100, 299999), (262143, 262144), (1000, len(CONTENT) - 1)])
+def test_byte_range(client, environ, start, end):
+    response = get(client, environ, {'Range': f'bytes={start}-{end}'})
+    assert response.status_code == 206
+    assert response.data == CONTENT[start:end + 1]
+    assert int(response.headers['Content-Length']) == end - start + 1
+    assert response.headers['Content-Range'] == f'bytes {start}-{end}/{len(CONTENT)}'
+
+
+def test_open_ended_range(client, environ):
+    response = get(client, environ, {'Range': 'bytes=1000000-'})
+    assert response.status_code == 206
+    assert response.data == CONTENT[1000000:]
+
+
+def test_suffix_range(client, environ):
+    response = get(client, environ, {'Range': 'bytes=-500'})
+    assert response.status_code == 206
+    assert response.data == CONTENT[-500:]
+    assert response.headers['Content-Range'] == f'bytes {len(CONTENT) - 500}-{len(CONTENT) - 1}/{len(CONTENT)}'
+
+
+def test_unsatisfiable_range(client, environ):
+    response = get(client, environ, {'Range': f'bytes={len(CONTENT)}-{len(CONTENT) + 10}'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f'bytes */{len(CONTENT)}'
+
+
+def test_if_range_matching_etag(client, environ):
+    etag = get(client, environ).headers['ETag']
+    response = get(client, environ, {'Range': 'bytes=10-19', 'If-Range': etag})
+    assert response.status_code == 206
+    assert response.data == CONTENT[10:20]
+
+
+def test_if_range_mismatched_etag(client, environ):
+    response = get(client, environ, {'Range': 'bytes=10-19', 'If-Range': f'"{FILE_UUID}-0-0"'})
+    assert response.status_code == 200
+    assert response.data == CONTENT
@@ -0,0 +1,126 @@
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from manager import image_worker_manager
+from manager.db_manager import db_manager, get_session
+from manager.image_worker_manager import ImageWorker, JOB_LEASE
+from models.image_job import ImageJob, ImageJobBase, JOB_PENDING, JOB_RUNNING
+
+
+@pytest.fixture
+def database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    ImageJobBase.metadata.create_all(engine)
+    session_local = db_manager.SessionLocal
+    db_manager.SessionLocal = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    yield
+    db_manager.SessionLocal.remove()
+    db_manager.SessionLocal = session_local
+    engine.dispose()
+
+
+def add_job(status: str, next_run_at: datetime) -> int:
+    with get_session() as db:
+        job = ImageJob(pic_uuid='uuid', relative_path='2026/10/18', pic_name='uuid.jpg',
+                       status=status, attempts=0, next_run_at=next_run_at)
+        db.add(job)
+        db.commit()
+        return job.jid
+
+
+def get_job(jid: int):
+    with get_session() as db:
+        job = db.query(ImageJob).filter(ImageJob.jid == jid).first()
+        return (job.status, job.next_run_at) if job is not None else None
+
+
+class BrokenExecutor:
+    """子进程被杀后的进程池"""
+
+    def __init__(self):
+        self.shut_down = False
+
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool('worker died')
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+class DoneExecutor:
+    """直接返回空结果的进程池"""
+
+    def submit(self, *args, **kwargs):
+        future = Future()
+        future.set_result({})
+        return future
+
+
+@pytest.fixture
+def worker(monkeypatch, tmp_path):
+    monkeypatch.setattr(image_worker_manager, 'get_thumbnail_path', lambda name, create=False: str(tmp_path / name))
+    worker = ImageWorker()
+    worker._slots = threading.BoundedSemaphore(1)
+    worker._slots.acquire()
+    monkeypatch.setattr(worker, '_create_executor', DoneExecutor)
+    return worker
+
+
+def test_pending_job_is_claimed_once(database):
+    jid = add_job(JOB_PENDING, datetime.now() - timedelta(seconds=1))
+
+    # 两个进程读到同一个等待中的任务，只有一个领取成功
+    assert ImageWorker._claim(jid, JOB_PENDING) is True
+    assert ImageWorker._claim(jid, JOB_PENDING) is False
+
+    status, lease_until = get_job(jid)
+    assert status == JOB_RUNNING
+    assert lease_until > datetime.now() + timedelta(seconds=JOB_LEASE - 60)
+
+
+def test_running_job_is_not_reclaimed_before_lease_expires(database):
+    jid = add_job(JOB_RUNNING, datetime.now() + timedelta(seconds=JOB_LEASE))
+    assert ImageWorker._claim(jid, JOB_RUNNING) is False
+
+
+def test_expired_lease_is_reclaimed_once(database):
+    jid = add_job(JOB_RUNNING, datetime.now() - timedelta(seconds=1))
+    assert ImageWorker._claim(jid, JOB_RUNNING) is True
+    assert ImageWorker._claim(jid, JOB_RUNNING) is False
+
+
+def test_future_retry_is_not_claimed(database):
+    jid = add_job(JOB_PENDING, datetime.now() + timedelta(seconds=60))
+    assert ImageWorker._claim(jid, JOB_PENDING) is False
+
+
+def test_broken_pool_is_rebuilt_on_submit(database, worker):
+    jid = add_job(JOB_RUNNING, datetime.now() + timedelta(seconds=JOB_LEASE))
+    broken = BrokenExecutor()
+    worker._executor = broken
+
+    worker._submit(jid, 'uuid', '2026/10/18', 'uuid.jpg')
+    assert isinstance(worker._executor, DoneExecutor)
+    assert broken.shut_down
+    assert get_job(jid) is None
+    assert worker.completed == 1
+
+
+def test_broken_pool_is_rebuilt_on_result(database, worker):
+    jid = add_job(JOB_RUNNING, datetime.now() + timedelta(seconds=JOB_LEASE))
+    broken = BrokenExecutor()
+    worker._executor = broken
+    future = Future()
+    future.set_exception(BrokenProcessPool('worker died'))
+
+    worker._finish(jid, 'uuid', future, broken)
+    assert isinstance(worker._executor, DoneExecutor)
+    # 任务按重试策略重新排队
+    assert get_job(jid)[0] == JOB_PENDING
+    assert worker.retried == 1
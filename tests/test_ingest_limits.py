@@ -0,0 +1,30 @@
+import pytest
+from PIL import Image
+
+from utils.ingest_utils import check_sniffed, set_max_pixels, IngestError, DEFAULT_MAX_PIXELS
+
+
+@pytest.fixture(autouse=True)
+def restore_limit():
+    yield
+    set_max_pixels(DEFAULT_MAX_PIXELS)
+
+
+def test_default_accepts_large_panorama():
+    # 约 120 MP，超过 PIL 的警告阈值但低于拒绝解码的阈值
+    check_sniffed(('JPEG', 20000, 6000))
+
+
+def test_default_rejects_above_decompression_bomb_limit():
+    with pytest.raises(IngestError):
+        check_sniffed(('JPEG', 20000, 9000))
+
+
+def test_configured_limit_applies_to_pil():
+    set_max_pixels(400 * 1000 * 1000)
+    check_sniffed(('JPEG', 20000, 19000))
+    assert Image.MAX_IMAGE_PIXELS * 2 == 400 * 1000 * 1000
+
+    set_max_pixels(50 * 1000 * 1000)
+    with pytest.raises(IngestError):
+        check_sniffed(('JPEG', 10000, 6000))
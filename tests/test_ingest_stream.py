@@ -0,0 +1,35 @@
+import io
+import os
+import struct
+
+import pytest
+from PIL import Image
+
+from utils.ingest_utils import ingest_stream, IngestError, SNIFF_LIMIT
+
+
+def test_lzw_tiff_with_trailing_ifd(tmp_path):
+    data = io.BytesIO()
+    Image.effect_noise((1500, 1500), 60).convert('RGB').save(data, format='TIFF', compression='tiff_lzw')
+    data = data.getvalue()
+    # IFD 在 SNIFF_LIMIT 之后，只读开头无法识别
+    assert len(data) > SNIFF_LIMIT and struct.unpack('<I', data[4:8])[0] > SNIFF_LIMIT
+
+    target = os.path.join(tmp_path, 'image.tif')
+    info = ingest_stream(io.BytesIO(data), target)
+    assert (info['format'], info['width'], info['height']) == ('TIFF', 1500, 1500)
+    assert info['file_size'] == len(data)
+    assert os.path.getsize(target) == len(data)
+
+
+def test_unknown_data_rejected_at_sniff_limit(tmp_path):
+    target = os.path.join(tmp_path, 'image.bin')
+    with pytest.raises(IngestError):
+        ingest_stream(io.BytesIO(b'\x01' * (SNIFF_LIMIT * 2)), target)
+    assert not os.path.exists(target) and not os.path.exists(target + '.part')
+
+
+def test_truncated_tiff_rejected(tmp_path):
+    data = b'II*\x00' + struct.pack('<I', SNIFF_LIMIT * 3) + b'\x00' * (SNIFF_LIMIT * 2)
+    with pytest.raises(IngestError):
+        ingest_stream(io.BytesIO(data), os.path.join(tmp_path, 'image.tif'))
@@ -0,0 +1,32 @@
+import os
+
+import pytest
+from PIL import Image, ImageCms
+
+from utils.file_utils import generate_modern_siblings, get_modern_formats
+
+# EXIF 方向 6: 需要顺时针旋转 90 度显示（手机竖拍）
+ORIENTATION_TAG = 0x0112
+
+
+@pytest.fixture
+def rotated_jpeg(tmp_path):
+    """宽 64 高 32 的噪点 JPEG，带方向 6 和 sRGB ICC 配置"""
+    path = os.path.join(tmp_path, 'photo.jpg')
+    image = Image.effect_noise((64, 32), 100).convert('RGB')
+    exif = Image.Exif()
+    exif[ORIENTATION_TAG] = 6
+    icc_profile = ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes()
+    image.save(path, quality=100, exif=exif, icc_profile=icc_profile)
+    return path, icc_profile
+
+
+@pytest.mark.parametrize('suffix', [suffix for _, suffix, _ in get_modern_formats()])
+def test_siblings_are_upright(rotated_jpeg, suffix):
+    path, icc_profile = rotated_jpeg
+    assert suffix in generate_modern_siblings(path)
+
+    with Image.open(path + suffix) as sibling:
+        assert sibling.size == (32, 64)
+        assert sibling.getexif().get(ORIENTATION_TAG) in (None, 1)
+        assert sibling.info.get('icc_profile') == icc_profile
@@ -0,0 +1,33 @@
+import os
+
+from PIL import Image
+
+from utils.phash_utils import compute_dhash_from_file, hamming_distance
+
+# EXIF 方向 6: 需要顺时针旋转 90 度显示（手机竖拍）
+ORIENTATION_TAG = 0x0112
+
+
+def upright_image():
+    """左右、上下亮度都不对称的渐变，旋转后 dHash 明显不同"""
+    image = Image.linear_gradient('L').resize((192, 256))
+    image.paste(255, (0, 0, 64, 64))
+    return image.convert('RGB')
+
+
+def test_dhash_follows_exif_orientation(tmp_path):
+    upright_path = os.path.join(tmp_path, 'upright.jpg')
+    rotated_path = os.path.join(tmp_path, 'rotated.jpg')
+    plain_path = os.path.join(tmp_path, 'plain.jpg')
+
+    image = upright_image()
+    image.save(upright_path, quality=95)
+    # 像素按逆时针 90 度存储，由方向 6 转回正向
+    exif = Image.Exif()
+    exif[ORIENTATION_TAG] = 6
+    image.transpose(Image.Transpose.ROTATE_90).save(rotated_path, quality=95, exif=exif)
+    image.transpose(Image.Transpose.ROTATE_90).save(plain_path, quality=95)
+
+    upright = compute_dhash_from_file(upright_path)
+    assert hamming_distance(upright, compute_dhash_from_file(rotated_path)) <= 4
+    assert hamming_distance(upright, compute_dhash_from_file(plain_path)) > 16
@@ -0,0 +1,55 @@
+import threading
+
+from manager import phash_index_manager
+from manager.phash_index_manager import PerceptualHashIndex, build_unions
+from utils.phash_utils import to_signed
+
+
+def test_clusters_after_remove():
+    index = PerceptualHashIndex(distance=2)
+    # 1 和 2、2 和 3 近似，1 和 3 不近似，删除 2 后 1、3 不再同簇
+    index.add(1, to_signed(0b0000))
+    index.add(2, to_signed(0b0011))
+    index.add(3, to_signed(0b1111))
+    index.add(4, to_signed(0xffff0000))
+    assert index.clusters() == [[1, 2, 3]]
+
+    index.remove(2)
+    assert index.clusters() == []
+    index.add(5, to_signed(0b0001))
+    assert index.clusters() == [[1, 5]]
+
+
+def test_rebuild_does_not_block_add(monkeypatch):
+    index = PerceptualHashIndex(distance=2)
+    for pid, value in enumerate((0x0f0f0f0f0f0f0f0f, 0xf0f0f0f0f0f0f0f0, 0x3333333333333333, 0xcccccccccccccccc), 1):
+        index.add(pid, to_signed(value))
+    index.add(10, to_signed(0b0000))
+    index.add(11, to_signed(0b0001))
+    index.remove(4)
+
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_build(*args):
+        started.set()
+        assert release.wait(5)
+        return build_unions(*args)
+    monkeypatch.setattr(phash_index_manager, 'build_unions', slow_build)
+
+    result = []
+    thread = threading.Thread(target=lambda: result.append(index.clusters()))
+    thread.start()
+    assert started.wait(5)
+
+    # 重建期间可以新增图片
+    added = threading.Thread(target=index.add, args=(12, to_signed(0b0011)))
+    added.start()
+    added.join(1)
+    assert not added.is_alive()
+
+    release.set()
+    thread.join()
+    assert result == [[[10, 11]]]
+    # 期间新增的图片合并到重建后的并查集
+    assert index.clusters() == [[10, 11, 12]]
@@ -0,0 +1,27 @@
+import os
+
+from PIL import Image
+
+from utils.placeholder_utils import compute_placeholder_from_file
+
+# EXIF 方向 6: 需要顺时针旋转 90 度显示（手机竖拍）
+ORIENTATION_TAG = 0x0112
+
+
+def test_placeholder_follows_exif_orientation(tmp_path):
+    upright_path = os.path.join(tmp_path, 'upright.jpg')
+    rotated_path = os.path.join(tmp_path, 'rotated.jpg')
+
+    # 竖图，上半白下半黑
+    image = Image.new('RGB', (192, 256), 'black')
+    image.paste((255, 255, 255), (0, 0, 192, 128))
+    image.save(upright_path, quality=95)
+    exif = Image.Exif()
+    exif[ORIENTATION_TAG] = 6
+    image.transpose(Image.Transpose.ROTATE_90).save(rotated_path, quality=95, exif=exif)
+
+    upright = compute_placeholder_from_file(upright_path)
+    rotated = compute_placeholder_from_file(rotated_path)
+    # 分量数随长边方向变化，第一个字符编码分量数
+    assert rotated['blurhash'][0] == upright['blurhash'][0]
+    assert rotated['dominant_color'] == upright['dominant_color']
@@ -0,0 +1,149 @@
+import io
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+from botocore.response import StreamingBody
+from botocore.stub import Stubber, ANY
+
+from manager import storage_manager as storage_module
+from manager.storage_manager import S3Storage, StorageManager, get_pic_key
+
+BUCKET = 'pics'
+RELATIVE_PATH = '2026/10/18'
+FILENAME = '0190b2c4-7a1e-7c3d-9f00-123456789abc.jpg'
+KEY = 'originals/' + get_pic_key(RELATIVE_PATH, FILENAME)
+CONTENT = b'\xff\xd8' + bytes(range(256)) * 64
+
+
+class SlowBody(io.BytesIO):
+    """每次读取前等待，让并发的取回请求重叠"""
+
+    def read(self, size=-1):
+        time.sleep(0.05)
+        return super().read(size)
+
+
+@pytest.fixture
+def s3():
+    storage = S3Storage({'bucket': BUCKET, 'prefix': '/originals/', 'region': 'us-east-1',
+                         'accessKey': 'test', 'secretKey': 'test', 'endpoint': 'http://minio.local:9000'})
+    with Stubber(storage.client) as stubber:
+        yield storage, stubber
+        stubber.assert_no_pending_responses()
+
+
+@pytest.fixture
+def manager(s3, tmp_path, monkeypatch):
+    monkeypatch.setattr(storage_module, 'get_images_dir', lambda: str(tmp_path))
+    manager = StorageManager()
+    manager.backend = s3[0]
+    return manager
+
+
+def test_store_original_puts_object(manager, s3, tmp_path):
+    storage, stubber = s3
+    source = os.path.join(tmp_path, FILENAME)
+    with open(source, 'wb') as file:
+        file.write(CONTENT)
+
+    stubber.add_response('put_object', {}, {'Bucket': BUCKET, 'Key': KEY, 'Body': ANY, 'ContentType': 'image/jpeg',
+                                            'ChecksumAlgorithm': ANY})
+    assert manager.store_original(RELATIVE_PATH, FILENAME, source, 'image/jpeg') is True
+
+
+def test_store_original_failure_keeps_local_file(manager, s3, tmp_path):
+    storage, stubber = s3
+    source = os.path.join(tmp_path, FILENAME)
+    with open(source, 'wb') as file:
+        file.write(CONTENT)
+
+    stubber.add_client_error('put_object', 'InternalError', http_status_code=500)
+    assert manager.store_original(RELATIVE_PATH, FILENAME, source) is False
+    assert os.path.exists(source)
+
+
+def test_stat(s3):
+    storage, stubber = s3
+    stubber.add_response('head_object', {'ContentLength': len(CONTENT),
+                                         'LastModified': datetime(2026, 10, 18, tzinfo=timezone.utc)},
+                         {'Bucket': BUCKET, 'Key': KEY})
+    stubber.add_client_error('head_object', '404', http_status_code=404, expected_params={'Bucket': BUCKET, 'Key': KEY})
+
+    assert storage.stat(get_pic_key(RELATIVE_PATH, FILENAME))['size'] == len(CONTENT)
+    assert storage.stat(get_pic_key(RELATIVE_PATH, FILENAME)) is None
+
+
+def test_fetch_original_downloads_once(manager, s3, tmp_path):
+    storage, stubber = s3
+    # 只准备一次响应，第二次下载会被 Stubber 拒绝
+    stubber.add_response('get_object', {'Body': StreamingBody(SlowBody(CONTENT), len(CONTENT))},
+                         {'Bucket': BUCKET, 'Key': KEY})
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(manager.fetch_original(RELATIVE_PATH, FILENAME)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    local_path = os.path.join(tmp_path, RELATIVE_PATH, FILENAME)
+    assert results == [local_path] * 4
+    with open(local_path, 'rb') as file:
+        assert file.read() == CONTENT
+    assert not os.path.exists(local_path + '.fetch')
+    assert manager._fetching == {}
+
+
+def test_fetch_original_missing_object(manager, s3, tmp_path):
+    storage, stubber = s3
+    stubber.add_client_error('get_object', 'NoSuchKey', http_status_code=404)
+
+    assert manager.fetch_original(RELATIVE_PATH, FILENAME) is None
+    assert os.listdir(os.path.join(tmp_path, RELATIVE_PATH)) == []
+
+
+def test_presign_original(manager):
+    url = manager.presign_original(RELATIVE_PATH, FILENAME)
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query)
+
+    assert parsed.netloc == 'minio.local:9000'
+    assert parsed.path == f'/{BUCKET}/{KEY}'
+    # botocore 按配置选择 SigV2 或 SigV4 签名
+    assert 'Signature' in query or 'X-Amz-Signature' in query
+    assert query['response-content-disposition'] == [f'inline; filename="{FILENAME}"']
+
+
+def test_presign_disabled_without_redirect(manager):
+    manager.backend.redirect = False
+    assert manager.presign_original(RELATIVE_PATH, FILENAME) is None
+
+
+def test_remove_original_deletes_local_and_remote(manager, s3, tmp_path):
+    storage, stubber = s3
+    local_path = os.path.join(tmp_path, RELATIVE_PATH, FILENAME)
+    os.makedirs(os.path.dirname(local_path))
+    for path in (local_path, local_path + '.webp'):
+        with open(path, 'wb') as file:
+            file.write(CONTENT)
+
+    stubber.add_response('delete_object', {}, {'Bucket': BUCKET, 'Key': KEY})
+    manager.remove_original(RELATIVE_PATH, FILENAME)
+    assert os.listdir(os.path.dirname(local_path)) == []
+
+
+def test_remove_original_keeps_going_when_remote_fails(manager, s3, tmp_path):
+    storage, stubber = s3
+    local_path = os.path.join(tmp_path, RELATIVE_PATH, FILENAME)
+    os.makedirs(os.path.dirname(local_path))
+    with open(local_path, 'wb') as file:
+        file.write(CONTENT)
+
+    stubber.add_client_error('delete_object', 'AccessDenied', http_status_code=403)
+    manager.remove_original(RELATIVE_PATH, FILENAME)
+    assert not os.path.exists(local_path)
@@ -0,0 +1,77 @@
+import os
+import time
+
+from manager.thumbnail_cache_manager import ThumbnailCache, FrequencySketch
+
+FILE_UUID = '0190b2c4-7a1e-7c3d-9f00-123456789abc'
+
+
+def write_thumbnail(tmp_path, content: bytes):
+    path = os.path.join(tmp_path, FILE_UUID + '.gif')
+    with open(path, 'wb') as file:
+        file.write(content)
+    return path
+
+
+def test_hit_after_delete_in_other_process_is_miss(tmp_path):
+    cache = ThumbnailCache()
+    cache.revalidate_seconds = 0
+    path = write_thumbnail(tmp_path, b'GIF89a')
+    assert cache.admit(FILE_UUID, path) is not None
+    assert cache.get(FILE_UUID) is not None
+
+    # 其他进程删除图片后不再返回内存中的缩略图
+    os.remove(path)
+    assert cache.get(FILE_UUID) is None
+    assert cache.stats()['size'] == 0
+
+
+def test_hit_after_replace_is_miss(tmp_path):
+    cache = ThumbnailCache()
+    cache.revalidate_seconds = 0
+    path = write_thumbnail(tmp_path, b'GIF89a')
+    cache.admit(FILE_UUID, path)
+
+    replacement = path + '.new'
+    with open(replacement, 'wb') as file:
+        file.write(b'GIF89a-regenerated')
+    os.replace(replacement, path)
+    assert cache.get(FILE_UUID) is None
+
+
+def test_recent_hit_does_not_stat(tmp_path, monkeypatch):
+    cache = ThumbnailCache()
+    path = write_thumbnail(tmp_path, b'GIF89a')
+    cache.admit(FILE_UUID, path)
+
+    def no_stat(path):
+        raise AssertionError('stat on fresh hit')
+    monkeypatch.setattr(os, 'stat', no_stat)
+    assert cache.get_fresh(FILE_UUID) is not None
+    assert cache.get(FILE_UUID) is not None
+    assert cache.stats()['hits'] == 2
+
+
+def test_expired_entry_is_not_returned_without_check(tmp_path):
+    cache = ThumbnailCache()
+    path = write_thumbnail(tmp_path, b'GIF89a')
+    cache.admit(FILE_UUID, path)
+    cache.revalidate_seconds = 0
+
+    # 事件循环中不检查文件，交给线程池中的 get
+    assert cache.get_fresh(FILE_UUID) is None
+    assert cache.stats()['misses'] == 0
+    assert cache.get(FILE_UUID) is not None
+
+    os.remove(path)
+    assert cache.get(FILE_UUID) is None
+
+
+def test_sketch_reset_halves_counts_quickly():
+    sketch = FrequencySketch()
+    for _ in range(8):
+        sketch.increment('hot')
+    started = time.perf_counter()
+    sketch._reset()
+    assert time.perf_counter() - started < 0.05
+    assert sketch.estimate('hot') == 4
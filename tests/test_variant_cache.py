@@ -0,0 +1,88 @@
+import os
+
+import pytest
+from PIL import Image
+
+from manager.variant_cache_manager import VariantCache, variant_filename
+
+FILE_UUID = '0190b2c4-7a1e-7c3d-9f00-123456789abc'
+PARAMS = {'w': 160, 'h': None, 'fit': 'contain', 'fmt': 'jpeg', 'q': 85}
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = os.path.join(tmp_path, FILE_UUID + '.png')
+    Image.effect_noise((400, 300), 80).convert('RGB').save(path)
+    return path
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = VariantCache()
+    cache.cache_dir = os.path.join(tmp_path, 'variants')
+    return cache
+
+
+def test_invalidate_before_first_use_removes_files(cache, source):
+    # 其他进程生成的缓存，本进程还没有加载索引
+    os.makedirs(cache.cache_dir)
+    other = os.path.join(cache.cache_dir, variant_filename(FILE_UUID, PARAMS))
+    Image.new('RGB', (10, 10)).save(other, format='JPEG')
+
+    cache.invalidate(FILE_UUID)
+    assert not os.path.exists(other)
+
+
+def test_hit_on_missing_file_regenerates(cache, source):
+    path = cache.get_or_create(FILE_UUID, source, PARAMS)
+    os.remove(path)
+
+    assert cache.get_or_create(FILE_UUID, source, PARAMS) == path
+    assert os.path.exists(path)
+    assert cache.stats()['misses'] == 2
+
+
+def test_eviction_counts_files_from_other_processes(cache, source):
+    os.makedirs(cache.cache_dir)
+    other = os.path.join(cache.cache_dir, 'other-process_160x0_contain_q85.jpg')
+    with open(other, 'wb') as file:
+        file.write(b'x' * 4096)
+    os.utime(other, (1, 1))
+
+    cache.max_bytes = 4096
+    path = cache.get_or_create(FILE_UUID, source, PARAMS)
+
+    assert os.path.exists(path)
+    assert not os.path.exists(other)
+    assert cache.stats()['evictions'] == 1
+
+
+def test_eviction_uses_index_without_scanning(cache, source, monkeypatch):
+    cache.get_or_create(FILE_UUID, source, PARAMS)
+
+    def no_scan():
+        raise AssertionError('scan on render')
+    monkeypatch.setattr(cache, '_scan', no_scan)
+    cache.max_bytes = 1
+    path = cache.get_or_create(FILE_UUID, source, dict(PARAMS, w=320))
+
+    assert os.path.exists(path)
+    assert not os.path.exists(os.path.join(cache.cache_dir, variant_filename(FILE_UUID, PARAMS)))
+    assert cache.stats()['evictions'] == 1
+
+
+def test_reconcile_counts_files_from_other_processes(cache, source):
+    path = cache.get_or_create(FILE_UUID, source, PARAMS)
+    other = os.path.join(cache.cache_dir, 'other-process_160x0_contain_q85.jpg')
+    with open(other, 'wb') as file:
+        file.write(b'x' * 4096)
+    os.utime(other, (1, 1))
+
+    cache.max_bytes = os.path.getsize(path)
+    cache._reconciling = True
+    cache._reconcile()
+
+    assert os.path.exists(path)
+    assert not os.path.exists(other)
+    assert cache.stats()['size'] == 1
+    assert not cache._reconciling
@@ -0,0 +1,83 @@
+import io
+from datetime import datetime
+
+from PIL import Image, ExifTags
+
+# EXIF 中的时间格式，如 2024:05:01 12:30:00
+EXIF_TIME_FORMAT = '%Y:%m:%d %H:%M:%S'
+
+# 拍摄时间依次尝试: 原始拍摄时间、数字化时间（在 Exif 子目录中）、文件修改时间（在 IFD0 中）
+TAKEN_TIME_TAGS = (ExifTags.Base.DateTimeOriginal, ExifTags.Base.DateTimeDigitized)
+
+# 空的 EXIF 信息，与 Pic 的列对应
+EMPTY_EXIF = {
+    'taken_time': None,
+    'orientation': None,
+    'camera_model': None,
+    'has_gps': 0
+}
+
+
+def parse_exif_time(value):
+    if not isinstance(value, str):
+        return None
+    try:
+        taken_time = datetime.strptime(value.strip('\x00 ').strip(), EXIF_TIME_FORMAT)
+    except ValueError:
+        return None
+    # 相机未设置时间时常见 0000:00:00 或 1970 之前的值
+    return taken_time if taken_time.year >= 1970 else None
+
+
+def read_exif(image):
+    """
+    从已打开（未解码像素）的图片读取拍摄时间、方向、相机型号和是否有 GPS
+    Returns:
+        与 EMPTY_EXIF 相同结构的字典
+    """
+    try:
+        exif = image.getexif()
+    except Exception:
+        return dict(EMPTY_EXIF)
+    if not exif:
+        return dict(EMPTY_EXIF)
+
+    sub_ifd = exif.get_ifd(ExifTags.IFD.Exif)
+    taken_time = None
+    for tag in TAKEN_TIME_TAGS:
+        taken_time = parse_exif_time(sub_ifd.get(tag))
+        if taken_time is not None:
+            break
+    if taken_time is None:
+        taken_time = parse_exif_time(exif.get(ExifTags.Base.DateTime))
+
+    orientation = exif.get(ExifTags.Base.Orientation)
+    make = str(exif.get(ExifTags.Base.Make) or '').strip('\x00 ').strip()
+    model = str(exif.get(ExifTags.Base.Model) or '').strip('\x00 ').strip()
+    # 型号通常已经包含厂商名（如 Canon EOS R5），不重复拼接
+    camera_model = model if not make or model.lower().startswith(make.split()[0].lower()) else f"{make} {model}"
+
+    return {
+        'taken_time': taken_time,
+        'orientation': orientation if isinstance(orientation, int) and 1 <= orientation <= 8 else None,
+        'camera_model': camera_model[:100] or None,
+        'has_gps': 1 if exif.get_ifd(ExifTags.IFD.GPSInfo) else 0
+    }
+
+
+def read_exif_from_bytes(head: bytes):
+    """从上传流开头的数据读取 EXIF（JPEG 的 EXIF 段在文件开头）"""
+    try:
+        with Image.open(io.BytesIO(head)) as image:
+            return read_exif(image)
+    except Exception:
+        return dict(EMPTY_EXIF)
+
+
+def read_exif_from_file(image_path: str):
+    """只解析文件头读取 EXIF，不解码像素"""
+    try:
+        with Image.open(image_path) as image:
+            return read_exif(image)
+    except Exception:
+        return dict(EMPTY_EXIF)
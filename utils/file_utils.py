@@ -1,7 +1,11 @@
+import hashlib
+import secrets
+import shutil
+import threading
 import time
 import uuid
 
-from PIL import Image
+from PIL import Image, ImageOps, features
 import os
 import sys
 
@@ -49,12 +53,88 @@ def get_web_conf_dir():
     return web_conf_dir
 
 
-def generate_uuid_high_precision(filename: str) -> str:
-    """根据文件名 + 当前毫秒级时间戳生成 UUID"""
-    namespace = uuid.NAMESPACE_DNS
-    timestamp = str(int(time.time() * 1000))  # 毫秒级时间戳
-    unique_string = f"{filename}_{timestamp}"
-    return str(uuid.uuid5(namespace, unique_string))
+# UUIDv7 生成状态: 上一次的毫秒时间戳和同一毫秒内的序号
+_uuid7_lock = threading.Lock()
+_uuid7_state = [0, 0]
+
+
+def generate_uuid7() -> str:
+    """
+    生成按时间排序的 UUID（UUIDv7）
+    前 48 位为毫秒时间戳，新记录的 uuid 索引插入集中在 B 树末尾；
+    同一毫秒内 12 位序号递增，其余 62 位随机，多进程同时上传同名文件也不会冲突
+    """
+    with _uuid7_lock:
+        timestamp = time.time_ns() // 1_000_000
+        last_timestamp, sequence = _uuid7_state
+        if timestamp <= last_timestamp:
+            # 同一毫秒（或系统时间回拨）时沿用上次的时间戳，序号用完后借用下一毫秒
+            timestamp = last_timestamp
+            sequence += 1
+            if sequence > 0xFFF:
+                timestamp += 1
+                sequence = secrets.randbits(11)
+        else:
+            sequence = secrets.randbits(11)
+        _uuid7_state[0], _uuid7_state[1] = timestamp, sequence
+
+    value = (timestamp & 0xFFFFFFFFFFFF) << 80 | 0x7 << 76 | sequence << 64 | 0b10 << 62 | secrets.randbits(62)
+    return str(uuid.UUID(int=value))
+
+
+# 缩略图按 uuid 哈希前缀分两级目录存放: thumbnail/ab/cd/<uuid><后缀>，每级 256 个目录
+THUMBNAIL_SHARD_LEVELS = 2
+
+
+def get_thumbnail_root():
+    return os.path.join(get_images_dir(), 'thumbnail')
+
+
+def get_shard_parts(filename: str):
+    """分片目录名，只取 uuid 部分计算，avif / webp 副本与缩略图在同一目录"""
+    file_uuid = os.path.basename(filename).split('.', 1)[0]
+    digest = hashlib.md5(file_uuid.encode('utf-8')).hexdigest()
+    return [digest[index * 2:index * 2 + 2] for index in range(THUMBNAIL_SHARD_LEVELS)]
+
+
+def get_sharded_path(root: str, filename: str):
+    return os.path.join(root, *get_shard_parts(filename), filename)
+
+
+def get_thumbnail_path(filename: str, create: bool = False):
+    """新缩略图的写入路径，create 为 True 时创建分片目录"""
+    path = get_sharded_path(get_thumbnail_root(), filename)
+    if create:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def find_sharded_file(root: str, filename: str):
+    """
+    查找分片目录中的文件，迁移完成前也查找旧的平铺目录
+    Returns:
+        已存在的路径，都不存在时返回分片路径
+    """
+    path = get_sharded_path(root, filename)
+    if os.path.exists(path):
+        return path
+    legacy_path = os.path.join(root, filename)
+    if os.path.exists(legacy_path):
+        return legacy_path
+    # 两次检查之间文件可能刚好被迁移工具移走
+    return path
+
+
+def find_thumbnail_path(filename: str):
+    """查找缩略图，旧 url 在迁移期间和迁移后都可以访问"""
+    return find_sharded_file(get_thumbnail_root(), filename)
+
+
+def remove_thumbnail(filename: str):
+    """删除缩略图及副本（分片目录和旧的平铺目录）"""
+    root = get_thumbnail_root()
+    remove_file_with_siblings(get_sharded_path(root, filename))
+    remove_file_with_siblings(os.path.join(root, filename))
 
 
 def get_image_info(image_path: str):
@@ -112,18 +192,30 @@ def check_file(files, allowed_extensions=None):
 
     return None
 
+# 网页图标 PNG 尺寸
+FAVICON_PNG_SIZES = {
+    'favicon-16x16.png': 16,
+    'favicon-32x32.png': 32,
+    'apple-touch-icon.png': 180,
+    'android-chrome-192x192.png': 192,
+    'android-chrome-512x512.png': 512
+}
+
 # JPG/PNG 转 .ico
-def convert_to_ico(input_path, output_path, sizes=None):
+def convert_to_ico(input_path, output_path, sizes=None, png_sizes=None):
     """
-    将图片转换为 ICO 格式
+    将图片转换为 ICO 格式，同时在同一目录下生成各尺寸 PNG 图标
 
     Args:
         input_path: 输入图片路径 (JPG/PNG)
         output_path: 输出 ICO 文件路径
         sizes: ICO 图标尺寸列表，默认为 [16, 32, 48, 64]
+        png_sizes: PNG 图标 {文件名: 尺寸}，默认为 FAVICON_PNG_SIZES
     """
     if sizes is None:
         sizes = [16, 32, 48, 64]
+    if png_sizes is None:
+        png_sizes = FAVICON_PNG_SIZES
 
     try:
         # 打开原始图片
@@ -139,6 +231,14 @@ def convert_to_ico(input_path, output_path, sizes=None):
             img.save(output_path, format='ICO', sizes=icon_sizes)
             logger.info(f"成功转换: {input_path} -> {output_path}")
 
+            # 生成 PNG 图标
+            output_dir = os.path.dirname(output_path)
+            for name, size in png_sizes.items():
+                icon = img.copy()
+                icon.thumbnail((size, size), Image.Resampling.LANCZOS)
+                icon.save(os.path.join(output_dir, name), format='PNG', optimize=True)
+            logger.info(f"成功生成 PNG 图标: {list(png_sizes.keys())}")
+
     except Exception as e:
         logger.error(f"转换失败: {e}")
 
@@ -147,4 +247,90 @@ def generate_thumbnail_pil(image_path, output_path, size=(250, 250)):
     logger.info(output_path)
     with Image.open(image_path) as image:
         image.thumbnail(size)
-        image.save(output_path)
\ No newline at end of file
+        image.save(output_path)
+
+
+# 现代图片格式（按优先级排序）: (PIL 格式, 文件后缀, MIME 类型)
+MODERN_FORMATS = [
+    ('AVIF', '.avif', 'image/avif'),
+    ('WEBP', '.webp', 'image/webp'),
+]
+
+# 可以生成现代格式副本的原图后缀（动图、矢量图、图标不转换）
+MODERN_SOURCE_SUFFIXES = {'.jpg', '.jpeg', '.jfif', '.png', '.bmp', '.tif', '.tiff', '.tga'}
+
+
+def get_modern_formats():
+    """获取当前 Pillow 支持编码的现代格式"""
+    return [item for item in MODERN_FORMATS if features.check(item[0].lower())]
+
+
+def generate_modern_siblings(image_path: str, quality: int = 80, image=None):
+    """
+    在原文件旁生成 <文件名><后缀>.avif / .webp 副本
+    只保留比原文件更小的副本
+    Args:
+        image: 已解码的图片，传入时不再重新打开文件
+    Returns:
+        生成成功的后缀列表
+    """
+    if os.path.splitext(image_path)[1].lower() not in MODERN_SOURCE_SUFFIXES:
+        return []
+
+    if image is None:
+        with Image.open(image_path) as image:
+            image.load()
+            return _save_modern_siblings(image_path, image, quality)
+    return _save_modern_siblings(image_path, image, quality)
+
+
+def _save_modern_siblings(image_path: str, image, quality: int):
+    original_size = os.path.getsize(image_path)
+    generated = []
+    # 副本按 EXIF 方向旋转后保存（去掉方向标记），并保留 ICC 色彩配置和其余 EXIF
+    image = ImageOps.exif_transpose(image)
+    save_options = {key: image.info[key] for key in ('icc_profile', 'exif') if image.info.get(key)}
+    if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+    for pil_format, suffix, _ in get_modern_formats():
+        sibling_path = image_path + suffix
+        temp_path = sibling_path + '.tmp'
+        image.save(temp_path, format=pil_format, quality=quality, **save_options)
+        if os.path.getsize(temp_path) < original_size:
+            os.replace(temp_path, sibling_path)
+            generated.append(suffix)
+        else:
+            os.remove(temp_path)
+
+    return generated
+
+
+def remove_file_with_siblings(file_path: str):
+    """删除文件以及它的现代格式副本"""
+    for path in [file_path] + [file_path + suffix for _, suffix, _ in MODERN_FORMATS]:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def link_file(source_path: str, target_path: str):
+    """
+    让 target_path 与 source_path 共用同一份文件内容（硬链接），文件系统不支持硬链接时复制
+    文件内容在最后一个链接删除时才释放
+    """
+    temp_path = target_path + '.link'
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    try:
+        os.link(source_path, temp_path)
+    except OSError:
+        shutil.copy2(source_path, temp_path)
+    os.replace(temp_path, target_path)
+
+
+def link_file_with_siblings(source_path: str, target_path: str):
+    """链接文件以及它的现代格式副本"""
+    link_file(source_path, target_path)
+    for _, suffix, _ in MODERN_FORMATS:
+        if os.path.exists(source_path + suffix):
+            link_file(source_path + suffix, target_path + suffix)
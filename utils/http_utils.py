@@ -0,0 +1,268 @@
+import mimetypes
+import os
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from flask import request, abort, make_response, Response
+
+from utils.basic.logging_utils import get_logger
+from utils.file_utils import get_app_dir, MODERN_FORMATS, MODERN_SOURCE_SUFFIXES
+
+logger = get_logger(__name__)
+
+# 部分 Python 版本缺少现代图片格式的 MIME 类型
+mimetypes.add_type('image/avif', '.avif')
+mimetypes.add_type('image/webp', '.webp')
+
+# 图片 url 以 uuid 区分内容，内容写入后不会再改变
+IMMUTABLE_MAX_AGE = 31536000
+IMMUTABLE_CACHE_CONTROL = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+
+# 无法使用 sendfile 时每次读取的大小
+FILE_CHUNK_SIZE = 256 * 1024
+
+# 文件下发方式: none 由 Flask 发送，nginx 使用 X-Accel-Redirect，apache 使用 X-Sendfile
+FILE_OFFLOAD_MODES = ('none', 'nginx', 'apache')
+FILE_OFFLOAD = {
+    'mode': 'none',
+    'prefix': '/protected'
+}
+
+
+# 文件区间读取类
+class FileRangeWrapper:
+    """
+    只读取文件 [start, start + length) 区间的迭代器
+    WSGI 服务器会在响应结束后调用 close 关闭文件
+    """
+
+    def __init__(self, file, start: int, length: int, chunk_size: int = FILE_CHUNK_SIZE):
+        self.file = file
+        self.remaining = length
+        self.chunk_size = chunk_size
+        self.file.seek(start)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.remaining <= 0:
+            raise StopIteration
+        data = self.file.read(min(self.chunk_size, self.remaining))
+        if not data:
+            raise StopIteration
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def init_file_offload(server_config: dict):
+    """读取文件下发配置，启动时调用一次，避免每次请求读取配置文件"""
+    mode = str(server_config.get('fileOffload', 'none')).lower()
+    if mode not in FILE_OFFLOAD_MODES:
+        logger.warning(f"不支持的文件下发方式 {mode}，使用 none")
+        mode = 'none'
+
+    FILE_OFFLOAD['mode'] = mode
+    FILE_OFFLOAD['prefix'] = '/' + str(server_config.get('fileOffloadPrefix', '/protected')).strip('/')
+    logger.info(f"文件下发方式: {mode}")
+
+
+def is_file_offloaded() -> bool:
+    """是否由前端代理发送文件"""
+    return FILE_OFFLOAD['mode'] != 'none'
+
+
+def offload_headers(full_path: str):
+    """
+    生成交给前端代理发送文件的响应头
+    nginx: X-Accel-Redirect 指向 <prefix>/<相对 app 目录的路径>，prefix 需配置为 internal location
+    apache: X-Sendfile 指向文件绝对路径
+    Returns:
+        未开启时返回 None
+    """
+    mode = FILE_OFFLOAD['mode']
+    if mode == 'none':
+        return None
+
+    headers = {'Content-Type': mimetypes.guess_type(full_path)[0] or 'application/octet-stream'}
+    if mode == 'nginx':
+        relative_path = os.path.relpath(full_path, get_app_dir()).replace(os.sep, '/')
+        headers['X-Accel-Redirect'] = quote(f"{FILE_OFFLOAD['prefix']}/{relative_path}")
+    else:
+        headers['X-Sendfile'] = full_path
+    return headers
+
+
+def offload_response(full_path: str, cache_control: str = None):
+    """生成交给前端代理发送文件的空响应，未开启时返回 None"""
+    headers = offload_headers(full_path)
+    if headers is None:
+        return None
+
+    response = Response('', headers=headers)
+    if cache_control is not None:
+        response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def make_etag(file_uuid: str, stat_result) -> str:
+    """根据 uuid + 文件大小 + 修改时间生成强 ETag"""
+    return f"{file_uuid}-{stat_result.st_size:x}-{int(stat_result.st_mtime):x}"
+
+
+def get_matched_etag(file_uuid: str):
+    """判断当前请求的客户端缓存是否仍然有效，在查询数据库和打开文件之前调用"""
+    return match_etag(file_uuid, request.if_none_match, request.if_modified_since)
+
+
+def match_etag(file_uuid: str, if_none_match, if_modified_since):
+    """
+    同一个 uuid 对应的内容不会改变，客户端持有该 uuid 签发的任意 ETag 都视为命中
+    Returns:
+        命中时返回匹配的 ETag（If-Modified-Since 命中时为空字符串），否则返回 None；
+        返回 '*' 或空字符串时，调用方需要确认图片存在后再返回 304（见 is_uuid_etag）
+    """
+    if if_none_match:
+        # 存在 If-None-Match 时忽略 If-Modified-Since
+        if if_none_match.star_tag:
+            return '*'
+        for tag in if_none_match.as_set(include_weak=True):
+            if tag.startswith(file_uuid + '-'):
+                return tag
+        return None
+
+    if if_modified_since is not None:
+        return ''
+
+    return None
+
+
+def is_uuid_etag(etag) -> bool:
+    """
+    是否匹配到带 uuid 的 ETag（客户端缓存的就是这张图片），可以在查询数据库之前返回 304
+    If-None-Match: * 和 If-Modified-Since 不能说明图片存在，需要确认存在后再返回 304
+    """
+    return bool(etag) and etag != '*'
+
+
+def not_modified_response(etag: str = ''):
+    """返回 304 响应"""
+    response = make_response('', 304)
+    if etag and etag != '*':
+        response.set_etag(etag)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    response.vary.add('Accept')
+    return response
+
+
+def get_request_range(etag: str, stat_result):
+    """解析当前请求的 Range 请求头"""
+    return resolve_range(etag, stat_result, request.range, request.if_range)
+
+
+def resolve_range(etag: str, stat_result, range_header, if_range):
+    """
+    计算需要发送的区间
+    Returns:
+        (status, start, end)，start/end 为半开区间；区间无法满足时 status 为 416
+    """
+    file_size = stat_result.st_size
+    if range_header is None or range_header.units != 'bytes':
+        return 200, 0, file_size
+
+    # If-Range 与当前文件不一致时返回完整文件
+    if if_range.etag is not None and if_range.etag != etag:
+        return 200, 0, file_size
+    if if_range.date is not None and if_range.date.timestamp() < int(stat_result.st_mtime):
+        return 200, 0, file_size
+
+    # 多区间请求直接忽略，返回完整文件（RFC 9110 允许），避免 multipart 响应放大请求
+    if len(range_header.ranges) != 1:
+        return 200, 0, file_size
+
+    file_range = range_header.range_for_length(file_size)
+    if file_range is None:
+        return 416, 0, 0
+
+    return 206, file_range[0], file_range[1]
+
+
+def get_accepted_suffixes(accept_mimetypes=None):
+    """获取客户端在 Accept 中明确列出的现代格式后缀（按优先级排序），*/* 不算"""
+    if accept_mimetypes is None:
+        accept_mimetypes = request.accept_mimetypes
+    accepted = {value for value, quality in accept_mimetypes if quality > 0}
+    return [suffix for _, suffix, mimetype in MODERN_FORMATS if mimetype in accepted]
+
+
+def negotiate_sibling(directory: str, filename: str, accepted_suffixes: list = None):
+    """
+    根据 Accept 请求头选择 avif / webp 副本
+    只有明确列出该 MIME 类型的客户端才会收到副本，*/* 不算
+    Returns:
+        (文件名, 是否需要 Vary: Accept)
+    """
+    if os.path.splitext(filename)[1].lower() not in MODERN_SOURCE_SUFFIXES:
+        return filename, False
+
+    if accepted_suffixes is None:
+        accepted_suffixes = get_accepted_suffixes()
+    for suffix in accepted_suffixes:
+        if os.path.exists(os.path.join(directory, filename + suffix)):
+            return filename + suffix, True
+
+    return filename, True
+
+
+def send_immutable_file(directory: str, filename: str, file_uuid: str, vary_accept: bool = False):
+    """
+    发送内容不可变的图片文件，附带强 ETag 和长期缓存
+    支持单区间 Range 请求；发送完整文件且 WSGI 服务器提供 wsgi.file_wrapper 时（如 gunicorn）
+    由服务器调用 sendfile，文件内容不经过 Python 缓冲区
+    """
+    full_path = os.path.join(directory, filename)
+
+    # 交给前端代理发送，Range 和 sendfile 由代理处理
+    response = offload_response(full_path, IMMUTABLE_CACHE_CONTROL)
+    if response is not None:
+        if vary_accept:
+            response.vary.add('Accept')
+        return response
+
+    try:
+        file = open(full_path, 'rb')
+        stat_result = os.fstat(file.fileno())
+    except OSError:
+        abort(404)
+
+    etag = make_etag(file_uuid, stat_result)
+    status, start, end = get_request_range(etag, stat_result)
+    if status == 416:
+        file.close()
+        response = make_response('', 416)
+        response.headers['Content-Range'] = f"bytes */{stat_result.st_size}"
+        return response
+
+    length = end - start
+    # wsgi.file_wrapper 会发送到文件末尾（wsgiref、uWSGI 不按 Content-Length 截断），只用于完整文件
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    if file_wrapper is not None and status == 200:
+        body = file_wrapper(file, FILE_CHUNK_SIZE)
+    else:
+        body = FileRangeWrapper(file, start, length)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = Response(body, status=status, mimetype=mimetype, direct_passthrough=True)
+    response.content_length = length
+    response.accept_ranges = 'bytes'
+    if status == 206:
+        response.headers['Content-Range'] = f"bytes {start}-{end - 1}/{stat_result.st_size}"
+    response.set_etag(etag)
+    response.last_modified = datetime.fromtimestamp(int(stat_result.st_mtime), tz=timezone.utc)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    if vary_accept:
+        response.vary.add('Accept')
+    return response
@@ -0,0 +1,256 @@
+import hashlib
+import io
+import os
+import tarfile
+
+from PIL import Image, ImageOps
+
+from utils.basic.logging_utils import get_logger
+from utils.exif_utils import read_exif_from_bytes, read_exif_from_file, EMPTY_EXIF
+from utils.file_utils import generate_modern_siblings
+from utils.phash_utils import compute_dhash, to_signed
+from utils.placeholder_utils import compute_placeholder
+from utils.thumbnail_utils import generate_pyramid
+
+logger = get_logger(__name__)
+
+# 每次从上传流读取的大小
+INGEST_CHUNK_SIZE = 256 * 1024
+
+# 识别图片头最多读取的字节数（JPEG 的 EXIF 段可能较大）
+SNIFF_LIMIT = 1024 * 1024
+
+# TIFF / BigTIFF 文件头；libtiff 写入的压缩 TIFF 常把 IFD 放在文件末尾，需要接收完整文件后再识别
+TIFF_MAGICS = (b'II*\x00', b'MM\x00*', b'II+\x00', b'MM\x00+')
+
+# 批量上传时按 tar 流读取的请求类型
+TAR_MIMETYPES = {'application/x-tar', 'application/x-gtar', 'application/gzip', 'application/x-gzip'}
+
+# 允许上传的图片格式（PIL 识别结果）
+ALLOWED_FORMATS = {'JPEG', 'MPO', 'PNG', 'GIF', 'BMP', 'WEBP', 'ICO', 'TIFF', 'TGA'}
+
+# 默认最大像素数量: PIL 拒绝解码（DecompressionBombError）的阈值，即 MAX_IMAGE_PIXELS 的 2 倍（约 179 MP）
+DEFAULT_MAX_PIXELS = Image.MAX_IMAGE_PIXELS * 2
+INGEST_LIMITS = {
+    'max_pixels': DEFAULT_MAX_PIXELS
+}
+
+
+# 上传文件校验失败
+class IngestError(Exception):
+    """message 为前端提示的 i18n key"""
+
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.message = message
+
+
+def sniff_image(head: bytes):
+    """
+    只解析图片头，不解码像素
+    Returns:
+        (格式, 宽, 高)，数据不足或无法识别返回 None
+    """
+    try:
+        with Image.open(io.BytesIO(head)) as image:
+            return image.format, image.width, image.height
+    except Image.DecompressionBombError:
+        raise IngestError('upload.message.imageTooLarge')
+    except Exception:
+        return None
+
+
+def sniff_image_file(image_path: str):
+    """从已写入的完整文件识别图片头，用于 IFD 在文件末尾的 TIFF"""
+    try:
+        with Image.open(image_path) as image:
+            return image.format, image.width, image.height
+    except Image.DecompressionBombError:
+        raise IngestError('upload.message.imageTooLarge')
+    except Exception:
+        return None
+
+
+def set_max_pixels(max_pixels: int):
+    """
+    设置允许的最大像素数量，同时调整 PIL 的解码上限使两者一致
+    图片处理子进程中也需要调用（作为进程池的 initializer）
+    """
+    INGEST_LIMITS['max_pixels'] = max_pixels
+    Image.MAX_IMAGE_PIXELS = max_pixels // 2
+
+
+def init_ingest_limits(server_config: dict):
+    """读取最大像素数量配置"""
+    max_pixels = int(server_config.get('maxImagePixels', DEFAULT_MAX_PIXELS))
+    if max_pixels <= 0:
+        logger.warning(f"最大像素数量 {max_pixels} 无效，使用默认值")
+        max_pixels = DEFAULT_MAX_PIXELS
+    set_max_pixels(max_pixels)
+    logger.info(f"上传图片最大像素数量: {max_pixels}")
+
+
+def check_sniffed(info: tuple):
+    """校验图片格式和像素数量"""
+    image_format, width, height = info
+    if image_format not in ALLOWED_FORMATS:
+        raise IngestError('upload.message.fileExtensionNotAllowed')
+    if width * height > INGEST_LIMITS['max_pixels']:
+        raise IngestError('upload.message.imageTooLarge')
+
+
+# 需要旋转 90 度显示的 EXIF 方向，显示时宽高互换
+ROTATED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def get_dimension_values(width: int, height: int, orientation: int = None):
+    """
+    尺寸相关列的值，按 EXIF 方向换算为显示时的宽高
+    Args:
+        width, height: 文件中的像素尺寸
+        orientation: EXIF 方向，5-8 时宽高互换
+    Returns:
+        {'width', 'height', 'pixels', 'aspect_ratio'}，尺寸未知时都为 None
+    """
+    if not width or not height:
+        return {'width': None, 'height': None, 'pixels': None, 'aspect_ratio': None}
+    if orientation in ROTATED_ORIENTATIONS:
+        width, height = height, width
+    return {'width': width, 'height': height, 'pixels': width * height, 'aspect_ratio': round(width / height, 4)}
+
+
+def parse_pic_size(pic_size: str):
+    """
+    解析 pic_size（WxH）
+    Returns:
+        (宽, 高)，格式错误返回 (None, None)
+    """
+    try:
+        width, height = (int(value) for value in (pic_size or '').lower().split('x'))
+    except ValueError:
+        return None, None
+    return width, height
+
+
+def read_image_size(image_path: str):
+    """只解析文件头读取尺寸"""
+    with Image.open(image_path) as image:
+        return image.width, image.height
+
+
+def ingest_stream(stream, target_path: str):
+    """
+    单次读取上传流写入目标路径
+    先识别图片头，不合法时不再读取剩余数据；识别时顺便读取 EXIF，写入的同时计算大小和 SHA-256，最后原子重命名到目标路径
+    TIFF 在开头无法识别时（IFD 在文件末尾）继续接收，写完后从文件识别
+    Returns:
+        {'format', 'mime', 'width', 'height', 'file_size', 'sha256', 'exif'}
+    Raises:
+        IngestError: 不是允许的图片
+    """
+    temp_path = target_path + '.part'
+    digest = hashlib.sha256()
+    file_size = 0
+    head = b''
+    info = None
+    deferred = False
+    exif = EMPTY_EXIF
+
+    try:
+        with open(temp_path, 'wb') as target:
+            while True:
+                chunk = stream.read(INGEST_CHUNK_SIZE)
+                if not chunk:
+                    break
+
+                if info is None and not deferred:
+                    head += chunk
+                    info = sniff_image(head)
+                    if info is not None:
+                        check_sniffed(info)
+                        exif = read_exif_from_bytes(head)
+                        head = b''
+                    elif len(head) >= SNIFF_LIMIT:
+                        if not head.startswith(TIFF_MAGICS):
+                            raise IngestError('upload.message.invalidImage')
+                        deferred = True
+                        head = b''
+
+                digest.update(chunk)
+                file_size += len(chunk)
+                target.write(chunk)
+
+        if deferred:
+            info = sniff_image_file(temp_path)
+            if info is not None:
+                check_sniffed(info)
+                exif = read_exif_from_file(temp_path)
+
+        if info is None:
+            raise IngestError('upload.message.invalidImage')
+
+        os.replace(temp_path, target_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    image_format, width, height = info
+    return {
+        'format': image_format,
+        'mime': Image.MIME.get(image_format),
+        'width': width,
+        'height': height,
+        'file_size': file_size,
+        'sha256': digest.hexdigest(),
+        'exif': exif
+    }
+
+
+def generate_derivatives(image_path: str, thumbnail_path: str, size=(250, 250), pyramid: tuple = None):
+    """
+    解码一次原图，生成缩略图、多尺寸缩略图以及原图和缩略图的 avif / webp 副本
+    Args:
+        pyramid: get_pyramid_options() 的结果，为 None 时不生成多尺寸缩略图
+    Returns:
+        {'dhash': 感知哈希（有符号 64 位）, 'blurhash', 'dominant_color'}
+    """
+    with Image.open(image_path) as image:
+        image.load()
+        # 缩略图和副本都按 EXIF 方向旋转（手机竖拍照片），ICC 配置保留在 info 中
+        image = ImageOps.exif_transpose(image)
+
+        thumbnail = image.copy()
+        thumbnail.thumbnail(size)
+        thumbnail_format = Image.registered_extensions().get(os.path.splitext(thumbnail_path)[1].lower(), image.format)
+        temp_path = thumbnail_path + '.tmp'
+        thumbnail.save(temp_path, format=thumbnail_format)
+        os.replace(temp_path, thumbnail_path)
+        logger.info(thumbnail_path)
+
+        if pyramid is not None:
+            generate_pyramid(image, os.path.splitext(os.path.basename(thumbnail_path))[0], pyramid)
+
+        generate_modern_siblings(image_path, image=image)
+        generate_modern_siblings(thumbnail_path, image=thumbnail)
+
+        # 感知哈希和占位图都从缩略图计算
+        return {'dhash': to_signed(compute_dhash(thumbnail)), **compute_placeholder(thumbnail)}
+
+
+def iter_request_files(request):
+    """
+    读取批量上传的文件
+    请求体为 tar（可 gzip 压缩）时边接收边解包，否则读取 multipart 中的 files 字段
+    Returns:
+        (原始文件名, 文件流) 生成器
+    """
+    if request.mimetype in TAR_MIMETYPES:
+        with tarfile.open(fileobj=request.stream, mode='r|*') as archive:
+            for member in archive:
+                if member.isfile():
+                    yield os.path.basename(member.name), archive.extractfile(member)
+        return
+
+    for file in request.files.getlist('files'):
+        yield file.filename, file.stream
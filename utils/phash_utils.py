@@ -0,0 +1,37 @@
+from PIL import Image, ImageOps
+
+# dHash: 缩小到 9 x 8 灰度图，比较每行相邻像素得到 64 位
+DHASH_SIZE = 8
+
+
+def compute_dhash(image) -> int:
+    """计算图片的 64 位 dHash（无符号）"""
+    image = image.convert('L').resize((DHASH_SIZE + 1, DHASH_SIZE), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    pixels = image.load()
+
+    value = 0
+    for y in range(DHASH_SIZE):
+        for x in range(DHASH_SIZE):
+            value = (value << 1) | (1 if pixels[x, y] < pixels[x + 1, y] else 0)
+    return value
+
+
+def compute_dhash_from_file(image_path: str) -> int:
+    """从文件计算 dHash，JPEG 直接按小尺寸解码，按 EXIF 方向旋转后计算，与上传时一致"""
+    with Image.open(image_path) as image:
+        image.draft('L', (64, 64))
+        return compute_dhash(ImageOps.exif_transpose(image))
+
+
+def to_signed(value: int) -> int:
+    """无符号 64 位转换为数据库 BIGINT"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def to_unsigned(value: int) -> int:
+    """数据库 BIGINT 转换为无符号 64 位"""
+    return value + (1 << 64) if value < 0 else value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
@@ -0,0 +1,116 @@
+import math
+
+from PIL import Image, ImageOps
+
+# 计算占位图时先缩小到的最长边，BlurHash 只保留低频分量，更大的尺寸不会改变结果
+PLACEHOLDER_SIZE = 32
+
+# BlurHash 分量数（横 x 纵），长边方向多取一个
+BLURHASH_COMPONENTS = (4, 3)
+
+BASE83_CHARS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+# sRGB 0-255 转线性值的查表
+SRGB_TO_LINEAR = [v / 255 / 12.92 if v / 255 <= 0.04045 else ((v / 255 + 0.055) / 1.055) ** 2.4 for v in range(256)]
+
+
+def encode_base83(value: int, length: int):
+    return ''.join(BASE83_CHARS[(value // 83 ** (length - i)) % 83] for i in range(1, length + 1))
+
+
+def linear_to_srgb(value: float) -> int:
+    value = min(max(value, 0.0), 1.0)
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def sign_pow(value: float, exponent: float):
+    return math.copysign(abs(value) ** exponent, value)
+
+
+def prepare_placeholder_image(image):
+    """缩小到 PLACEHOLDER_SIZE 以内的 RGB 图片，透明部分按白色背景合成"""
+    image = image.copy()
+    image.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.Resampling.BILINEAR)
+    if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info:
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def encode_blurhash(image, components: tuple = None):
+    """
+    计算 BlurHash（https://blurha.sh 的编码算法）
+    Args:
+        image: prepare_placeholder_image() 的结果
+    Returns:
+        (BlurHash 字符串, 平均颜色 #rrggbb)
+    """
+    width, height = image.size
+    if components is None:
+        long_side, short_side = BLURHASH_COMPONENTS
+        components = (long_side, short_side) if width >= height else (short_side, long_side)
+    components_x, components_y = components
+
+    pixels = [(SRGB_TO_LINEAR[r], SRGB_TO_LINEAR[g], SRGB_TO_LINEAR[b]) for r, g, b in image.getdata()]
+    cos_x = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(components_x)]
+    cos_y = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(components_y)]
+
+    factors = []
+    for j in range(components_y):
+        for i in range(components_x):
+            normalisation = (1 if i == 0 and j == 0 else 2) / (width * height)
+            r = g = b = 0.0
+            index = 0
+            for y in range(height):
+                basis_y = cos_y[j][y]
+                for x in range(width):
+                    basis = cos_x[i][x] * basis_y
+                    pixel = pixels[index]
+                    r += basis * pixel[0]
+                    g += basis * pixel[1]
+                    b += basis * pixel[2]
+                    index += 1
+            factors.append((r * normalisation, g * normalisation, b * normalisation))
+
+    dc, ac = factors[0], factors[1:]
+    result = encode_base83((components_x - 1) + (components_y - 1) * 9, 1)
+
+    if ac:
+        actual_max = max(abs(value) for factor in ac for value in factor)
+        quantised_max = int(max(0, min(82, math.floor(actual_max * 166 - 0.5))))
+        maximum_value = (quantised_max + 1) / 166
+        result += encode_base83(quantised_max, 1)
+    else:
+        maximum_value = 1
+        result += encode_base83(0, 1)
+
+    average = tuple(linear_to_srgb(value) for value in dc)
+    result += encode_base83((average[0] << 16) + (average[1] << 8) + average[2], 4)
+
+    for factor in ac:
+        quantised = [int(max(0, min(18, math.floor(sign_pow(value / maximum_value, 0.5) * 9 + 9.5))))
+                     for value in factor]
+        result += encode_base83(quantised[0] * 19 * 19 + quantised[1] * 19 + quantised[2], 2)
+
+    return result, '#{:02x}{:02x}{:02x}'.format(*average)
+
+
+def compute_placeholder(image):
+    """
+    从已解码的图片（通常是缩略图）计算占位信息
+    Returns:
+        {'blurhash', 'dominant_color'}
+    """
+    blurhash, color = encode_blurhash(prepare_placeholder_image(image))
+    return {'blurhash': blurhash, 'dominant_color': color}
+
+
+def compute_placeholder_from_file(image_path: str):
+    """从文件计算占位信息，JPEG 直接按小尺寸解码，按 EXIF 方向旋转后编码，与上传时一致"""
+    with Image.open(image_path) as image:
+        image.draft('RGB', (PLACEHOLDER_SIZE * 2, PLACEHOLDER_SIZE * 2))
+        return compute_placeholder(ImageOps.exif_transpose(image))
@@ -5,6 +5,10 @@ from flask import send_file
 from sqlalchemy import inspect, text
 
 from manager.db_manager import get_session, db_manager
+from manager.pic_cache_manager import pic_path_cache
+from manager.thumbnail_cache_manager import thumbnail_cache
+from manager.image_worker_manager import image_worker
+from manager.phash_index_manager import phash_index
 from utils import ResponseFactory
 from utils.basic.logging_utils import get_logger
 from utils.file_utils import get_images_dir, get_app_dir
@@ -84,6 +88,10 @@ def import_sql(file):
             fix_all_sequences(db)
 
             db.commit()
+            pic_path_cache.clear()
+            thumbnail_cache.clear()
+            image_worker.clear()
+            phash_index.load()
             logger.info(f"导入数据库文件完成: {file.filename}")
             return ResponseFactory.success(data={
                 "message": "setting.fileManager.message.importSqlSuccess",
@@ -105,9 +113,14 @@ def delete_and_create_tables():
         db.execute(text("DROP TABLE IF EXISTS albums"))
         db.execute(text("DROP TABLE IF EXISTS tokens"))
         db.execute(text("DROP TABLE IF EXISTS configs"))
+        db.execute(text("DROP TABLE IF EXISTS image_jobs"))
         db.commit()
 
         db_manager.create_tables()
+        pic_path_cache.clear()
+        thumbnail_cache.clear()
+        image_worker.clear()
+        phash_index.clear()
 
 
 # 防止 SQL
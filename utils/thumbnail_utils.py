@@ -0,0 +1,159 @@
+import os
+
+from PIL import Image, ImageOps, features
+
+from utils.basic.logging_utils import get_logger
+from utils.file_utils import get_thumbnail_root, link_file, get_sharded_path, find_sharded_file
+
+logger = get_logger(__name__)
+
+# 多尺寸缩略图（按最长边），目录为 images/thumbnail/<尺寸>/<分片>/<uuid><后缀>
+PYRAMID_SIZES = (160, 320, 640, 1280)
+
+# 可选编码: 配置名 -> (PIL 格式, 文件后缀)
+PYRAMID_CODECS = {
+    'webp': ('WEBP', '.webp'),
+    'avif': ('AVIF', '.avif'),
+    'jpeg': ('JPEG', '.jpg'),
+}
+
+# 多尺寸缩略图配置，启动时从 config.yaml 读取一次
+THUMBNAIL_PYRAMID = {
+    'codec': 'webp',
+    'quality': 80
+}
+
+
+def init_thumbnail_pyramid(server_config: dict):
+    """读取多尺寸缩略图编码和质量，当前 Pillow 不支持的编码回退到 jpeg"""
+    codec = str(server_config.get('thumbnailCodec', 'webp')).lower()
+    if codec not in PYRAMID_CODECS or (codec != 'jpeg' and not features.check(codec)):
+        logger.error(f"不支持的缩略图编码 {codec}，使用 jpeg")
+        codec = 'jpeg'
+
+    THUMBNAIL_PYRAMID['codec'] = codec
+    THUMBNAIL_PYRAMID['quality'] = min(max(int(server_config.get('thumbnailQuality', 80)), 1), 100)
+    logger.info(f"多尺寸缩略图: {codec}，质量 {THUMBNAIL_PYRAMID['quality']}")
+
+
+def get_pyramid_dir():
+    return get_thumbnail_root()
+
+
+def get_pyramid_options():
+    """
+    传给图片处理进程的配置（子进程不会读取配置文件）
+    Returns:
+        (输出目录, 编码, 质量)
+    """
+    return get_pyramid_dir(), THUMBNAIL_PYRAMID['codec'], THUMBNAIL_PYRAMID['quality']
+
+
+def get_pyramid_sizes(width: int, height: int):
+    """需要生成的尺寸: 不超过原图最长边，原图比最小尺寸还小时只生成最小尺寸（不放大）"""
+    longest = max(width or 0, height or 0)
+    sizes = [size for size in PYRAMID_SIZES if size <= longest]
+    return sizes or [PYRAMID_SIZES[0]]
+
+
+def pyramid_filename(file_uuid: str, codec: str = None):
+    return file_uuid + PYRAMID_CODECS[codec or THUMBNAIL_PYRAMID['codec']][1]
+
+
+def get_srcset(file_uuid: str, pic_size: str):
+    """
+    根据图片尺寸（如 1920x1080）列出可用的缩略图尺寸
+    Returns:
+        [(尺寸, 文件名)]
+    """
+    try:
+        width, height = (int(value) for value in (pic_size or '').split('x'))
+    except ValueError:
+        width, height = 0, 0
+    filename = pyramid_filename(file_uuid)
+    return [(size, filename) for size in get_pyramid_sizes(width, height)]
+
+
+def generate_pyramid(image, file_uuid: str, options: tuple):
+    """
+    从已解码的图片生成所有尺寸，从大到小逐级缩小，每级只处理上一级的结果
+    Returns:
+        生成的文件路径列表
+    """
+    output_dir, codec, quality = options
+    pil_format, suffix = PYRAMID_CODECS[codec]
+
+    image = ImageOps.exif_transpose(image)
+    if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+    generated = []
+    for size in sorted(get_pyramid_sizes(image.width, image.height), reverse=True):
+        if max(image.size) > size:
+            image = image.copy()
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+
+        path = get_sharded_path(os.path.join(output_dir, str(size)), file_uuid + suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + '.tmp'
+        image.save(temp_path, format=pil_format, quality=quality)
+        os.replace(temp_path, path)
+        generated.append(path)
+
+    return generated
+
+
+def generate_pyramid_from_file(image_path: str, file_uuid: str, options: tuple):
+    """只生成多尺寸缩略图时，JPEG 按最大尺寸缩小解码"""
+    with Image.open(image_path) as image:
+        largest = PYRAMID_SIZES[-1]
+        image.draft('RGB', (largest, largest))
+        image.load()
+        return generate_pyramid(image, file_uuid, options)
+
+
+def find_pyramid_file(size: int, filename: str):
+    """
+    查找缩略图文件，编码配置修改过时查找其他编码生成的文件
+    Returns:
+        (目录, 文件名)，不存在返回 None
+    """
+    if size not in PYRAMID_SIZES:
+        return None
+
+    size_dir = os.path.join(get_pyramid_dir(), str(size))
+    file_uuid = os.path.splitext(filename)[0]
+    for name in [filename] + [file_uuid + suffix for _, suffix in PYRAMID_CODECS.values()]:
+        path = find_sharded_file(size_dir, name)
+        if os.path.exists(path):
+            return os.path.dirname(path), name
+    return None
+
+
+def remove_pyramid(file_uuid: str):
+    """删除所有尺寸和编码的缩略图（分片目录和旧的平铺目录）"""
+    output_dir = get_pyramid_dir()
+    for size in PYRAMID_SIZES:
+        size_dir = os.path.join(output_dir, str(size))
+        for _, suffix in PYRAMID_CODECS.values():
+            for path in (get_sharded_path(size_dir, file_uuid + suffix), os.path.join(size_dir, file_uuid + suffix)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def link_pyramid(source_uuid: str, target_uuid: str):
+    """相同内容的图片共用多尺寸缩略图"""
+    output_dir = get_pyramid_dir()
+    for size in PYRAMID_SIZES:
+        size_dir = os.path.join(output_dir, str(size))
+        for _, suffix in PYRAMID_CODECS.values():
+            source_path = find_sharded_file(size_dir, source_uuid + suffix)
+            if os.path.exists(source_path):
+                target_path = get_sharded_path(size_dir, target_uuid + suffix)
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                link_file(source_path, target_path)
@@ -1,10 +1,14 @@
 import os
+import shutil
 import zipfile
 
 from flask import send_file
 from werkzeug.utils import secure_filename
 
 import globals as g
+from manager.pic_cache_manager import pic_path_cache
+from manager.storage_manager import storage_manager
+from manager.thumbnail_cache_manager import thumbnail_cache
 from utils import ResponseFactory
 from utils.basic.logging_utils import get_logger
 from utils.file_utils import get_images_dir, get_app_dir
@@ -30,16 +34,26 @@ def generate_zip():
     files_to_zip = []
     for root, dirs, files in os.walk(IMAGE_DIR):
         for f in files:
-            files_to_zip.append(os.path.join(root, f))
-    total = len(files_to_zip)
+            files_to_zip.append(os.path.relpath(os.path.join(root, f), IMAGE_DIR).replace(os.sep, '/'))
+
+    # 使用远程存储时本地只有部分原图，其余从存储读取
+    remote_keys = []
+    if storage_manager.remote:
+        local_names = set(files_to_zip)
+        remote_keys = [key for key in storage_manager.backend.list() if key not in local_names]
+
+    total = len(files_to_zip) + len(remote_keys)
     if total == 0:
         g.zip_progress = 100
         return
 
     with zipfile.ZipFile(ZIP_PATH, "w", zipfile.ZIP_DEFLATED) as zf:
-        for idx, file_path in enumerate(files_to_zip, 1):
-            arcname = os.path.relpath(file_path, IMAGE_DIR)
-            zf.write(file_path, arcname=arcname)
+        for idx, arcname in enumerate(files_to_zip, 1):
+            zf.write(os.path.join(IMAGE_DIR, arcname), arcname=arcname)
+            g.zip_progress = int(idx / total * 100)
+        for idx, key in enumerate(remote_keys, len(files_to_zip) + 1):
+            with storage_manager.backend.open(key) as source, zf.open(key, 'w') as target:
+                shutil.copyfileobj(source, target)
             g.zip_progress = int(idx / total * 100)
 
 def download_zip():
@@ -74,9 +88,17 @@ def unzip(file):
             os.makedirs(os.path.dirname(target_path), exist_ok=True)
             with zip_ref.open(member) as source, open(target_path, "wb") as target:
                 target.write(source.read())
+            # 原图同时保存到远程存储
+            if not member_path.startswith("thumbnail/"):
+                storage_manager.store_original(os.path.dirname(member_path), os.path.basename(member_path),
+                                               target_path)
     # 删除
     os.remove(zip_path)
 
+    # 导入的图片可能之前被记为不存在
+    pic_path_cache.clear()
+    thumbnail_cache.clear()
+
     logger.info("图片导入成功")
     return ResponseFactory.success(data={
         "message": "setting.fileManager.message.importImagesSuccess",
@@ -0,0 +1,8 @@
+"""
+WSGI 入口
+    gunicorn -c gunicorn.conf.py wsgi:app
+gunicorn 提供 wsgi.file_wrapper，发送完整图片时由 sendfile 直接从文件发送
+"""
+from app import create_app
+
+app = create_app()